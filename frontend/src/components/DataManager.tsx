@@ -2,10 +2,18 @@ import { useState, useEffect } from 'react';
 import { Database, Trash2, RefreshCw, Loader2, CheckCircle2, XCircle, Plus } from 'lucide-react';
 import axios from 'axios';
 
+interface BackendStats {
+  total?: number | null;
+  by_event_type?: Record<string, number> | null;
+  relative_error?: number | null;
+  size_bytes?: number | null;
+  source?: string;
+  error?: string;
+}
+
 interface DataStats {
-  cassandra: number | string;
-  mongodb: number | string;
-  elasticsearch: number | string;
+  mode: 'counters' | 'estimate' | 'exact';
+  databases: Record<string, BackendStats>;
 }
 
 interface InsertResult {
@@ -19,6 +27,7 @@ interface InsertResult {
 
 export function DataManager() {
   const [stats, setStats] = useState<DataStats | null>(null);
+  const [statsMode, setStatsMode] = useState<DataStats['mode']>('counters');
   const [loading, setLoading] = useState(false);
   const [clearing, setClearing] = useState(false);
   const [generating, setGenerating] = useState(false);
@@ -26,11 +35,13 @@ export function DataManager() {
   const [numLogs, setNumLogs] = useState(10000);
   const [result, setResult] = useState<InsertResult | null>(null);
   const [error, setError] = useState<string | null>(null);
+  const [swapStatus, setSwapStatus] = useState<string | null>(null);
 
-  const fetchStats = async () => {
+  // Compteurs (rollups) par défaut : le comptage exact parcourt toutes les bases
+  const fetchStats = async (mode: DataStats['mode'] = statsMode) => {
     setLoading(true);
     try {
-      const response = await axios.get('/api/data/stats');
+      const response = await axios.get('/api/data/stats', { params: { mode } });
       setStats(response.data);
       setError(null);
     } catch (err) {
@@ -96,18 +107,74 @@ export function DataManager() {
     }
   };
 
+  // Nouvelle version chargée à côté de la version publiée : les lecteurs basculent à la fin
+  const replaceDataset = async () => {
+    setGenerating(true);
+    setError(null);
+    setResult(null);
+    try {
+      const { data: job } = await axios.post('/api/datasets', {
+        num_logs: numLogs,
+        num_users: Math.min(numLogs / 10, 5000),
+        num_products: 100
+      });
+      setSwapStatus(`Chargement de la version ${job.version}...`);
+      for (;;) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const { data: state } = await axios.get('/api/datasets');
+        const current = state.jobs.find((other: { version: string }) => other.version === job.version);
+        if (current && current.status !== 'loading') {
+          setSwapStatus(current.status === 'failed'
+            ? `Échec : ${current.error} (version publiée inchangée)`
+            : `Version ${job.version} publiée`);
+          break;
+        }
+      }
+      await fetchStats();
+    } catch (err) {
+      setError('Erreur lors du remplacement du jeu de données');
+      setSwapStatus(null);
+    } finally {
+      setGenerating(false);
+    }
+  };
+
   const formatNumber = (num: number | string) => {
     if (typeof num === 'string') return num;
     return num.toLocaleString('fr-FR');
   };
 
+  const formatSize = (bytes?: number | null) => {
+    if (bytes == null) return '—';
+    if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} Ko`;
+    return `${(bytes / 1024 / 1024).toFixed(1)} Mo`;
+  };
+
+  const renderStat = (db: string) => {
+    const info = stats?.databases?.[db];
+    if (loading) return <Loader2 size={20} className="spin" />;
+    if (info?.error) return 'erreur';
+    if (info?.total == null) return '—';
+    return `${stats?.mode === 'estimate' ? '≈ ' : ''}${formatNumber(info.total)}`;
+  };
+
+  const renderDetails = (db: string) => {
+    const info = stats?.databases?.[db];
+    if (!info || info.error) return info?.error ?? 'documents';
+    const types = Object.entries(info.by_event_type ?? {})
+      .sort(([, a], [, b]) => b - a)
+      .map(([type, count]) => `${type} ${formatNumber(count)}`)
+      .join(' · ');
+    return `documents · ${formatSize(info.size_bytes)}${types ? ` — ${types}` : ''}`;
+  };
+
   return (
     <div className="data-manager">
       <div className="data-header">
         <h2><Database size={24} /> Gestion des Données</h2>
         <button 
           className="btn btn-secondary" 
-          onClick={fetchStats} 
+          onClick={() => fetchStats()} 
           disabled={loading}
         >
           <RefreshCw size={16} className={loading ? 'spin' : ''} />
@@ -125,27 +192,39 @@ export function DataManager() {
       {/* Stats actuelles */}
       <div className="stats-section">
         <h3>📊 Données actuelles</h3>
+        <div className="presets">
+          {([['counters', 'Compteurs'], ['estimate', 'Estimation'], ['exact', 'Comptage exact']] as const).map(([mode, label]) => (
+            <button
+              key={mode}
+              className={`preset-btn ${statsMode === mode ? 'active' : ''}`}
+              onClick={() => { setStatsMode(mode); fetchStats(mode); }}
+              disabled={loading}
+            >
+              {label}
+            </button>
+          ))}
+        </div>
         <div className="stats-grid">
           <div className="stat-card cassandra">
             <div className="stat-db-name">Cassandra</div>
             <div className="stat-count">
-              {loading ? <Loader2 size={20} className="spin" /> : formatNumber(stats?.cassandra ?? 0)}
+              {renderStat('cassandra')}
             </div>
-            <div className="stat-label">documents</div>
+            <div className="stat-label">{renderDetails('cassandra')}</div>
           </div>
           <div className="stat-card mongodb">
             <div className="stat-db-name">MongoDB</div>
             <div className="stat-count">
-              {loading ? <Loader2 size={20} className="spin" /> : formatNumber(stats?.mongodb ?? 0)}
+              {renderStat('mongodb')}
             </div>
-            <div className="stat-label">documents</div>
+            <div className="stat-label">{renderDetails('mongodb')}</div>
           </div>
           <div className="stat-card elasticsearch">
             <div className="stat-db-name">Elasticsearch</div>
             <div className="stat-count">
-              {loading ? <Loader2 size={20} className="spin" /> : formatNumber(stats?.elasticsearch ?? 0)}
+              {renderStat('elasticsearch')}
             </div>
-            <div className="stat-label">documents</div>
+            <div className="stat-label">{renderDetails('elasticsearch')}</div>
           </div>
         </div>
       </div>
@@ -235,6 +314,15 @@ export function DataManager() {
               </>
             )}
           </button>
+          <button 
+            className="btn btn-secondary" 
+            onClick={replaceDataset}
+            disabled={generating || clearing}
+          >
+            <RefreshCw size={16} />
+            Remplacer par une nouvelle version
+          </button>
+          {swapStatus && <div className="progress-text">{swapStatus}</div>}
         </div>
       </div>
 
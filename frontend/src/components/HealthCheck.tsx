@@ -4,6 +4,15 @@ import { RefreshCw, CheckCircle, XCircle, Loader2 } from 'lucide-react'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000/api'
 
+interface BackendStats {
+  status: string
+  last_latency_ms: number | null
+  avg_latency_ms: number | null
+  p95_latency_ms: number | null
+  availability: number | null
+  last_checked: string | null
+}
+
 interface HealthStatus {
   api: string
   databases: {
@@ -11,19 +20,23 @@ interface HealthStatus {
     mongodb: string
     elasticsearch: string
   }
+  stats?: Record<string, BackendStats>
 }
 
+// /api/health répond depuis l'état de la sonde côté serveur : le polling est peu coûteux
+const POLL_INTERVAL_MS = 10000
+
 export function HealthCheck() {
   const [health, setHealth] = useState<HealthStatus | null>(null)
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
 
-  const checkHealth = async () => {
+  const checkHealth = async (deep = false) => {
     setLoading(true)
     setError(null)
     
     try {
-      const response = await axios.get(`${API_URL}/health`)
+      const response = await axios.get(`${API_URL}/health`, { params: deep ? { deep: 1 } : {} })
       setHealth(response.data)
     } catch (err) {
       setError(`Impossible de contacter l'API: ${err instanceof Error ? err.message : 'Erreur'}`)
@@ -35,8 +48,17 @@ export function HealthCheck() {
 
   useEffect(() => {
     checkHealth()
+    const timer = setInterval(() => checkHealth(), POLL_INTERVAL_MS)
+    return () => clearInterval(timer)
   }, [])
 
+  const getLatency = (db: string) => {
+    const stats = health?.stats?.[db]
+    if (!stats || stats.avg_latency_ms === null) return null
+    const availability = stats.availability !== null ? ` · ${Math.round(stats.availability * 100)}%` : ''
+    return `${stats.avg_latency_ms} ms (p95 ${stats.p95_latency_ms} ms)${availability}`
+  }
+
   const getStatusIcon = (status: string) => {
     if (status === 'ok') {
       return <CheckCircle className="status-icon success" size={24} />
@@ -54,7 +76,7 @@ export function HealthCheck() {
         <h2>État des Services</h2>
         <button 
           className="btn btn-secondary"
-          onClick={checkHealth}
+          onClick={() => checkHealth(true)}
           disabled={loading}
         >
           {loading ? <Loader2 className="spin" size={18} /> : <RefreshCw size={18} />}
@@ -95,6 +117,7 @@ export function HealthCheck() {
                 {health.databases.cassandra === 'ok' ? 'Connecté' : 'Déconnecté'}
               </p>
               <span className="health-url">localhost:9042</span>
+              {getLatency('cassandra') && <span className="health-url">{getLatency('cassandra')}</span>}
             </div>
           </div>
 
@@ -106,6 +129,7 @@ export function HealthCheck() {
                 {health.databases.mongodb === 'ok' ? 'Connecté' : 'Déconnecté'}
               </p>
               <span className="health-url">localhost:27017</span>
+              {getLatency('mongodb') && <span className="health-url">{getLatency('mongodb')}</span>}
             </div>
           </div>
 
@@ -117,6 +141,7 @@ export function HealthCheck() {
                 {health.databases.elasticsearch === 'ok' ? 'Connecté' : 'Déconnecté'}
               </p>
               <span className="health-url">localhost:9200</span>
+              {getLatency('elasticsearch') && <span className="health-url">{getLatency('elasticsearch')}</span>}
             </div>
           </div>
         </div>
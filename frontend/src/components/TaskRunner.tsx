@@ -1,5 +1,4 @@
 import { useState } from 'react'
-import axios from 'axios'
 import { 
   Play, 
   Search, 
@@ -29,16 +28,65 @@ interface TaskResult {
   databases: Record<string, DatabaseResult>
 }
 
+interface PhaseTimings {
+  connect_ms: number
+  query_ms: number
+  first_row_ms: number
+  fetch_ms: number
+  client_ms: number
+  serialize_ms: number
+  total_ms: number
+}
+
 interface DatabaseResult {
   status: string
   count?: number
   execution_time_ms?: number
+  timings?: PhaseTimings
   note?: string
   error?: string
   aggregations?: Record<string, AggregationResult>
   sample_data?: unknown[]
 }
 
+// Événements de POST /api/stream/<tâche>?format=ndjson (un objet JSON par ligne)
+type StreamEvent =
+  | { event: 'start'; tasks: Record<string, TaskResult & { backends: string[] }> }
+  | { event: 'leg'; task: string; backend: string; elapsed_ms: number; result: DatabaseResult }
+  | { event: 'summary'; total_ms: number; tasks: Record<string, StreamSummary> }
+
+interface StreamSummary {
+  order: string[]
+  fastest: string | null
+  first_ms: number | null
+  last_ms: number | null
+  errors: string[]
+}
+
+// Lit le flux ligne par ligne : chaque base s'affiche dès que sa branche est terminée
+const streamTasks = async (path: string, body: unknown, onEvent: (event: StreamEvent) => void) => {
+  const response = await fetch(`${API_URL}/stream/${path}?format=ndjson`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP ${response.status}`)
+  }
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    buffer += decoder.decode(value, { stream: !done })
+    const lines = buffer.split('\n')
+    buffer = done ? '' : lines.pop() ?? ''
+    // Lignes vides : battements de cœur
+    lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)))
+    if (done) break
+  }
+}
+
 interface AggregationResult {
   count: number
   avg_duration: number
@@ -52,7 +100,7 @@ const tasks = [
     name: 'Tâche 1 - Recherche Full-Text',
     description: 'Recherche ERROR_404 avec "critique" dans la description',
     icon: Search,
-    endpoint: '/task1',
+    endpoint: 'task1',
     defaultParams: {
       event_type: 'ERROR_404',
       search_text: 'critique',
@@ -65,7 +113,7 @@ const tasks = [
     name: 'Tâche 2 - Accès Ciblé',
     description: '100 derniers logs d\'un utilisateur',
     icon: User,
-    endpoint: '/task2',
+    endpoint: 'task2',
     defaultParams: {
       user_id: 10,
       limit: 100
@@ -76,7 +124,7 @@ const tasks = [
     name: 'Tâche 3 - Agrégation',
     description: 'Temps de session moyen par type d\'événement',
     icon: TrendingUp,
-    endpoint: '/task3',
+    endpoint: 'task3',
     defaultParams: {
       event_types: ['PURCHASE', 'ADD_TO_CART']
     }
@@ -88,13 +136,51 @@ export function TaskRunner() {
   const [results, setResults] = useState<Record<string, TaskResult>>({})
   const [error, setError] = useState<string | null>(null)
 
+  const [summaries, setSummaries] = useState<Record<string, StreamSummary & { total_ms: number }>>({})
+
+  const applyEvent = (event: StreamEvent) => {
+    if (event.event === 'start') {
+      // Bases attendues affichées en attente jusqu'à leur résultat
+      setResults(prev => {
+        const next = { ...prev }
+        Object.entries(event.tasks).forEach(([taskId, { backends, ...header }]) => {
+          next[taskId] = {
+            ...header,
+            databases: Object.fromEntries(backends.map(db => [db, { status: 'pending' }]))
+          }
+        })
+        return next
+      })
+      setSummaries(prev => {
+        const next = { ...prev }
+        Object.keys(event.tasks).forEach(taskId => delete next[taskId])
+        return next
+      })
+    } else if (event.event === 'leg') {
+      setResults(prev => ({
+        ...prev,
+        [event.task]: {
+          ...prev[event.task],
+          databases: { ...prev[event.task].databases, [event.backend]: event.result }
+        }
+      }))
+    } else {
+      setSummaries(prev => {
+        const next = { ...prev }
+        Object.entries(event.tasks).forEach(([taskId, summary]) => {
+          next[taskId] = { ...summary, total_ms: event.total_ms }
+        })
+        return next
+      })
+    }
+  }
+
   const runTask = async (taskId: string, endpoint: string, params: Record<string, unknown>) => {
     setLoading(taskId)
     setError(null)
     
     try {
-      const response = await axios.post(`${API_URL}${endpoint}`, params)
-      setResults(prev => ({ ...prev, [taskId]: response.data }))
+      await streamTasks(endpoint, params, applyEvent)
     } catch (err) {
       setError(`Erreur lors de l'exécution: ${err instanceof Error ? err.message : 'Erreur inconnue'}`)
     } finally {
@@ -107,12 +193,7 @@ export function TaskRunner() {
     setError(null)
     
     try {
-      const response = await axios.post(`${API_URL}/all-tasks`, {})
-      setResults({
-        task1: response.data.task1,
-        task2: response.data.task2,
-        task3: response.data.task3
-      })
+      await streamTasks('all', Object.fromEntries(tasks.map(task => [task.id, task.defaultParams])), applyEvent)
     } catch (err) {
       setError(`Erreur: ${err instanceof Error ? err.message : 'Erreur inconnue'}`)
     } finally {
@@ -124,7 +205,7 @@ export function TaskRunner() {
     const result = results[taskId]
     if (!result) return []
     
-    return Object.entries(result.databases).map(([db, data]) => ({
+    return Object.entries(result.databases).filter(([, data]) => data.status !== 'pending').map(([db, data]) => ({
       name: db.charAt(0).toUpperCase() + db.slice(1),
       count: data.count || 0,
       time: data.execution_time_ms || 0
@@ -203,7 +284,9 @@ export function TaskRunner() {
                   {Object.entries(results[task.id].databases).map(([db, data]) => (
                     <div key={db} className={`db-result ${data.status}`}>
                       <div className="db-header">
-                        {data.status === 'success' ? (
+                        {data.status === 'pending' ? (
+                          <Loader2 size={16} className="spin" />
+                        ) : data.status === 'success' ? (
                           <CheckCircle size={16} className="success" />
                         ) : (
                           <XCircle size={16} className="error" />
@@ -227,12 +310,23 @@ export function TaskRunner() {
                           )}
                         </div>
                       )}
+                      {data.timings && (
+                        <p className="db-note">
+                          connexion {data.timings.connect_ms} · requête {data.timings.query_ms} · 1ère ligne {data.timings.first_row_ms} · lecture {data.timings.fetch_ms} · client {data.timings.client_ms} · sérialisation {data.timings.serialize_ms} ms
+                        </p>
+                      )}
                       {data.note && <p className="db-note">{data.note}</p>}
                       {data.error && <p className="db-error">{data.error}</p>}
                     </div>
                   ))}
                 </div>
 
+                {summaries[task.id] && (
+                  <p className="db-note">
+                    Première réponse : {summaries[task.id].fastest ?? '—'} en {summaries[task.id].first_ms ?? '—'} ms · toutes les bases en {summaries[task.id].last_ms ?? '—'} ms · flux complet {summaries[task.id].total_ms} ms
+                  </p>
+                )}
+
                 {task.id !== 'task3' && getChartData(task.id).length > 0 && (
                   <div className="chart-container">
                     <h4>Comparaison des performances</h4>
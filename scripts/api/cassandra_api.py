@@ -3,19 +3,28 @@ API REST pour exposer Cassandra à n8n
 """
 
 from flask import Flask, request, jsonify
-from cassandra.cluster import Cluster
 import os
-import time
+import sys
+
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.common.timing import PhaseTimer
+from scripts.common.slowlog import SlowQueryLog
+from scripts.common.compression import enable_compression
+from scripts.common.connections import prepare, shutdown
+from scripts.backends import get_backend, run_leg
+from scripts.backends.cassandra_backend import row_to_dict
+from scripts.common.filters import parse
 
 app = Flask(__name__)
+enable_compression(app)  # gzip / brotli selon Accept-Encoding
 
-CASSANDRA_HOST = os.getenv('CASSANDRA_HOST', 'cassandra')
-CASSANDRA_PORT = int(os.getenv('CASSANDRA_PORT', 9042))
+slow_queries = SlowQueryLog("cassandra_api")
+cassandra = get_backend("cassandra")
 
-def get_session():
-    cluster = Cluster([CASSANDRA_HOST], port=CASSANDRA_PORT)
-    session = cluster.connect("nosql_tp")
-    return cluster, session
+# Appelé par scripts/api/gunicorn_conf.py à la sortie d'un worker
+app.extensions["nosql_tp"] = {"shutdown": shutdown}
 
 
 @app.route('/health', methods=['GET'])
@@ -36,16 +45,20 @@ def execute_query():
     if not query:
         return jsonify({"error": "Query required"}), 400
     
-    cluster, session = get_session()
+    # Keyspace de la version publiée du jeu de données (pointeur de version)
+    session = cassandra.session
     try:
-        start = time.time()
-        rows = list(session.execute(query))
-        exec_time = (time.time() - start) * 1000
+        timer = PhaseTimer()
+        with timer.phase("query"):
+            rows = list(session.execute(query))
+        exec_time = timer.execution_time_ms()
         
         # Convertir les rows en dictionnaires
-        results = []
-        for row in rows:
-            results.append(dict(row._asdict()))
+        with timer.phase("serialize"):
+            results = []
+            for row in rows:
+                results.append(row_to_dict(row))
+        slow_queries.record("cassandra", "query", query, None, len(results), timer.as_dict())
         
         return jsonify({
             "success": True,
@@ -55,8 +68,6 @@ def execute_query():
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cluster.shutdown()
 
 
 @app.route('/logs/search', methods=['POST'])
@@ -67,77 +78,56 @@ def search_logs():
         "event_type": "ERROR_404",
         "description_contains": "critique",
         "date_start": "2025-10-01",
-        "date_end": "2025-10-31"
+        "date_end": "2025-10-31",
+        "mode": "scan" | "index",
+        "filter": {"user_id": [1, 2], "session_duration_ms": {"gte": 30000}}
     }
+    "filter" : expression de filtre JSON (voir scripts/common/filters.py), combinée aux autres critères
     """
     data = request.json
-    event_type = data.get('event_type')
-    description_filter = data.get('description_contains', '').lower()
-    date_start = data.get('date_start')
-    date_end = data.get('date_end')
-    
-    cluster, session = get_session()
     try:
-        start = time.time()
-        
-        # Requête de base
-        query = "SELECT * FROM logs_by_user"
-        conditions = []
-        
-        if event_type:
-            conditions.append(f"event_type = '{event_type}'")
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions) + " ALLOW FILTERING"
-        
-        rows = list(session.execute(query))
-        
-        # Filtrage côté Python (Cassandra ne supporte pas LIKE/full-text)
-        filtered = []
-        for row in rows:
-            row_dict = dict(row._asdict())
-            
-            # Filtre sur description
-            if description_filter:
-                desc = row_dict.get('description', '').lower()
-                if description_filter not in desc:
-                    continue
-            
-            # Filtre sur date
-            if date_start and date_end:
-                timestamp = str(row_dict.get('timestamp', ''))
-                if not (date_start <= timestamp <= date_end):
-                    continue
-            
-            filtered.append(row_dict)
-        
-        exec_time = (time.time() - start) * 1000
-        
-        return jsonify({
-            "success": True,
-            "count": len(filtered),
-            "execution_time_ms": round(exec_time, 2),
-            "data": filtered
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cluster.shutdown()
+        parse(data.get('filter'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    params = {
+        "event_type": data.get('event_type'),
+        "search_text": data.get('description_contains'),
+        "date_start": data.get('date_start'),
+        "date_end": data.get('date_end'),
+        "mode": data.get('mode'),
+        "sample_size": None,
+        "where": data.get('filter')
+    }
+    
+    # "scan" : ALLOW FILTERING + filtrage côté Python ; "index" : LIKE servi par les index SASI
+    leg = run_leg(cassandra, "fulltext", params, slow_log=slow_queries)
+    if leg["status"] == "error":
+        return jsonify({"error": leg["error"]}), 500
+    
+    return jsonify({
+        "success": True,
+        "count": leg["count"],
+        "mode": leg["mode"],
+        "plan": leg["plan"],
+        "execution_time_ms": leg["execution_time_ms"],
+        "data": leg["sample_data"]
+    })
 
 
-@app.route('/logs/by-user/<user_id>', methods=['GET'])
+@app.route('/logs/by-user/<int:user_id>', methods=['GET'])
 def get_logs_by_user(user_id):
     """Récupère les logs d'un utilisateur spécifique"""
-    cluster, session = get_session()
+    session = cassandra.session
     try:
-        start = time.time()
-        rows = list(session.execute(
-            "SELECT * FROM logs_by_user WHERE user_id = %s",
-            [user_id]
-        ))
-        exec_time = (time.time() - start) * 1000
+        timer = PhaseTimer()
+        cql = "SELECT * FROM logs_by_user WHERE user_id = ?"
+        with timer.phase("query"):
+            rows = list(session.execute(prepare(cql, cassandra.keyspace), [user_id]))
+        exec_time = timer.execution_time_ms()
         
-        results = [dict(row._asdict()) for row in rows]
+        with timer.phase("serialize"):
+            results = [row_to_dict(row) for row in rows]
+        slow_queries.record("cassandra", "logs_by_user", cql, [user_id], len(results), timer.as_dict())
         
         return jsonify({
             "success": True,
@@ -147,8 +137,6 @@ def get_logs_by_user(user_id):
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cluster.shutdown()
 
 
 @app.route('/logs/by-date', methods=['POST'])
@@ -163,16 +151,17 @@ def get_logs_by_date():
     if not date:
         return jsonify({"error": "Date required"}), 400
     
-    cluster, session = get_session()
+    session = cassandra.session
     try:
-        start = time.time()
-        rows = list(session.execute(
-            "SELECT * FROM logs_by_date WHERE event_date = %s",
-            [date]
-        ))
-        exec_time = (time.time() - start) * 1000
+        timer = PhaseTimer()
+        cql = "SELECT * FROM logs_by_date WHERE event_date = ?"
+        with timer.phase("query"):
+            rows = list(session.execute(prepare(cql, cassandra.keyspace), [date]))
+        exec_time = timer.execution_time_ms()
         
-        results = [dict(row._asdict()) for row in rows]
+        with timer.phase("serialize"):
+            results = [row_to_dict(row) for row in rows]
+        slow_queries.record("cassandra", "logs_by_date", cql, [date], len(results), timer.as_dict())
         
         return jsonify({
             "success": True,
@@ -182,24 +171,20 @@ def get_logs_by_date():
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cluster.shutdown()
 
 
 @app.route('/tables', methods=['GET'])
 def list_tables():
     """Liste toutes les tables du keyspace"""
-    cluster, session = get_session()
+    session = cassandra.session
     try:
         rows = session.execute(
-            "SELECT table_name FROM system_schema.tables WHERE keyspace_name = 'nosql_tp'"
+            "SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s", [cassandra.keyspace]
         )
         tables = [row.table_name for row in rows]
         return jsonify({"tables": tables})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cluster.shutdown()
 
 
 @app.route('/logs/latest/<int:user_id>', methods=['GET'])
@@ -207,75 +192,66 @@ def get_latest_logs(user_id):
     """
     TÂCHE 2 : Récupère les 100 derniers logs d'un utilisateur
     Optimisé pour Cassandra (clé de partition + clustering)
+    ?mode=buckets : lecture des partitions mensuelles (logs_by_user_month)
     """
     limit = request.args.get('limit', 100, type=int)
     
-    cluster, session = get_session()
-    try:
-        start = time.time()
-        rows = list(session.execute(
-            f"SELECT * FROM logs_by_user WHERE user_id = {user_id} LIMIT {limit}"
-        ))
-        exec_time = (time.time() - start) * 1000
-        
-        results = [dict(row._asdict()) for row in rows]
-        
-        return jsonify({
-            "success": True,
-            "count": len(results),
-            "execution_time_ms": round(exec_time, 2),
-            "data": results
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cluster.shutdown()
+    params = {"user_id": user_id, "limit": limit, "mode": request.args.get('mode'), "sample_size": None}
+    leg = run_leg(cassandra, "latest_for_user", params, slow_log=slow_queries)
+    if leg["status"] == "error":
+        return jsonify({"error": leg["error"]}), 500
+    
+    return jsonify({
+        "success": True,
+        "count": leg["count"],
+        "mode": leg["mode"],
+        "plan": leg["plan"],
+        "execution_time_ms": leg["execution_time_ms"],
+        "data": leg["sample_data"]
+    })
 
 
 @app.route('/logs/aggregate', methods=['POST'])
 def aggregate_logs():
     """
     TÂCHE 3 : Agrégation - calcul de moyenne par event_type
-    Body: {"event_types": ["PURCHASE", "ADD_TO_CART"], "field": "session_duration_ms"}
+    Body: {"event_types": ["PURCHASE", "ADD_TO_CART"], "field": "session_duration_ms", "mode": "scan" | "index"}
     """
     data = request.json
     event_types = data.get('event_types', [])
-    field = data.get('field', 'session_duration_ms')
+    params = {"event_types": event_types, "field": data.get('field', 'session_duration_ms'), "mode": data.get('mode')}
     
-    cluster, session = get_session()
-    try:
-        start = time.time()
-        results = {}
-        
-        for event_type in event_types:
-            rows = list(session.execute(
-                f"SELECT {field} FROM logs_by_user WHERE event_type = '{event_type}' ALLOW FILTERING"
-            ))
-            
-            if rows:
-                values = [getattr(r, field) for r in rows if getattr(r, field) is not None]
-                avg_value = sum(values) / len(values) if values else 0
-                results[event_type] = {
-                    "count": len(rows),
-                    "average": round(avg_value, 2),
-                    "sum": sum(values),
-                    "min": min(values) if values else 0,
-                    "max": max(values) if values else 0
-                }
-            else:
-                results[event_type] = {"count": 0, "average": 0}
-        
-        exec_time = (time.time() - start) * 1000
-        
-        return jsonify({
-            "success": True,
-            "execution_time_ms": round(exec_time, 2),
-            "aggregations": results
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cluster.shutdown()
+    leg = run_leg(cassandra, "aggregate", params, slow_log=slow_queries)
+    if leg["status"] == "error":
+        return jsonify({"error": leg["error"]}), 500
+    
+    results = {}
+    for event_type in event_types:
+        agg = leg["aggregations"].get(event_type)
+        if agg:
+            results[event_type] = {
+                "count": agg["count"],
+                "average": agg["avg_duration"],
+                "sum": agg["sum_duration"],
+                "min": agg["min_duration"],
+                "max": agg["max_duration"]
+            }
+        else:
+            results[event_type] = {"count": 0, "average": 0}
+    
+    return jsonify({
+        "success": True,
+        "mode": leg["mode"],
+        "execution_time_ms": leg["execution_time_ms"],
+        "aggregations": results
+    })
+
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def debug_slow_queries():
+    """Dernières requêtes lentes enregistrées (buffer circulaire en mémoire)"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(slow_queries.describe(limit))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+"""
+Configuration gunicorn : service de production des APIs Flask
+
+    gunicorn -c scripts/api/gunicorn_conf.py scripts.api.main_api:app
+    GUNICORN_BIND=0.0.0.0:5000 gunicorn -c scripts/api/gunicorn_conf.py scripts.api.cassandra_api:app
+
+WEB_WORKERS processus, chacun avec WEB_THREADS threads (worker gthread : les
+drivers sont bloquants et thread-safe). Les clients Cassandra / MongoDB /
+Elasticsearch sont créés dans chaque worker, après le fork : avec
+GUNICORN_PRELOAD=1 l'application est importée une fois dans le maître et les
+clients éventuellement hérités sont abandonnés (post_fork).
+
+État partagé entre workers : journal de réplication, état des versions
+(DATASET_STATE_FILE) et journal du moteur colonnaire (COLUMNAR_SHARED_DIR).
+Files d'ingestion, sonde de santé, statistiques du routeur et requêtes lentes
+restent propres à chaque worker (réponses marquées "scope": "worker").
+
+Arrêt (SIGTERM) : le worker cesse d'accepter, termine les requêtes en cours
+pendant au plus GUNICORN_GRACEFUL_TIMEOUT secondes, puis écrit les événements
+encore en file d'ingestion et ferme ses connexions (worker_exit).
+"""
+
+import multiprocessing
+import os
+import sys
+
+# Rendre le package `scripts` importable quel que soit le répertoire de lancement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.common import connections
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5050')
+workers = int(os.getenv('WEB_WORKERS', min(4, multiprocessing.cpu_count() * 2 + 1)))
+worker_class = "gthread"
+threads = int(os.getenv('WEB_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))  # Tâches longues (approx, rollups sur gros volumes)
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+accesslog = "-"
+errorlog = "-"
+
+
+def _hook(worker, name):
+    # Fonctions enregistrées par l'application dans app.extensions["nosql_tp"]
+    return getattr(getattr(worker, "wsgi", None), "extensions", {}).get("nosql_tp", {}).get(name)
+
+
+def post_fork(server, worker):
+    connections.reset_after_fork()
+
+
+def post_worker_init(worker):
+    start = _hook(worker, "start")
+    if start:
+        start()
+
+
+def worker_exit(server, worker):
+    shutdown = _hook(worker, "shutdown")
+    if shutdown:
+        shutdown()
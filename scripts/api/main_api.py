@@ -3,41 +3,142 @@ API REST unifiée pour le TP NoSQL
 Expose Cassandra, MongoDB et Elasticsearch via une API REST unique
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from cassandra.cluster import Cluster
-from pymongo import MongoClient, DESCENDING
-from elasticsearch import Elasticsearch
 import os
+import random
+import sys
 import time
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.backends import BACKENDS, STATS_MODES, get_backend, run_leg
+from scripts.backends.base import check_numeric_field
+from scripts.common.slowlog import SlowQueryLog
+from scripts.common.compression import enable_compression
+from scripts.common.health import HealthProber
+from scripts.common.rollup import RollupRefresher
+from scripts.common.changelog import REPLICATION_PRIMARY, Changelog, Propagator, write_primary
+from scripts.common.ingest import ACK_MODES, INGEST_ACK_TIMEOUT_S, IngestPipeline, QueueFull, normalize_event
+from scripts.common.datasets import DatasetManager, LoadInProgress
+from scripts.common.streaming import STREAM_FORMATS, stream_legs
+from scripts.common.groupby import group_spec
+from scripts.common.filters import parse
+from scripts.common.loader import forget_checkpoints
+from scripts.common.routing import Router
+from scripts.common import connections
 
 app = Flask(__name__)
 CORS(app)  # Permet les requêtes cross-origin depuis React
+enable_compression(app)  # gzip / brotli selon Accept-Encoding
 
-# Configuration
-CASSANDRA_HOST = os.getenv('CASSANDRA_HOST', 'cassandra')
-CASSANDRA_PORT = int(os.getenv('CASSANDRA_PORT', 9042))
-MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
-MONGO_PORT = int(os.getenv('MONGO_PORT', 27017))
-ES_HOST = os.getenv('ES_HOST', 'elasticsearch')
-ES_PORT = int(os.getenv('ES_PORT', 9200))
+slow_queries = SlowQueryLog("main_api")
 
+prober = HealthProber({name: backend.ping for name, backend in BACKENDS.items()})
+
+# Recalcul des rollups horaires (Tâche 3, source=rollup) après les chargements
+rollups = RollupRefresher(BACKENDS)
+
+# write_mode "all" : chaque base est écrite à la suite ; "primary" : seule REPLICATION_PRIMARY est
+# écrite, les autres rattrapent depuis le journal (propagation asynchrone ; upsert_logs tient les
+# rollups à jour avec les seuls logs nouveaux, sans recalcul)
+WRITE_MODES = ("all", "primary")
+WRITE_MODE = os.getenv('WRITE_MODE', 'all')
+changelog = Changelog()
+propagator = Propagator(
+    changelog,
+    {name: backend for name, backend in BACKENDS.items() if name != REPLICATION_PRIMARY}
+)
+
+
+def write_events_primary(logs):
+    """Ingestion en write_mode=primary : primaire + journal, les autres bases rattrapent"""
+    write_primary(BACKENDS[REPLICATION_PRIMARY], changelog, logs)
+    propagator.start()
+
+
+# Ingestion temps réel : un writer par base, ou la primaire seule (+ journal) en write_mode=primary
+if WRITE_MODE == "primary":
+    ingest = IngestPipeline({REPLICATION_PRIMARY: write_events_primary})
+else:
+    ingest = IngestPipeline({name: backend.write_events for name, backend in BACKENDS.items()})
+
+# Ordre d'exécution des bases pour chaque tâche
+TASK1_BACKENDS = ("elasticsearch", "mongodb", "cassandra", "columnar")
+TASK2_BACKENDS = ("cassandra", "mongodb", "elasticsearch", "columnar")
+TASK3_BACKENDS = ("mongodb", "elasticsearch", "cassandra", "columnar")
+# Tâche 3 : source demandée -> opération des adapters
+TASK3_SOURCES = {"raw": "aggregate", "rollup": "aggregate_rollup", "approx": "aggregate_approx"}
+AGGREGATE_BACKENDS = ("mongodb", "elasticsearch", "cassandra", "columnar")
+# Tâche 2 par lot : nombre maximal d'utilisateurs par appel
+TIMELINE_BATCH_MAX_USERS = int(os.getenv('TIMELINE_BATCH_MAX_USERS', 1000))
+
+
+# /api/query : une seule base par requête, choisie d'après les latences observées
+router = Router()
+
+def dataset_published(version):
+    # Le journal de réplication et les checkpoints de chargement décrivent la version remplacée
+    changelog.reset()
+    forget_checkpoints(BACKENDS)
+
+
+datasets = DatasetManager(BACKENDS, on_published=dataset_published)
+
+
+def start_background():
+    """Threads de fond du processus : à lancer dans chaque worker, après le fork"""
+    prober.ensure_started()
+    # Suppressions de versions restées en attente (redémarrage)
+    datasets.start()
+    if changelog.end:
+        # Reprise après redémarrage : les bases secondaires repartent de leur checkpoint
+        propagator.start()
+
+
+def shutdown(timeout=INGEST_ACK_TIMEOUT_S):
+    """Arrêt propre : écrit les événements encore en file puis ferme les connexions"""
+    drained = ingest.drain(timeout)
+    propagator.stop()
+    connections.shutdown()
+    return drained
+
+
+# Appelés par scripts/api/gunicorn_conf.py (post_worker_init / worker_exit)
+app.extensions["nosql_tp"] = {"start": start_background, "shutdown": shutdown}
+
+
+@app.before_request
+def start_background_prober():
+    prober.ensure_started()
+
+
+def worker_scope(stats):
+    """Statistiques propres au worker gunicorn qui répond (sonde, routeur, files d'ingestion, requêtes lentes)"""
+    return dict(stats, scope="worker", pid=os.getpid())
 
-# ============================================================================
-# CONNEXIONS
-# ============================================================================
 
-def get_cassandra_session():
-    cluster = Cluster([CASSANDRA_HOST], port=CASSANDRA_PORT)
-    session = cluster.connect("nosql_tp")
-    return cluster, session
+def task_legs(backend_names, operation, params, data):
+    """[(base, branche)] : une branche exécute l'opération sur une base quand on l'appelle"""
+    explain = bool(data.get('explain', False))
+    trace = bool(data.get('trace', False))
+    # Stratégie propre à une base, ex. {"cassandra": "index", "mongodb": "text"}
+    modes = data.get('modes') or {}
+    return [
+        (name, partial(run_leg, get_backend(name), operation,
+                       dict(params, mode=modes[name]) if name in modes else params,
+                       explain=explain, trace=trace, slow_log=slow_queries))
+        for name in backend_names
+    ]
 
-def get_mongo_collection():
-    client = MongoClient(f"mongodb://{MONGO_HOST}:{MONGO_PORT}/")
-    return client, client["nosql_tp"]["logs_ecommerce"]
 
-def get_elasticsearch():
-    return Elasticsearch(hosts=[{'host': ES_HOST, 'port': ES_PORT, 'scheme': 'http'}])
+def run_task(backend_names, operation, params, data):
+    """Exécute une opération sur chaque base (l'une après l'autre) et regroupe les résultats par base"""
+    return {name: leg() for name, leg in task_legs(backend_names, operation, params, data)}
 
 
 # ============================================================================
@@ -46,487 +147,436 @@ def get_elasticsearch():
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    """Vérification de santé de l'API"""
-    status = {"api": "ok", "databases": {}}
-    
-    # Test Cassandra
-    try:
-        cluster, session = get_cassandra_session()
-        session.execute("SELECT now() FROM system.local")
-        status["databases"]["cassandra"] = "ok"
-        cluster.shutdown()
-    except Exception as e:
-        status["databases"]["cassandra"] = f"error: {str(e)}"
-    
-    # Test MongoDB
-    try:
-        client, _ = get_mongo_collection()
-        client.admin.command('ping')
-        status["databases"]["mongodb"] = "ok"
-        client.close()
-    except Exception as e:
-        status["databases"]["mongodb"] = f"error: {str(e)}"
-    
-    # Test Elasticsearch
-    try:
-        es = get_elasticsearch()
-        es.cluster.health()
-        status["databases"]["elasticsearch"] = "ok"
-    except Exception as e:
-        status["databases"]["elasticsearch"] = f"error: {str(e)}"
-    
-    return jsonify(status)
+    """
+    Vérification de santé de l'API
+    Répond depuis l'état de la sonde en arrière-plan ; ?deep=1 force une vérification immédiate
+    """
+    if request.args.get('deep') in ('1', 'true'):
+        prober.probe_all()
+    elif not prober.wait_first_round(timeout=0):
+        # Premier appel : attendre le premier passage de la sonde
+        prober.wait_first_round(timeout=15)
+
+    status = {"api": "ok"}
+    status.update(prober.snapshot())
+    return jsonify(worker_scope(status))
 
 
 # ============================================================================
 # TÂCHE 1 : Recherche Full-Text
 # ============================================================================
 
+def task1_request(data):
+    """En-tête de la réponse et branches de la Tâche 1"""
+    params = {
+        "event_type": data.get('event_type', 'ERROR_404'),
+        "search_text": data.get('search_text', 'critique'),
+        "date_start": data.get('date_start', '2025-10-01'),
+        "date_end": data.get('date_end', '2025-10-31')
+    }
+    header = {
+        "task": "Tâche 1 - Recherche Full-Text",
+        "params": {
+            "event_type": params["event_type"],
+            "search_text": params["search_text"],
+            "date_range": f"{params['date_start']} - {params['date_end']}"
+        }
+    }
+    if data.get('filter'):
+        # Validée ici : une expression invalide donne un 400 plutôt qu'une erreur par base
+        header["params"]["filter"] = parse(data['filter']).describe()
+        params["where"] = data['filter']
+    return header, task_legs(TASK1_BACKENDS, "fulltext", params, data)
+
+
 @app.route('/api/task1', methods=['POST'])
 def task1_fulltext_search():
     """
     Tâche 1 : Recherche Full-Text
     Trouver les événements ERROR_404 d'octobre 2025 avec "critique" dans la description
+    "filter" (optionnel) : expression de filtre JSON combinée aux critères ci-dessus, par exemple
+    {"user_id": [1, 2], "session_duration_ms": {"gte": 30000}} ; chaque base renvoie son plan
+    (prédicats poussés dans la requête, résiduels évalués côté client)
     """
-    data = request.json or {}
-    event_type = data.get('event_type', 'ERROR_404')
-    search_text = data.get('search_text', 'critique')
-    date_start = data.get('date_start', '2025-10-01')
-    date_end = data.get('date_end', '2025-10-31')
-    
-    results = {
-        "task": "Tâche 1 - Recherche Full-Text",
-        "params": {
-            "event_type": event_type,
-            "search_text": search_text,
-            "date_range": f"{date_start} - {date_end}"
-        },
-        "databases": {}
-    }
-    
-    # ============ ELASTICSEARCH ============
-    try:
-        es = get_elasticsearch()
-        query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {"match": {"description": search_text}},
-                        {"range": {"timestamp": {"gte": date_start, "lte": date_end}}}
-                    ],
-                    "filter": [{"term": {"event_type.keyword": event_type}}]
-                }
-            },
-            "track_total_hits": True
-        }
-        start = time.time()
-        result = es.search(index="ecommerce_logs", body=query, size=100)
-        exec_time = (time.time() - start) * 1000
-        
-        results["databases"]["elasticsearch"] = {
-            "count": result['hits']['total']['value'],
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "sample_data": [hit['_source'] for hit in result['hits']['hits'][:5]]
-        }
-    except Exception as e:
-        results["databases"]["elasticsearch"] = {"status": "error", "error": str(e)}
-    
-    # ============ MONGODB ============
     try:
-        client, collection = get_mongo_collection()
-        start = time.time()
-        mongo_results = list(collection.find({
-            "event_type": event_type,
-            "timestamp": {"$gte": date_start, "$lte": date_end},
-            "description": {"$regex": search_text, "$options": "i"}
-        }))
-        exec_time = (time.time() - start) * 1000
-        
-        # Convertir ObjectId en string
-        for doc in mongo_results:
-            doc['_id'] = str(doc['_id'])
-        
-        results["databases"]["mongodb"] = {
-            "count": len(mongo_results),
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "sample_data": mongo_results[:5]
-        }
-        client.close()
-    except Exception as e:
-        results["databases"]["mongodb"] = {"status": "error", "error": str(e)}
-    
-    # ============ CASSANDRA ============
-    try:
-        cluster, session = get_cassandra_session()
-        start = time.time()
-        # Scan complet car Cassandra n'est pas optimisé pour ce type de requête
-        rows = list(session.execute("SELECT * FROM logs_by_user"))
-        # Filtrage côté Python (dates + event_type + texte)
-        from datetime import datetime
-        date_start_dt = datetime.fromisoformat(date_start)
-        date_end_dt = datetime.fromisoformat(date_end + "T23:59:59")
-        
-        filtered = [
-            r for r in rows 
-            if r.event_type == event_type 
-            and date_start_dt <= r.timestamp <= date_end_dt
-            and search_text.lower() in r.description.lower()
-        ]
-        exec_time = (time.time() - start) * 1000
-        
-        results["databases"]["cassandra"] = {
-            "count": len(filtered),
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "note": "Scan complet + filtrage côté client",
-            "sample_data": [dict(r._asdict()) for r in filtered[:5]]
-        }
-        cluster.shutdown()
-    except Exception as e:
-        results["databases"]["cassandra"] = {"status": "error", "error": str(e)}
-    
-    return jsonify(results)
+        header, legs = task1_request(request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(header, databases={name: leg() for name, leg in legs}))
 
 
 # ============================================================================
 # TÂCHE 2 : Accès Ciblé et Tri
 # ============================================================================
 
+def task2_request(data):
+    """En-tête de la réponse et branches de la Tâche 2"""
+    params = {
+        "user_id": data.get('user_id', 10),
+        "limit": data.get('limit', 100)
+    }
+    header = {"task": "Tâche 2 - Accès Ciblé et Tri", "params": params}
+    return header, task_legs(TASK2_BACKENDS, "latest_for_user", params, data)
+
+
 @app.route('/api/task2', methods=['POST'])
 def task2_user_logs():
     """
     Tâche 2 : Accès Ciblé et Tri
     Récupérer les 100 derniers logs d'un utilisateur
     """
-    data = request.json or {}
-    user_id = data.get('user_id', 10)
-    limit = data.get('limit', 100)
-    
-    results = {
-        "task": "Tâche 2 - Accès Ciblé et Tri",
-        "params": {"user_id": user_id, "limit": limit},
-        "databases": {}
-    }
-    
-    # ============ CASSANDRA ============
-    try:
-        cluster, session = get_cassandra_session()
-        start = time.time()
-        rows = list(session.execute(
-            f"SELECT * FROM logs_by_user WHERE user_id = {user_id} LIMIT {limit}"
-        ))
-        exec_time = (time.time() - start) * 1000
-        
-        results["databases"]["cassandra"] = {
-            "count": len(rows),
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "note": "Optimisé: clé de partition + clustering",
-            "sample_data": [dict(r._asdict()) for r in rows[:5]]
-        }
-        cluster.shutdown()
-    except Exception as e:
-        results["databases"]["cassandra"] = {"status": "error", "error": str(e)}
-    
-    # ============ MONGODB ============
+    header, legs = task2_request(request.json or {})
+    return jsonify(dict(header, databases={name: leg() for name, leg in legs}))
+
+
+def with_throughput(leg, users):
+    """Branche complétée par son débit en utilisateurs par seconde"""
+    def run():
+        result = leg()
+        if result["status"] == "success" and result["execution_time_ms"]:
+            result["users_per_sec"] = round(users / result["execution_time_ms"] * 1000, 1)
+        return result
+    return run
+
+
+def task2_batch_request(data):
+    """En-tête de la réponse et branches de la Tâche 2 par lot ; ValueError si la liste est invalide"""
     try:
-        client, collection = get_mongo_collection()
-        start = time.time()
-        mongo_results = list(
-            collection.find({"user_id": user_id})
-            .sort("timestamp", DESCENDING)
-            .limit(limit)
-        )
-        exec_time = (time.time() - start) * 1000
-        
-        for doc in mongo_results:
-            doc['_id'] = str(doc['_id'])
-        
-        results["databases"]["mongodb"] = {
-            "count": len(mongo_results),
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "note": "Avec index composé recommandé",
-            "sample_data": mongo_results[:5]
-        }
-        client.close()
-    except Exception as e:
-        results["databases"]["mongodb"] = {"status": "error", "error": str(e)}
-    
-    # ============ ELASTICSEARCH ============
+        # Doublons retirés, ordre de la demande conservé
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in data.get('user_ids', range(1, 101))))
+        limit = int(data.get('limit', 100))
+    except (TypeError, ValueError):
+        raise ValueError("user_ids doit être une liste d'entiers et limit un entier")
+    if not user_ids or len(user_ids) > TIMELINE_BATCH_MAX_USERS:
+        raise ValueError(f"user_ids : entre 1 et {TIMELINE_BATCH_MAX_USERS} utilisateurs")
+    if limit < 1:
+        raise ValueError("limit doit être positif")
+    params = {"user_ids": user_ids, "limit": limit, "sample_size": data.get('sample_size', 5)}
+    header = {
+        "task": "Tâche 2 - Accès Ciblé par lot",
+        "params": {"users": len(user_ids), "limit": limit, "sample_size": params["sample_size"]}
+    }
+    # Pas de stratégie par base pour le lot
+    data = {key: value for key, value in data.items() if key != 'modes'}
+    legs = task_legs(TASK2_BACKENDS, "latest_for_users", params, data)
+    return header, [(name, with_throughput(leg, len(user_ids))) for name, leg in legs]
+
+
+@app.route('/api/task2/batch', methods=['POST'])
+def task2_batch():
+    """
+    Tâche 2 par lot : les N derniers logs de chaque utilisateur d'une liste, en une passe par base
+    Body: {"user_ids": [1, 2, ...], "limit": 100, "sample_size": 5} (sample_size null : tous les logs)
+    Chaque base renvoie counts (logs par utilisateur), sample_data par utilisateur et users_per_sec
+    """
     try:
-        es = get_elasticsearch()
-        query = {
-            "query": {"term": {"user_id": user_id}},
-            "sort": [{"timestamp": {"order": "desc"}}],
-            "size": limit
-        }
-        start = time.time()
-        result = es.search(index="ecommerce_logs", body=query)
-        exec_time = (time.time() - start) * 1000
-        
-        results["databases"]["elasticsearch"] = {
-            "count": len(result['hits']['hits']),
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "sample_data": [hit['_source'] for hit in result['hits']['hits'][:5]]
-        }
-    except Exception as e:
-        results["databases"]["elasticsearch"] = {"status": "error", "error": str(e)}
-    
-    return jsonify(results)
+        header, legs = task2_batch_request(request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(header, databases={name: leg() for name, leg in legs}))
 
 
 # ============================================================================
 # TÂCHE 3 : Agrégation
 # ============================================================================
 
+def task3_request(data):
+    """En-tête de la réponse et branches de la Tâche 3 ; ValueError si la source est inconnue"""
+    params = {
+        "event_types": data.get('event_types', ['PURCHASE', 'ADD_TO_CART']),
+        "date_start": data.get('date_start'),
+        "date_end": data.get('date_end')
+    }
+    source = data.get('source', 'raw')
+    if source not in TASK3_SOURCES:
+        raise ValueError(f"source inconnue : {source} (attendu : {', '.join(TASK3_SOURCES)})")
+    if source != "raw":
+        # Les modes par base ne concernent que l'agrégation sur les logs
+        data = {key: value for key, value in data.items() if key != 'modes'}
+    header = {"task": "Tâche 3 - Agrégation", "params": params, "source": source}
+    return header, task_legs(TASK3_BACKENDS, TASK3_SOURCES[source], params, data)
+
+
 @app.route('/api/task3', methods=['POST'])
 def task3_aggregation():
     """
     Tâche 3 : Agrégation
     Calculer le temps de session moyen par type d'événement
+    source=raw (défaut) : agrégation sur les logs ; source=rollup : rollups horaires ;
+    source=approx : percentiles p50/p95/p99 et utilisateurs distincts (sketches, bornes d'erreur)
     """
-    data = request.json or {}
-    event_types = data.get('event_types', ['PURCHASE', 'ADD_TO_CART'])
-    
-    results = {
-        "task": "Tâche 3 - Agrégation",
-        "params": {"event_types": event_types},
-        "databases": {}
-    }
-    
-    # ============ MONGODB ============
     try:
-        client, collection = get_mongo_collection()
-        pipeline = [
-            {"$match": {"event_type": {"$in": event_types}}},
-            {"$group": {
-                "_id": "$event_type",
-                "avg_duration": {"$avg": "$session_duration_ms"},
-                "count": {"$sum": 1},
-                "min_duration": {"$min": "$session_duration_ms"},
-                "max_duration": {"$max": "$session_duration_ms"}
-            }}
-        ]
-        start = time.time()
-        mongo_results = list(collection.aggregate(pipeline))
-        exec_time = (time.time() - start) * 1000
-        
-        aggregations = {}
-        for r in mongo_results:
-            aggregations[r['_id']] = {
-                "count": r['count'],
-                "avg_duration": round(r['avg_duration'], 2),
-                "min_duration": r['min_duration'],
-                "max_duration": r['max_duration']
-            }
-        
-        results["databases"]["mongodb"] = {
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "aggregations": aggregations
-        }
-        client.close()
-    except Exception as e:
-        results["databases"]["mongodb"] = {"status": "error", "error": str(e)}
-    
-    # ============ ELASTICSEARCH ============
+        header, legs = task3_request(request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(header, databases={name: leg() for name, leg in legs}))
+
+
+# ============================================================================
+# AGRÉGATION GÉNÉRIQUE
+# ============================================================================
+
+def aggregate_request(data):
+    """En-tête de la réponse et branches de l'agrégation générique ; ValueError si la demande est invalide"""
     try:
-        es = get_elasticsearch()
-        query = {
-            "size": 0,
-            "query": {"terms": {"event_type.keyword": event_types}},
-            "aggs": {
-                "by_event_type": {
-                    "terms": {"field": "event_type.keyword"},
-                    "aggs": {
-                        "avg_duration": {"avg": {"field": "session_duration_ms"}},
-                        "min_duration": {"min": {"field": "session_duration_ms"}},
-                        "max_duration": {"max": {"field": "session_duration_ms"}}
-                    }
-                }
-            }
-        }
-        start = time.time()
-        result = es.search(index="ecommerce_logs", body=query)
-        exec_time = (time.time() - start) * 1000
-        
-        aggregations = {}
-        for bucket in result['aggregations']['by_event_type']['buckets']:
-            aggregations[bucket['key']] = {
-                "count": bucket['doc_count'],
-                "avg_duration": round(bucket['avg_duration']['value'], 2),
-                "min_duration": bucket['min_duration']['value'],
-                "max_duration": bucket['max_duration']['value']
-            }
-        
-        results["databases"]["elasticsearch"] = {
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "aggregations": aggregations
-        }
-    except Exception as e:
-        results["databases"]["elasticsearch"] = {"status": "error", "error": str(e)}
-    
-    # ============ CASSANDRA ============
+        spec = group_spec(data.get('group_by', 'event_type'), data.get('metrics'), data.get('filter'),
+                          data.get('limit', 1000))
+    except TypeError:
+        raise ValueError("group_by, metrics : listes ; filter : objet ; limit : entier")
+    params = dict(spec, field=check_numeric_field(data.get('field', 'session_duration_ms')))
+    header = {"task": "Agrégation générique", "params": params}
+    # Pas de stratégie par base : chaque adapter choisit le chemin le plus proche des données
+    data = {key: value for key, value in data.items() if key != 'modes'}
+    return header, task_legs(AGGREGATE_BACKENDS, "group_by", params, data)
+
+
+@app.route('/api/aggregate', methods=['POST'])
+def aggregate():
+    """
+    Agrégation générique, poussée dans chaque base
+    Body: {
+        "group_by": ["event_type", "day"],          # event_type, product_id, user_id, hour, day
+        "metrics": ["count", "avg", "max"],         # count, sum, avg, min, max
+        "field": "session_duration_ms",
+        "filter": {"event_type": ["PURCHASE"], "user_id": 10, "date_start": "2025-10-01", "date_end": "2025-10-07"},
+        "limit": 1000
+    }
+    Chaque base renvoie groups ([{"key": {...}, métriques}], triés par clé), truncated et source
+    """
     try:
-        cluster, session = get_cassandra_session()
-        start = time.time()
-        aggregations = {}
-        
-        for event_type in event_types:
-            rows = list(session.execute(
-                f"SELECT session_duration_ms FROM logs_by_user WHERE event_type = '{event_type}' ALLOW FILTERING"
-            ))
-            if rows:
-                durations = [r.session_duration_ms for r in rows if r.session_duration_ms]
-                aggregations[event_type] = {
-                    "count": len(rows),
-                    "avg_duration": round(sum(durations) / len(durations), 2) if durations else 0,
-                    "min_duration": min(durations) if durations else 0,
-                    "max_duration": max(durations) if durations else 0
-                }
-        
-        exec_time = (time.time() - start) * 1000
-        
-        results["databases"]["cassandra"] = {
-            "execution_time_ms": round(exec_time, 2),
-            "status": "success",
-            "note": "Scan complet + agrégation côté client",
-            "aggregations": aggregations
-        }
-        cluster.shutdown()
-    except Exception as e:
-        results["databases"]["cassandra"] = {"status": "error", "error": str(e)}
-    
-    return jsonify(results)
+        header, legs = aggregate_request(request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(header, databases={name: leg() for name, leg in legs}))
 
 
 # ============================================================================
 # EXÉCUTER TOUTES LES TÂCHES
 # ============================================================================
 
+TASK_REQUESTS = {"task1": task1_request, "task2": task2_request, "task3": task3_request,
+                 "task2-batch": task2_batch_request, "aggregate": aggregate_request}
+# Tâches de /api/all-tasks et /api/stream/all
+STREAM_ALL = ("task1", "task2", "task3")
+
+
 @app.route('/api/all-tasks', methods=['POST'])
 def all_tasks():
-    """Exécute les 3 tâches et retourne tous les résultats"""
+    """Exécute les 3 tâches et retourne tous les résultats (400 si les paramètres d'une tâche sont invalides)"""
+    data = request.json or {}
+    try:
+        # Toutes les tâches validées avant d'en lancer une
+        tasks = {name: TASK_REQUESTS[name](data) for name in STREAM_ALL}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({
-        "task1": task1_fulltext_search().get_json(),
-        "task2": task2_user_logs().get_json(),
-        "task3": task3_aggregation().get_json()
+        name: dict(header, databases={backend: leg() for backend, leg in legs})
+        for name, (header, legs) in tasks.items()
     })
 
 
+@app.route('/api/stream/<task>', methods=['POST'])
+def stream_task(task):
+    """
+    Résultats diffusés au fil de l'eau (task1, task2, task3, task2-batch, aggregate ou all), branches en parallèle
+    ?format=sse (défaut) ou ndjson ; événements start, leg (un par base), summary
+    Pour "all", le corps peut contenir les paramètres de chaque tâche : {"task1": {...}, ...}
+    """
+    names = list(STREAM_ALL) if task == "all" else [task]
+    if any(name not in TASK_REQUESTS for name in names):
+        return jsonify({"error": f"tâche inconnue : {task} (attendu : {', '.join(TASK_REQUESTS)}, all)"}), 404
+    fmt = request.args.get('format', 'sse')
+    if fmt not in STREAM_FORMATS:
+        return jsonify({"error": f"format inconnu : {fmt} (attendu : {', '.join(STREAM_FORMATS)})"}), 400
+    data = request.json or {}
+    try:
+        tasks = {name: TASK_REQUESTS[name](data.get(name) or {} if task == "all" else data) for name in names}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(
+        stream_with_context(stream_legs(tasks, fmt, dumps=app.json.dumps)),
+        mimetype=STREAM_FORMATS[fmt],
+        # Pas de mise en tampon par nginx (frontend) ni par un cache intermédiaire
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ============================================================================
-# GESTION DES DONNÉES
+# REQUÊTE ROUTÉE
 # ============================================================================
 
-@app.route('/api/data/stats', methods=['GET'])
-def get_data_stats():
-    """Retourne le nombre de documents dans chaque base"""
-    stats = {}
-    
-    # Cassandra
+# Forme de requête -> tâche (paramètres, bases candidates et ordre par défaut)
+QUERY_SHAPES = {"fulltext": "task1", "timeline": "task2", "timelines": "task2-batch",
+                "aggregate": "task3", "group_by": "aggregate"}
+
+
+@app.route('/api/query', methods=['POST'])
+def routed_query():
+    """
+    Une seule réponse, depuis la base la plus rapide pour cette forme de requête
+    Body: {"shape": "fulltext", "timeout_ms": 2000, ...paramètres de la tâche correspondante}
+    Formes : fulltext (Tâche 1), timeline (Tâche 2), timelines (Tâche 2 par lot),
+    aggregate (Tâche 3), group_by (agrégation générique)
+    Bascule sur la base suivante en cas d'erreur ou de délai dépassé ; 503 si aucune ne répond
+    """
+    data = request.json or {}
+    shape = data.get('shape')
+    if shape not in QUERY_SHAPES:
+        return jsonify({"error": f"shape inconnue : {shape} (attendu : {', '.join(QUERY_SHAPES)})"}), 400
     try:
-        cluster, session = get_cassandra_session()
-        rows = list(session.execute("SELECT COUNT(*) as count FROM logs_by_user"))
-        stats["cassandra"] = rows[0].count if rows else 0
-        cluster.shutdown()
-    except Exception as e:
-        stats["cassandra"] = f"error: {str(e)}"
-    
-    # MongoDB
+        header, legs = TASK_REQUESTS[QUERY_SHAPES[shape]](data)
+        timeout_ms = data.get('timeout_ms')
+        timeout_s = float(timeout_ms) / 1000 if timeout_ms is not None else None
+        if timeout_s is not None and timeout_s <= 0:
+            raise ValueError("timeout_ms doit être positif")
+        # Latences distinctes par source de la Tâche 3 (logs, rollups, sketches)
+        key = f"{shape}:{header['source']}" if header.get('source', 'raw') != 'raw' else shape
+        result, routing = router.execute(key, legs, timeout_s)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    response = dict(header, shape=shape, backend=routing["backend"], routing=routing, result=result)
+    return jsonify(response), 200 if result else 503
+
+
+@app.route('/api/query/metrics', methods=['GET'])
+def routing_metrics():
+    """Latences par forme et par base (EWMA, percentiles), décisions de routage et bascules (ce worker)"""
+    return jsonify(worker_scope(router.snapshot()))
+
+
+# ============================================================================
+# DEBUG
+# ============================================================================
+
+@app.route('/api/debug/slow-queries', methods=['GET'])
+def debug_slow_queries():
+    """Dernières requêtes lentes enregistrées (buffer circulaire en mémoire de ce worker)"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(slow_queries.describe(limit))
+
+
+@app.route('/api/replication', methods=['GET', 'POST'])
+def replication_status():
+    """
+    Retard de propagation des bases secondaires (write_mode=primary)
+    POST {"replay": "<base>", "from_offset": 0} : relit le journal pour une base secondaire
+    """
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            propagator.replay(data.get('replay'), data.get('from_offset', 0))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        propagator.start()
+        return jsonify(dict(propagator.status(), primary=REPLICATION_PRIMARY)), 202
+    return jsonify(dict(propagator.status(), primary=REPLICATION_PRIMARY))
+
+
+@app.route('/api/rollups', methods=['GET', 'POST'])
+def rollups_status():
+    """État du recalcul des rollups ; POST lance un recalcul en arrière-plan"""
+    if request.method == 'POST':
+        rollups.schedule()
+        return jsonify(rollups.status()), 202
+    return jsonify(rollups.status())
+
+
+# ============================================================================
+# GESTION DES DONNÉES
+# ============================================================================
+
+@app.route('/api/events', methods=['POST'])
+def ingest_events():
+    """
+    Ingestion temps réel : un événement ou une liste d'événements
+    ?ack=queued (défaut, 202) ou ?ack=written (201 une fois écrits dans toutes les bases)
+    429 + Retry-After si les writers ont trop de retard
+    """
+    ack = request.args.get('ack', 'queued')
+    if ack not in ACK_MODES:
+        return jsonify({"error": f"ack inconnu : {ack} (attendu : {', '.join(ACK_MODES)})"}), 400
+    payload = request.get_json(silent=True)
+    events = payload if isinstance(payload, list) else [payload]
     try:
-        client, collection = get_mongo_collection()
-        stats["mongodb"] = collection.count_documents({})
-        client.close()
-    except Exception as e:
-        stats["mongodb"] = f"error: {str(e)}"
-    
-    # Elasticsearch
+        events = [normalize_event(event) for event in events]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
-        es = get_elasticsearch()
-        if es.indices.exists(index="ecommerce_logs"):
-            result = es.count(index="ecommerce_logs")
-            stats["elasticsearch"] = result['count']
-        else:
-            stats["elasticsearch"] = 0
-    except Exception as e:
-        stats["elasticsearch"] = f"error: {str(e)}"
-    
-    return jsonify(stats)
+        tickets = ingest.submit(events)
+    except QueueFull as e:
+        response = jsonify({"error": str(e), "queues": ingest.stats()})
+        response.headers["Retry-After"] = "1"
+        return response, 429
+
+    result = {"accepted": len(events), "ack": ack, "log_ids": [event["log_id"] for event in events]}
+    if ack == "queued":
+        return jsonify(result), 202
+    result["databases"] = ingest.wait(tickets)
+    states = set(result["databases"].values())
+    # 502 : une base a abandonné le lot après INGEST_RETRIES essais ; 504 : pas encore écrit
+    status = 502 if "failed" in states else 504 if "timeout" in states else 201
+    return jsonify(result), status
+
+
+@app.route('/api/events/metrics', methods=['GET'])
+def ingest_metrics():
+    """Profondeur des files et débit des writers d'ingestion (ce worker)"""
+    return jsonify(worker_scope({"writers": ingest.stats()}))
+
+
+@app.route('/api/data/stats', methods=['GET'])
+def get_data_stats():
+    """
+    Volume de chaque base, par type d'événement, et taille sur disque
+
+    ?mode=counters (défaut) : compteurs maintenus à l'écriture (rollups horaires), temps constant
+    ?mode=estimate          : métadonnées (size_estimates, estimated_document_count, _cat/count)
+    ?mode=exact             : parcours complet de chaque base (lent sur de gros volumes)
+    """
+    mode = request.args.get('mode', 'counters')
+    if mode not in STATS_MODES:
+        return jsonify({"error": f"mode inconnu : {mode} (attendu : {', '.join(STATS_MODES)})"}), 400
+    databases = {}
+    for name, backend in BACKENDS.items():
+        start = time.perf_counter()
+        try:
+            databases[name] = backend.stats(mode)
+        except Exception as e:
+            databases[name] = {"error": str(e)}
+        databases[name]["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return jsonify({"mode": mode, "databases": databases})
 
 
 @app.route('/api/data/clear', methods=['POST'])
 def clear_all_data():
     """Vide toutes les bases de données"""
     results = {}
-    
-    # Cassandra
-    try:
-        cluster, session = get_cassandra_session()
-        session.execute("TRUNCATE logs_by_user")
-        results["cassandra"] = "cleared"
-        cluster.shutdown()
-    except Exception as e:
-        results["cassandra"] = f"error: {str(e)}"
-    
-    # MongoDB
-    try:
-        client, collection = get_mongo_collection()
-        collection.delete_many({})
-        results["mongodb"] = "cleared"
-        client.close()
-    except Exception as e:
-        results["mongodb"] = f"error: {str(e)}"
-    
-    # Elasticsearch
-    try:
-        es = get_elasticsearch()
-        if es.indices.exists(index="ecommerce_logs"):
-            es.indices.delete(index="ecommerce_logs")
-        results["elasticsearch"] = "cleared"
-    except Exception as e:
-        results["elasticsearch"] = f"error: {str(e)}"
-    
+    for name, backend in BACKENDS.items():
+        try:
+            backend.clear()
+            results[name] = "cleared"
+        except Exception as e:
+            results[name] = f"error: {str(e)}"
+    # Les logs encore dans le journal ne doivent pas réapparaître après le vidage
+    changelog.reset()
+    # Bases vides : make data-insert doit tout recharger, pas sauter les lots déjà vus
+    forget_checkpoints(BACKENDS)
     return jsonify({"status": "success", "results": results})
 
 
-@app.route('/api/data/generate', methods=['POST'])
-def generate_and_insert_data():
-    """Génère et insère des données dans toutes les bases"""
-    import uuid
-    import random
-    from datetime import datetime, timedelta
-    from cassandra.query import BatchStatement
-    from elasticsearch import helpers
-    
-    data = request.json or {}
-    num_logs = data.get('num_logs', 10000)
-    num_users = data.get('num_users', 1000)
-    num_products = data.get('num_products', 100)
-    
-    # Limiter pour éviter les abus
-    num_logs = min(num_logs, 500000)
-    
-    results = {
-        "requested": num_logs,
-        "databases": {}
-    }
-    
-    # ============ GÉNÉRATION DES DONNÉES ============
+def generate_logs(num_logs, num_users, num_products):
+    """Logs e-commerce aléatoires (même distribution que scripts/data/generate_data.py)"""
     logs = []
     events = ["VIEW_PRODUCT", "ADD_TO_CART", "PURCHASE", "ERROR_404", "LOGOUT", "SEARCH"]
     products = [f"PROD_{i:03d}" for i in range(1, num_products + 1)]
     users = list(range(1, num_users + 1))
     start_time = datetime(2025, 10, 1, 0, 0, 0)
-    
+
     for _ in range(num_logs):
         event_type = random.choice(events)
         log_time = start_time + timedelta(seconds=random.randint(1, 3600*24*30))
-        
+
         log = {
             "log_id": str(uuid.uuid4()),
             "timestamp": log_time.isoformat(),
@@ -536,84 +586,92 @@ def generate_and_insert_data():
             "session_duration_ms": random.randint(100, 60000),
             "description": f"Event {event_type} processed.",
         }
-        
+
         if event_type == "ERROR_404":
             log["description"] = "Page introuvable. Erreur critique."
         elif event_type == "PURCHASE":
             log["description"] = f"Transaction finale réussie pour produit {log['product_id']}."
-            
+
         logs.append(log)
-    
-    # ============ INSERTION CASSANDRA ============
-    try:
-        cluster, session = get_cassandra_session()
-        
-        prepared_stmt = session.prepare(
-            "INSERT INTO logs_by_user (user_id, timestamp, log_id, event_type, product_id, description, session_duration_ms) VALUES (?, ?, ?, ?, ?, ?, ?)"
-        )
-        
-        batch = BatchStatement()
-        batch_size = 100
-        inserted = 0
-        
-        for i, log in enumerate(logs):
-            ts = datetime.fromisoformat(log["timestamp"])
-            batch.add(prepared_stmt, (
-                log["user_id"],
-                ts,
-                uuid.UUID(log["log_id"]),
-                log["event_type"],
-                log.get("product_id"),
-                log["description"],
-                log["session_duration_ms"]
-            ))
-            
-            if (i + 1) % batch_size == 0:
-                session.execute(batch)
-                batch = BatchStatement()
-                inserted += batch_size
-        
-        # Insérer le reste
-        if len(logs) % batch_size != 0:
-            session.execute(batch)
-            inserted += len(logs) % batch_size
-        
-        results["databases"]["cassandra"] = {"status": "success", "inserted": inserted}
-        cluster.shutdown()
-    except Exception as e:
-        results["databases"]["cassandra"] = {"status": "error", "error": str(e)}
-    
-    # ============ INSERTION ELASTICSEARCH ============
-    # Faire AVANT MongoDB car insert_many modifie les objets en ajoutant _id
-    try:
-        es = get_elasticsearch()
-        
-        # Créer l'index s'il n'existe pas
-        if not es.indices.exists(index="ecommerce_logs"):
-            es.indices.create(index="ecommerce_logs")
-        
-        actions = [
-            {"_index": "ecommerce_logs", "_id": log["log_id"], "_source": log}
-            for log in logs
-        ]
-        
-        success, _ = helpers.bulk(es, actions)
-        results["databases"]["elasticsearch"] = {"status": "success", "inserted": success}
-    except Exception as e:
-        results["databases"]["elasticsearch"] = {"status": "error", "error": str(e)}
-    
-    # ============ INSERTION MONGODB ============
-    # Faire APRÈS Elasticsearch car insert_many ajoute _id aux objets
-    try:
-        client, collection = get_mongo_collection()
-        collection.insert_many(logs)
-        results["databases"]["mongodb"] = {"status": "success", "inserted": len(logs)}
-        client.close()
-    except Exception as e:
-        results["databases"]["mongodb"] = {"status": "error", "error": str(e)}
-    
+    return logs
+
+
+@app.route('/api/data/generate', methods=['POST'])
+def generate_and_insert_data():
+    """Génère et insère des données dans toutes les bases"""
+    data = request.json or {}
+    num_logs = data.get('num_logs', 10000)
+    num_users = data.get('num_users', 1000)
+    num_products = data.get('num_products', 100)
+
+    # Limiter pour éviter les abus
+    num_logs = min(num_logs, 500000)
+    write_mode = data.get('write_mode', WRITE_MODE)
+    if write_mode not in WRITE_MODES:
+        return jsonify({"error": f"write_mode inconnu : {write_mode} (attendu : {', '.join(WRITE_MODES)})"}), 400
+
+    results = {
+        "requested": num_logs,
+        "databases": {}
+    }
+
+    logs = generate_logs(num_logs, num_users, num_products)
+
+    # ============ INSERTION ============
+    if write_mode == "primary":
+        primary = BACKENDS[REPLICATION_PRIMARY]
+        try:
+            primary.setup()
+            inserted, offsets = write_primary(primary, changelog, logs)
+            results["databases"][REPLICATION_PRIMARY] = {"status": "success", "inserted": inserted}
+        except Exception as e:
+            results["databases"][REPLICATION_PRIMARY] = {"status": "error", "error": str(e)}
+            return jsonify(results)
+        # Les rollups des bases secondaires suivent la propagation (upsert_logs)
+        propagator.start()
+        results["replication"] = dict(propagator.status(), primary=REPLICATION_PRIMARY, offsets=offsets)
+        return jsonify(results)
+
+    for name, backend in BACKENDS.items():
+        try:
+            backend.setup()
+            inserted = backend.bulk_write(logs)
+            results["databases"][name] = {"status": "success", "inserted": inserted}
+        except Exception as e:
+            results["databases"][name] = {"status": "error", "error": str(e)}
+
+    # Les rollups sont maintenus à l'insertion ; le recalcul complet corrige toute dérive
+    rollups.schedule()
     return jsonify(results)
 
 
+@app.route('/api/datasets', methods=['GET', 'POST'])
+def dataset_versions():
+    """
+    Versions du jeu de données (remplacement sans interruption, voir scripts/common/datasets.py)
+
+    GET  : version publiée de chaque base, chargements récents, versions en attente de suppression
+    POST : {"num_logs", "num_users", "num_products"} charge une nouvelle version à côté de la
+           version publiée ; les lecteurs basculent quand toutes les bases sont chargées (202)
+    """
+    if request.method == 'GET':
+        return jsonify(datasets.status())
+    data = request.json or {}
+    num_logs = min(data.get('num_logs', 10000), 500000)
+    num_users = data.get('num_users', 1000)
+    num_products = data.get('num_products', 100)
+    try:
+        job = datasets.load(lambda: generate_logs(num_logs, num_users, num_products),
+                            description=f"{num_logs} logs générés")
+    except LoadInProgress as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(job), 202
+
+
 if __name__ == '__main__':
+    # Développement (serveur Flask, un processus) ; en production : gunicorn -c scripts/api/gunicorn_conf.py
+    # Le reloader relance ce script dans un processus enfant (WERKZEUG_RUN_MAIN) : seul l'enfant
+    # sert les requêtes, les threads de fond ne sont lancés que là
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background()
     app.run(host='0.0.0.0', port=5050, debug=True)
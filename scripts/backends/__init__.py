@@ -0,0 +1,26 @@
+"""
+Registre des adapters de stockage
+
+Ajouter un moteur au benchmark = implémenter `Backend` et l'enregistrer ici.
+"""
+
+from scripts.backends.base import STATS_MODES, Backend, LegContext, run_leg
+from scripts.backends.cassandra_backend import CassandraBackend
+from scripts.backends.mongo_backend import MongoBackend
+from scripts.backends.elasticsearch_backend import ElasticsearchBackend
+from scripts.backends.columnar_backend import ColumnarBackend
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (CassandraBackend(), MongoBackend(), ElasticsearchBackend(), ColumnarBackend())
+}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Backend inconnu : {name}")
+
+
+__all__ = ["Backend", "LegContext", "run_leg", "BACKENDS", "STATS_MODES", "get_backend"]
@@ -0,0 +1,243 @@
+"""
+Interface commune des moteurs de stockage (adapters)
+
+Chaque base implémente une seule fois les opérations du TP :
+- fulltext         : recherche texte + filtres (Tâche 1)
+- latest_for_user  : N derniers logs d'un utilisateur (Tâche 2)
+- latest_for_users : N derniers logs de chaque utilisateur d'une liste, en une passe (Tâche 2 par lot)
+- aggregate        : agrégation par type d'événement (Tâche 3)
+- aggregate_rollup : même agrégation lue dans les rollups horaires
+- aggregate_approx : percentiles et utilisateurs distincts approchés (avec bornes d'erreur)
+- group_by         : agrégation générique par dimensions (POST /api/aggregate, voir common/groupby.py)
+- bulk_write       : insertion en masse (met aussi à jour les rollups)
+- write_events     : petits lots de l'ingestion temps réel (POST /api/events)
+- upsert_logs      : insertion idempotente par log_id (propagation, voir common/changelog.py)
+- stats            : volume par type d'événement et taille sur disque (GET /api/data/stats)
+- staging / publish / drop_version : versions du jeu de données (voir common/datasets.py)
+
+`mode` sélectionne une stratégie propre à la base (ex. "text" pour MongoDB,
+"index" pour Cassandra) ; les autres adapters l'ignorent.
+
+L'API, les benchmarks et les scripts d'insertion passent par ces adapters :
+mesure des phases, explain, journal des requêtes lentes et gestion
+des erreurs sont appliqués uniformément par `run_leg`.
+"""
+
+from datetime import datetime
+
+from scripts.common.timing import PhaseTimer, finalize_leg
+
+# Champs numériques agrégeables
+NUMERIC_FIELDS = ("session_duration_ms",)
+
+# Statistiques : "counters" (rollups maintenus à l'écriture), "estimate" (métadonnées de la base)
+# ou "exact" (parcours complet, seulement sur demande explicite)
+STATS_MODES = ("counters", "estimate", "exact")
+
+
+class LegContext:
+    """État d'exécution d'une branche : chronomètre, options et requête envoyée"""
+
+    def __init__(self, explain=False, trace=False):
+        self.timer = PhaseTimer()
+        self.explain = explain
+        self.trace = trace
+        # Renseignés par l'adapter pour le journal des requêtes lentes
+        self.query = None
+        self.rows = None
+
+    def phase(self, name):
+        return self.timer.phase(name)
+
+
+class Backend:
+    """Classe de base des adapters"""
+
+    name = None
+
+    def acquire(self):
+        """Obtient (ou crée au premier appel) le client partagé de la base"""
+        raise NotImplementedError
+
+    def ping(self):
+        raise NotImplementedError
+
+    def setup(self):
+        """Crée le schéma / les index nécessaires (idempotent)"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def reset(self):
+        """Remise à zéro complète avant un chargement (par défaut : clear)"""
+        self.clear()
+
+    def count(self):
+        raise NotImplementedError
+
+    def bulk_write(self, logs, progress=None):
+        """Insère une liste de logs (dicts) ; renvoie le nombre de logs écrits"""
+        raise NotImplementedError
+
+    def write_events(self, logs):
+        """Écriture d'un petit lot d'événements temps réel (par défaut : bulk_write)"""
+        return self.bulk_write(logs)
+
+    def upsert_logs(self, logs):
+        """Écriture idempotente par log_id (propagation depuis le journal, rejouable)"""
+        raise NotImplementedError
+
+    def fulltext(self, ctx, event_type=None, search_text=None, date_start=None, date_end=None,
+                 mode=None, sample_size=5, where=None):
+        """`where` : expression de filtre JSON (voir scripts.common.filters) ; le résultat contient le plan"""
+        raise NotImplementedError
+
+    def latest_for_user(self, ctx, user_id, limit=100, sample_size=5, mode=None):
+        raise NotImplementedError
+
+    def latest_for_users(self, ctx, user_ids, limit=100, sample_size=5):
+        """Timelines de plusieurs utilisateurs (voir `timelines_leg` pour le résultat)"""
+        raise NotImplementedError
+
+    def aggregate(self, ctx, event_types, field="session_duration_ms", mode=None,
+                  date_start=None, date_end=None):
+        raise NotImplementedError
+
+    def group_by(self, ctx, dimensions, metrics, field="session_duration_ms", filters=None, limit=1000):
+        """Groupes {key, métriques} triés par clé (voir `group_leg` de common/groupby.py)"""
+        raise NotImplementedError
+
+    # ============ ROLLUPS (Tâche 3) ============
+
+    def update_rollups(self, partials):
+        """Fusionne des agrégats partiels {(event_type, heure): {count, sum, min, max}}"""
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        """Recalcule tous les rollups depuis les données brutes"""
+        raise NotImplementedError
+
+    def aggregate_rollup(self, ctx, event_types, date_start=None, date_end=None):
+        raise NotImplementedError
+
+    # ============ APPROCHÉ (Tâche 3) ============
+
+    def aggregate_approx(self, ctx, event_types, date_start=None, date_end=None):
+        """{event_type: {count, percentiles: {p50, p95, p99}, distinct_users}} avec bornes d'erreur"""
+        raise NotImplementedError
+
+
+    # ============ VERSIONS DU JEU DE DONNÉES ============
+
+    def live_version(self):
+        """Version publiée (None : jeu de données d'origine, non versionné)"""
+        raise NotImplementedError
+
+    def staging(self, version):
+        """Adapter écrivant dans `version`, invisible des lecteurs jusqu'à `publish`"""
+        raise NotImplementedError
+
+    def prepare_publish(self, staging):
+        """Vérifie que la version chargée est complète et lisible (avant toute bascule) ; lève sinon"""
+        raise NotImplementedError
+
+    def publish(self, staging, version):
+        """Bascule les lecteurs sur la version chargée ; renvoie la version remplacée, à passer à drop_version"""
+        raise NotImplementedError
+
+    def rollback(self, staging, retired, version):
+        """Annule `publish` : les lecteurs reviennent sur `retired` (renvoyée par publish), publiée comme `version`"""
+        raise NotImplementedError
+
+    def drop_version(self, retired):
+        """Supprime une version remplacée (en arrière-plan, après un délai de grâce)"""
+        raise NotImplementedError
+
+    def discard(self, staging):
+        """Supprime une version dont le chargement a échoué (jamais publiée)"""
+        raise NotImplementedError
+
+    # ============ STATISTIQUES ============
+
+    def stats(self, mode="counters"):
+        """{total, by_event_type, relative_error, source, size_bytes} selon le mode demandé"""
+        if mode not in STATS_MODES:
+            raise ValueError(f"Mode de statistiques inconnu : {mode} (attendu : {', '.join(STATS_MODES)})")
+        if mode == "estimate":
+            result = self.estimate_count()
+        else:
+            by_event_type = self.count_by_event_type() if mode == "exact" else self.counters()
+            result = {"total": sum(by_event_type.values()), "by_event_type": by_event_type,
+                      "relative_error": 0.0 if mode == "exact" else None}
+        result.setdefault("source", mode)
+        try:
+            result["size_bytes"] = self.disk_size()
+        except Exception as e:
+            # La taille est secondaire : les comptages restent utiles sans elle
+            result["size_bytes"], result["size_error"] = None, str(e)
+        return result
+
+    def counters(self):
+        """{event_type: nombre} lu dans les compteurs maintenus à l'écriture (rollups horaires)"""
+        raise NotImplementedError
+
+    def estimate_count(self):
+        """{total, by_event_type: None, relative_error, source} depuis les métadonnées de la base"""
+        raise NotImplementedError
+
+    def count_by_event_type(self):
+        """{event_type: nombre} exact, par un parcours complet des données"""
+        raise NotImplementedError
+
+    def disk_size(self):
+        """Taille occupée (octets, données + index), None si inconnue"""
+        return None
+
+
+def run_leg(backend, operation, params, explain=False, trace=False, slow_log=None):
+    """Exécute une opération sur un adapter et renvoie le résultat de la branche"""
+    ctx = LegContext(explain=explain, trace=trace)
+    try:
+        with ctx.phase("connect"):
+            backend.acquire()
+        leg = getattr(backend, operation)(ctx, **params)
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+    leg["status"] = "success"
+    finalize_leg(leg, ctx.timer, trace)
+    if slow_log is not None:
+        rows = ctx.rows if ctx.rows is not None else leg.get("count")
+        slow_log.record(backend.name, operation, ctx.query, params, rows, leg["timings"])
+    return leg
+
+
+def timelines_leg(user_ids, timelines, sample_size, to_dict):
+    """Résultat commun de latest_for_users ; timelines : {user_id: lignes du plus récent au plus ancien}"""
+    counts = {str(user_id): len(timelines.get(user_id, ())) for user_id in user_ids}
+    return {
+        "count": sum(counts.values()),
+        "users": len(user_ids),
+        "users_found": sum(1 for count in counts.values() if count),
+        "counts": counts,
+        "sample_data": {
+            str(user_id): [to_dict(row) for row in (rows[:sample_size] if sample_size is not None else rows)]
+            for user_id, rows in timelines.items() if len(rows)
+        }
+    }
+
+
+def check_numeric_field(field):
+    if field not in NUMERIC_FIELDS:
+        raise ValueError(f"Champ non agrégeable : {field}")
+    return field
+
+
+def parse_date_bounds(date_start, date_end):
+    """Bornes datetime d'un intervalle de dates ISO (date_end inclusive sur la journée)"""
+    start = datetime.fromisoformat(date_start) if date_start else None
+    if date_end and len(date_end) == 10:
+        date_end += "T23:59:59"
+    end = datetime.fromisoformat(date_end) if date_end else None
+    return start, end
@@ -0,0 +1,1087 @@
+"""
+Adapter Cassandra
+
+Table `logs_by_user` : partition user_id, clustering timestamp DESC.
+Seule la Tâche 2 suit la clé de partition ; les autres requêtes scannent la table,
+sauf en mode "index" (index SASI sur event_type, timestamp et description)
+et en mode "tokens" (index sur la collection description_tokens, calculée à l'ingestion).
+
+Table `logs_by_user_month` : même contenu partitionné par (user_id, month_bucket)
+pour borner la taille des partitions ; `user_buckets` liste les mois de chaque
+utilisateur. Lue par la Tâche 2 en mode "buckets".
+
+Table `rollup_hourly` : agrégats partiels par (event_type, heure), une ligne par
+chargement ; la lecture d'une fenêtre ne parcourt que les heures concernées.
+Un recalcul écrit ses partiels sous une nouvelle génération (table rollup_cutoff),
+activée en une écriture une fois le recalcul terminé.
+"""
+
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from cassandra import InvalidRequest
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import BatchStatement
+from cassandra.util import SortedSet
+import numpy as np
+
+from scripts.backends.base import Backend, check_numeric_field, parse_date_bounds, timelines_leg
+from scripts.common.columns import (
+    COLUMNAR_PROFILE, column_length, concat_pages, isin, row_at, summarize_column, timestamps_ms
+)
+from scripts.common.connections import (
+    KEYSPACE, close_cassandra_session, get_cassandra_cluster, get_cassandra_session, prepare
+)
+from scripts.common.explain import summarize_cassandra_traces
+from scripts.common.filters import Eq, In, Plan, Range, Text, conjuncts, task1_filter
+from scripts.common.groupby import (
+    format_bucket, group_leg, merge_partials, partials_from_arrays, time_buckets
+)
+from scripts.common.rollup import (
+    finalize, hour_of, hour_start, hour_window, merge, partials, partials_from_columns
+)
+from scripts.common.sketches import event_sketches, merge_sketches
+from scripts.common.tokens import tokenize
+
+# La table est modélisée pour une recherche rapide des logs par utilisateur, triés par timestamp
+# Clé primaire : (user_id) est la clé de partition, timestamp est la clé de clustering (tri)
+# `{keyspace}` : keyspace de la version du jeu de données (voir scripts/common/datasets.py)
+CREATE_KEYSPACE_CQL = (
+    "CREATE KEYSPACE IF NOT EXISTS {keyspace} "
+    "WITH replication = {{'class': 'SimpleStrategy', 'replication_factor': 1}}"
+)
+
+CREATE_TABLE_CQL = """
+CREATE TABLE IF NOT EXISTS {keyspace}.logs_by_user (
+    user_id int,
+    timestamp timestamp,
+    log_id uuid,
+    event_type text,
+    product_id text,
+    description text,
+    session_duration_ms int,
+    description_tokens set<text>,
+    PRIMARY KEY ((user_id), timestamp)
+) WITH CLUSTERING ORDER BY (timestamp DESC);
+"""
+
+# Partitions bornées : un utilisateur actif ne produit qu'une partition par mois
+CREATE_MONTH_TABLE_CQL = """
+CREATE TABLE IF NOT EXISTS {keyspace}.logs_by_user_month (
+    user_id int,
+    month_bucket text,
+    timestamp timestamp,
+    log_id uuid,
+    event_type text,
+    product_id text,
+    description text,
+    session_duration_ms int,
+    PRIMARY KEY ((user_id, month_bucket), timestamp)
+) WITH CLUSTERING ORDER BY (timestamp DESC);
+"""
+
+CREATE_USER_BUCKETS_CQL = """
+CREATE TABLE IF NOT EXISTS {keyspace}.user_buckets (
+    user_id int,
+    month_bucket text,
+    PRIMARY KEY ((user_id), month_bucket)
+) WITH CLUSTERING ORDER BY (month_bucket DESC);
+"""
+
+# Chaque chargement ajoute ses agrégats partiels (partial_id) : pas de lecture avant écriture
+CREATE_ROLLUP_TABLE_CQL = """
+CREATE TABLE IF NOT EXISTS {keyspace}.rollup_hourly (
+    event_type text,
+    hour timestamp,
+    partial_id timeuuid,
+    event_count bigint,
+    duration_sum bigint,
+    duration_min int,
+    duration_max int,
+    rebuilt boolean,
+    PRIMARY KEY ((event_type), hour, partial_id)
+);
+"""
+
+# Génération des rollups : timeuuid des partiels recalculés (rebuilt) de la génération courante.
+# Sont comptés ces partiels et les partiels incrémentaux plus récents ; sans génération, tous les incrémentaux
+CREATE_ROLLUP_CUTOFF_TABLE_CQL = """
+CREATE TABLE IF NOT EXISTS {keyspace}.rollup_cutoff (
+    name text PRIMARY KEY,
+    partial_id timeuuid
+);
+"""
+ROLLUP_CUTOFF_NAME = "rollup_hourly"
+SELECT_ROLLUP_CUTOFF_CQL = "SELECT partial_id FROM rollup_cutoff WHERE name = ?"
+UPDATE_ROLLUP_CUTOFF_CQL = "INSERT INTO rollup_cutoff (name, partial_id) VALUES (?, ?)"
+
+# Tables créées avant la colonne rebuilt
+ADD_REBUILT_COLUMN_CQL = "ALTER TABLE {keyspace}.rollup_hourly ADD rebuilt boolean"
+
+# Pointeur de version : keyspace lu par les requêtes (absent : KEYSPACE lui-même)
+CREATE_POINTER_TABLE_CQL = f"""
+CREATE TABLE IF NOT EXISTS {KEYSPACE}.dataset_pointer (
+    name text PRIMARY KEY,
+    keyspace_name text,
+    version text,
+    switched_at timestamp
+);
+"""
+POINTER_NAME = "logs"
+SELECT_POINTER_CQL = f"SELECT keyspace_name, version FROM {KEYSPACE}.dataset_pointer WHERE name = ?"
+UPDATE_POINTER_CQL = (
+    f"INSERT INTO {KEYSPACE}.dataset_pointer (name, keyspace_name, version, switched_at) "
+    "VALUES (?, ?, ?, toTimestamp(now()))"
+)
+# Durée de cache du pointeur dans chaque processus : délai maximal de bascule des autres workers
+POINTER_TTL_S = float(os.getenv('CASSANDRA_VERSION_POINTER_TTL_S', 1))
+
+# Tables créées avant l'ajout de description_tokens
+ADD_TOKENS_COLUMN_CQL = "ALTER TABLE {keyspace}.logs_by_user ADD description_tokens set<text>"
+
+CREATE_TOKENS_INDEX_CQL = (
+    "CREATE INDEX IF NOT EXISTS logs_description_tokens_idx "
+    "ON {keyspace}.logs_by_user (values(description_tokens))"
+)
+
+INSERT_CQL = """
+INSERT INTO logs_by_user (user_id, timestamp, log_id, event_type, product_id, description, session_duration_ms,
+                          description_tokens)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_MONTH_CQL = """
+INSERT INTO logs_by_user_month (user_id, month_bucket, timestamp, log_id, event_type, product_id, description,
+                                session_duration_ms)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_USER_BUCKET_CQL = "INSERT INTO user_buckets (user_id, month_bucket) VALUES (?, ?)"
+
+# Présence d'un log (upsert_logs : seuls les absents sont écrits)
+SELECT_EXISTING_CQL = "SELECT log_id FROM logs_by_user WHERE user_id = ? AND timestamp = ?"
+
+INSERT_ROLLUP_CQL = """
+INSERT INTO rollup_hourly (event_type, hour, partial_id, event_count, duration_sum, duration_min, duration_max)
+VALUES (?, ?, now(), ?, ?, ?, ?)
+"""
+
+INSERT_REBUILT_ROLLUP_CQL = """
+INSERT INTO rollup_hourly (event_type, hour, partial_id, event_count, duration_sum, duration_min, duration_max,
+                           rebuilt)
+VALUES (?, ?, ?, ?, ?, ?, ?, true)
+"""
+
+# Partiels des générations précédentes (supprimés au recalcul suivant)
+PURGE_ROLLUP_CQL = "DELETE FROM rollup_hourly WHERE event_type = ? AND hour = ? AND partial_id < ?"
+
+DATA_TABLES = ("logs_by_user", "logs_by_user_month", "user_buckets", "rollup_hourly", "rollup_cutoff")
+# Tables créées dans le keyspace d'une version (vérifiées avant publication)
+SELECT_TABLES_CQL = "SELECT table_name FROM system_schema.tables WHERE keyspace_name = ?"
+
+BATCH_SIZE = 100
+# Requêtes en vol pour write_events (ingestion temps réel)
+WRITE_CONCURRENCY = int(os.getenv('CASSANDRA_WRITE_CONCURRENCY', 64))
+
+# Index SASI (nécessite `sasi_indexes_enabled: true` dans cassandra.yaml)
+# description : mode CONTAINS insensible à la casse -> LIKE '%critique%'
+SASI_INDEXES_CQL = (
+    "CREATE CUSTOM INDEX IF NOT EXISTS logs_event_type_sasi ON logs_by_user (event_type) "
+    "USING 'org.apache.cassandra.index.sasi.SASIIndex'",
+    "CREATE CUSTOM INDEX IF NOT EXISTS logs_timestamp_sasi ON logs_by_user (timestamp) "
+    "USING 'org.apache.cassandra.index.sasi.SASIIndex' WITH OPTIONS = {'mode': 'SPARSE'}",
+    "CREATE CUSTOM INDEX IF NOT EXISTS logs_description_sasi ON logs_by_user (description) "
+    "USING 'org.apache.cassandra.index.sasi.SASIIndex' WITH OPTIONS = {"
+    "'mode': 'CONTAINS', "
+    "'analyzer_class': 'org.apache.cassandra.index.sasi.analyzer.NonTokenizingAnalyzer', "
+    "'case_sensitive': 'false'}",
+)
+
+# Mode par défaut des Tâches 1 et 3 : "scan" (ALLOW FILTERING + filtrage Python), "index" (SASI)
+# ou "tokens" (Tâche 1 seulement : CONTAINS sur description_tokens)
+SEARCH_MODES = ("scan", "index", "tokens")
+SEARCH_MODE = os.getenv('CASSANDRA_SEARCH_MODE', 'scan')
+
+# Tâche 2 : "partition" (logs_by_user) ou "buckets" (logs_by_user_month, mois par mois)
+TIMELINE_MODES = ("partition", "buckets")
+TIMELINE_MODE = os.getenv('CASSANDRA_TIMELINE_MODE', 'partition')
+
+# Lectures mono-partition en vol simultanément (Tâche 2 par lot)
+READ_CONCURRENCY = int(os.getenv('CASSANDRA_READ_CONCURRENCY', 64))
+
+# Tâche 3 approchée : nombre de plages de tokens (Murmur3) lues en parallèle
+SCAN_SPLITS = int(os.getenv('CASSANDRA_SCAN_SPLITS', 16))
+
+# Statistiques estimées : partitions (system.size_estimates) × lignes moyennes d'un échantillon de partitions
+SIZE_ESTIMATES_CQL = (
+    "SELECT table_name, partitions_count, mean_partition_size FROM system.size_estimates WHERE keyspace_name = ?"
+)
+COUNT_SAMPLE_PARTITIONS = int(os.getenv('CASSANDRA_COUNT_SAMPLE_PARTITIONS', 20))
+
+
+def token_ranges(splits):
+    """Découpe l'anneau Murmur3 en `splits` plages (début exclu, fin incluse)"""
+    low, high = -2 ** 63, 2 ** 63 - 1
+    # Murmur3Partitioner n'attribue jamais le token minimal -2^63 : "> -2^63" couvre tout l'anneau
+    bounds = [low + (high - low) * index // splits for index in range(splits)] + [high]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def row_params(log):
+    """Paramètres des INSERT d'un log : (logs_by_user, logs_by_user_month, user_buckets)"""
+    # Convertir la chaîne ISO vers un objet datetime que Cassandra comprend
+    ts = log["timestamp"]
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    log_id = uuid.UUID(str(log["log_id"]))
+    product_id = log.get("product_id") or None
+    bucket = month_bucket(ts)
+    return (
+        (log["user_id"], ts, log_id, log["event_type"], product_id, log["description"],
+         log["session_duration_ms"], set(tokenize(log["description"]))),
+        (log["user_id"], bucket, ts, log_id, log["event_type"], product_id,
+         log["description"], log["session_duration_ms"]),
+        (log["user_id"], bucket)
+    )
+
+
+def jsonable(values):
+    # Les collections set<text> (description_tokens) ne sont pas sérialisables en JSON
+    return {
+        key: sorted(value) if isinstance(value, (set, frozenset, SortedSet)) else value
+        for key, value in values.items()
+    }
+
+
+def row_to_dict(row):
+    return jsonable(row._asdict())
+
+
+def check_mode(mode, modes):
+    if mode not in modes:
+        raise ValueError(f"Mode Cassandra inconnu : {mode} (attendu : {', '.join(modes)})")
+    return mode
+
+
+def check_search_mode(mode):
+    return check_mode(mode or SEARCH_MODE, SEARCH_MODES)
+
+
+def counted(row, cutoff):
+    """Partiel de rollup_hourly compté : recalculé de la génération `cutoff`, ou incrémental plus récent"""
+    if row.rebuilt:
+        return cutoff is not None and row.partial_id == cutoff
+    return cutoff is None or row.partial_id.time > cutoff.time
+
+
+def month_bucket(ts):
+    return ts.strftime("%Y-%m")
+
+
+class CassandraBackend(Backend):
+    name = "cassandra"
+
+    def __init__(self, keyspace=None):
+        # keyspace fixé : version en cours de chargement ; None : version publiée (pointeur)
+        self._keyspace = keyspace
+        self._pointer = None  # (keyspace, version, lu à)
+        self._pointer_lock = threading.Lock()
+        self._indexed_keyspaces = set()
+        self._indexes_lock = threading.Lock()
+
+    @property
+    def keyspace(self):
+        if self._keyspace is not None:
+            return self._keyspace
+        return self._read_pointer()[0]
+
+    def _read_pointer(self):
+        pointer = self._pointer
+        if pointer is None or time.monotonic() - pointer[2] > POINTER_TTL_S:
+            with self._pointer_lock:
+                try:
+                    row = get_cassandra_session().execute(prepare(SELECT_POINTER_CQL), [POINTER_NAME]).one()
+                except InvalidRequest:
+                    row = None  # table du pointeur pas encore créée
+                pointer = self._pointer = (row.keyspace_name, row.version, time.monotonic()) if row \
+                    else (KEYSPACE, None, time.monotonic())
+        return pointer
+
+    @property
+    def session(self):
+        return get_cassandra_session(self.keyspace)
+
+    def _prepare(self, cql):
+        return prepare(cql, self.keyspace)
+
+    def _run(self, ctx, cql, params=None):
+        """Exécute une requête préparée en séparant envoi, premier page et lecture du reste"""
+        with ctx.phase("query"):
+            future = self.session.execute_async(self._prepare(cql), params, trace=ctx.explain)
+        with ctx.phase("first_row"):
+            result_set = future.result()
+        with ctx.phase("fetch"):
+            rows = list(result_set)
+        return rows, result_set
+
+    def _run_columns(self, ctx, cql, params=None):
+        """Comme `_run`, mais les pages sont décodées en colonnes (pas d'objet par ligne)"""
+        with ctx.phase("query"):
+            future = self.session.execute_async(self._prepare(cql), params, trace=ctx.explain,
+                                                execution_profile=COLUMNAR_PROFILE)
+        with ctx.phase("first_row"):
+            result_set = future.result()
+        with ctx.phase("fetch"):
+            columns = concat_pages(result_set, result_set.column_names or ())
+        return columns, result_set
+
+    # ============ ADMINISTRATION ============
+
+    def acquire(self):
+        return get_cassandra_session(self.keyspace)
+
+    def ping(self):
+        self.session.execute("SELECT now() FROM system.local", timeout=5)
+
+    def setup(self):
+        bootstrap = get_cassandra_cluster().connect()
+        try:
+            # Keyspace de base : porte le pointeur de version
+            bootstrap.execute(CREATE_KEYSPACE_CQL.format(keyspace=KEYSPACE))
+            bootstrap.execute(CREATE_POINTER_TABLE_CQL)
+            keyspace = self.keyspace
+            for cql in (CREATE_KEYSPACE_CQL, CREATE_TABLE_CQL, CREATE_MONTH_TABLE_CQL, CREATE_USER_BUCKETS_CQL,
+                        CREATE_ROLLUP_TABLE_CQL, CREATE_ROLLUP_CUTOFF_TABLE_CQL):
+                bootstrap.execute(cql.format(keyspace=keyspace))
+            for cql in (ADD_TOKENS_COLUMN_CQL, ADD_REBUILT_COLUMN_CQL):
+                try:
+                    bootstrap.execute(cql.format(keyspace=keyspace))
+                except InvalidRequest:
+                    pass  # colonne déjà présente
+            bootstrap.execute(CREATE_TOKENS_INDEX_CQL.format(keyspace=keyspace))
+        finally:
+            bootstrap.shutdown()
+
+    def ensure_search_indexes(self):
+        """Crée les index SASI au premier usage du mode "index" (construits en tâche de fond par Cassandra)"""
+        keyspace = self.keyspace
+        if keyspace in self._indexed_keyspaces:
+            return
+        with self._indexes_lock:
+            if keyspace not in self._indexed_keyspaces:
+                session = get_cassandra_session(keyspace)
+                for cql in SASI_INDEXES_CQL:
+                    session.execute(cql)
+                self._indexed_keyspaces.add(keyspace)
+
+    def clear(self):
+        for table in DATA_TABLES:
+            self.session.execute(f"TRUNCATE {table}")
+
+    # ============ VERSIONS DU JEU DE DONNÉES ============
+    # Un keyspace par version ; les lecteurs suivent le pointeur dataset_pointer
+
+    def live_version(self):
+        return self._read_pointer()[1]
+
+    def staging(self, version):
+        return CassandraBackend(keyspace=f"{KEYSPACE}_{version}")
+
+    def prepare_publish(self, staging):
+        rows = get_cassandra_session().execute(prepare(SELECT_TABLES_CQL), [staging.keyspace])
+        missing = set(DATA_TABLES) - {row.table_name for row in rows}
+        if missing:
+            raise RuntimeError(f"Tables absentes de {staging.keyspace} : {', '.join(sorted(missing))}")
+
+    def publish(self, staging, version):
+        retired = self.keyspace
+        self._write_pointer(staging.keyspace, version)
+        return retired
+
+    def rollback(self, staging, retired, version):
+        self._write_pointer(retired, version)
+
+    def _write_pointer(self, keyspace, version):
+        get_cassandra_session().execute(prepare(UPDATE_POINTER_CQL), [POINTER_NAME, keyspace, version])
+        # Ce processus bascule immédiatement, les autres au plus tard après POINTER_TTL_S
+        with self._pointer_lock:
+            self._pointer = (keyspace, version, time.monotonic())
+
+    def drop_version(self, keyspace):
+        if keyspace == KEYSPACE:
+            # Le keyspace de base garde le pointeur : seules ses tables de données sont vidées
+            session = get_cassandra_session(KEYSPACE)
+            for table in DATA_TABLES:
+                session.execute(f"TRUNCATE {table}")
+            return
+        close_cassandra_session(keyspace)
+        get_cassandra_session().execute(f"DROP KEYSPACE IF EXISTS {keyspace}", timeout=120)
+
+    def discard(self, staging):
+        self.drop_version(staging.keyspace)
+
+    def count(self):
+        rows = list(self.session.execute(self._prepare("SELECT COUNT(*) as count FROM logs_by_user")))
+        return rows[0].count if rows else 0
+
+    # ============ STATISTIQUES ============
+
+    def counters(self):
+        # Table rollup_hourly : quelques lignes par heure, au lieu de toute la table des logs
+        counts, cutoff = {}, self._rollup_cutoff()
+        for row in self.session.execute(self._prepare(
+                "SELECT event_type, event_count, partial_id, rebuilt FROM rollup_hourly")):
+            if counted(row, cutoff):
+                counts[row.event_type] = counts.get(row.event_type, 0) + row.event_count
+        return counts
+
+    def _size_estimates(self):
+        """{table: (partitions, octets)} d'après system.size_estimates (recalculé toutes les 5 min, hors memtables)"""
+        tables = {}
+        for row in self.session.execute(self._prepare(SIZE_ESTIMATES_CQL), [self.keyspace]):
+            partitions, size = tables.get(row.table_name, (0, 0))
+            tables[row.table_name] = (partitions + row.partitions_count,
+                                      size + row.partitions_count * row.mean_partition_size)
+        return tables
+
+    def disk_size(self):
+        return sum(size for _, size in self._size_estimates().values())
+
+    def estimate_count(self):
+        partitions = self._size_estimates().get("logs_by_user", (0, 0))[0]
+        # Premières partitions dans l'ordre des tokens (hachage Murmur3 : échantillon sans biais d'utilisateur)
+        users = [row.user_id for row in self.session.execute(
+            self._prepare("SELECT DISTINCT user_id FROM logs_by_user LIMIT ?"), [COUNT_SAMPLE_PARTITIONS])]
+        result = {"by_event_type": None, "source": "system.size_estimates"}
+        if not users:
+            return dict(result, total=0, relative_error=0.0)
+        if not partitions:
+            return dict(result, total=None, relative_error=None,
+                        note="system.size_estimates pas encore calculé (données encore en memtable)")
+        sizes = np.array([
+            rows.one().count for _, rows in execute_concurrent_with_args(
+                self.session, self._prepare("SELECT COUNT(*) AS count FROM logs_by_user WHERE user_id = ?"),
+                [(user_id,) for user_id in users], concurrency=COUNT_SAMPLE_PARTITIONS, raise_on_first_error=True)
+        ], dtype=np.float64)
+        mean = sizes.mean()
+        # ±2σ de la moyenne de l'échantillon (l'erreur de size_estimates elle-même n'est pas bornée)
+        error = 2 * sizes.std(ddof=1) / (mean * np.sqrt(len(sizes))) if len(sizes) > 1 and mean else None
+        return dict(result, total=int(round(partitions * mean)),
+                    relative_error=round(float(error), 4) if error is not None else None,
+                    partitions=partitions, sampled_partitions=len(sizes))
+
+    def count_by_event_type(self):
+        # Parcours complet, plages de tokens lues en parallèle, colonne event_type seule
+        statement = self._prepare("SELECT event_type FROM logs_by_user WHERE token(user_id) > ? AND token(user_id) <= ?")
+        futures = [
+            self.session.execute_async(statement, [low, high], execution_profile=COLUMNAR_PROFILE)
+            for low, high in token_ranges(SCAN_SPLITS)
+        ]
+        counts = {}
+        for future in futures:
+            result_set = future.result()
+            columns = concat_pages(result_set, result_set.column_names or ())
+            if not column_length(columns):
+                continue
+            for event_type, count in zip(*np.unique(columns["event_type"], return_counts=True)):
+                counts[event_type] = counts.get(event_type, 0) + int(count)
+        return counts
+
+    def bulk_write(self, logs, progress=None):
+        written = self._write_rows(logs, progress)
+        self.update_rollups(partials(logs))
+        return written
+
+    def write_events(self, logs):
+        # Petits lots temps réel : INSERT préparés concurrents (chaque requête va au bon réplica
+        # via TokenAware) plutôt qu'une batch multi-partitions coordonnée par un seul nœud
+        rows, month_rows, bucket_keys = [], [], set()
+        for log in logs:
+            row, month_row, bucket_key = row_params(log)
+            rows.append(row)
+            month_rows.append(month_row)
+            bucket_keys.add(bucket_key)
+        for cql, params in ((INSERT_CQL, rows), (INSERT_MONTH_CQL, month_rows),
+                            (INSERT_USER_BUCKET_CQL, list(bucket_keys))):
+            execute_concurrent_with_args(self.session, self._prepare(cql), params,
+                                         concurrency=WRITE_CONCURRENCY, raise_on_first_error=True)
+        self.update_rollups(partials(logs))
+        return len(logs)
+
+    def upsert_logs(self, logs):
+        # Comme $setOnInsert (MongoDB) ou op_type create (Elasticsearch) : seuls les logs absents sont écrits
+        # et alimentent les rollups (des partiels rejoués seraient comptés deux fois)
+        absent = self._absent(logs)
+        self._write_rows(absent)
+        self.update_rollups(partials(absent))
+        return len(absent)
+
+    def _absent(self, logs):
+        """Logs dont la clé (user_id, timestamp) n'est pas encore dans logs_by_user (lectures concurrentes)"""
+        keys = {}
+        for log in logs:
+            keys.setdefault(row_params(log)[0][:2], log)
+        results = execute_concurrent_with_args(self.session, self._prepare(SELECT_EXISTING_CQL), list(keys),
+                                               concurrency=WRITE_CONCURRENCY, raise_on_first_error=True)
+        return [log for log, (_, rows) in zip(keys.values(), results) if rows.one() is None]
+
+    def _write_rows(self, logs, progress=None):
+        session = self.session
+        prepared_stmt = self._prepare(INSERT_CQL)
+        prepared_month = self._prepare(INSERT_MONTH_CQL)
+        prepared_bucket = self._prepare(INSERT_USER_BUCKET_CQL)
+        # Une batch par table pour rester sous batch_size_fail_threshold
+        batch, month_batch, buckets = BatchStatement(), BatchStatement(), set()
+        written = 0
+
+        def flush():
+            bucket_batch = BatchStatement()
+            for pair in buckets:
+                bucket_batch.add(prepared_bucket, pair)
+            for pending in (batch, month_batch, bucket_batch):
+                session.execute(pending)
+
+        for log in logs:
+            row, month_row, bucket_key = row_params(log)
+            batch.add(prepared_stmt, row)
+            month_batch.add(prepared_month, month_row)
+            buckets.add(bucket_key)
+            written += 1
+
+            if written % BATCH_SIZE == 0:
+                flush()
+                batch, month_batch, buckets = BatchStatement(), BatchStatement(), set()
+                if progress:
+                    progress(written, len(logs))
+
+        # Insérer le reste
+        if len(batch):
+            flush()
+            if progress:
+                progress(written, len(logs))
+        return written
+
+    # ============ ROLLUPS ============
+
+    def update_rollups(self, rollup_partials):
+        self._write_rollups(self._prepare(INSERT_ROLLUP_CQL), rollup_partials)
+
+    def _write_rollups(self, prepared, rollup_partials, *partial_id):
+        session = self.session
+        # Une batch par partition (event_type) : écriture locale à un seul réplica
+        by_event_type = {}
+        for (event_type, hour), partial in rollup_partials.items():
+            by_event_type.setdefault(event_type, []).append((
+                event_type, hour_start(hour), *partial_id,
+                partial["count"], partial["sum"], partial["min"], partial["max"]
+            ))
+        for rows in by_event_type.values():
+            for offset in range(0, len(rows), BATCH_SIZE):
+                batch = BatchStatement()
+                for row in rows[offset:offset + BATCH_SIZE]:
+                    batch.add(prepared, row)
+                session.execute(batch)
+
+    def _rollup_cutoff(self):
+        try:
+            row = self.session.execute(self._prepare(SELECT_ROLLUP_CUTOFF_CQL), [ROLLUP_CUTOFF_NAME]).one()
+        except InvalidRequest:
+            return None  # table pas encore créée (keyspace d'avant les générations)
+        return row.partial_id if row else None
+
+    def rebuild_rollups(self):
+        """
+        Recalcul sous une nouvelle génération, activée en une écriture : les lecteurs gardent l'ancienne
+        jusque-là, et les partiels incrémentaux écrits pendant le recalcul (postérieurs à la génération)
+        restent comptés. Un lot dont les logs sont lus par le recalcul mais dont les rollups sont écrits
+        juste après la prise de la génération peut être compté deux fois, jusqu'au recalcul suivant.
+        """
+        session = self.session
+        previous = self._rollup_cutoff()
+        # Horloge du serveur, comme le now() des partiels incrémentaux
+        cutoff = session.execute("SELECT now() FROM system.local").one()[0]
+        result_set = session.execute(
+            self._prepare("SELECT event_type, timestamp, session_duration_ms FROM logs_by_user"),
+            execution_profile=COLUMNAR_PROFILE
+        )
+        columns = concat_pages(result_set, ("event_type", "timestamp", "session_duration_ms"))
+        rollup_partials = {}
+        if column_length(columns):
+            rollup_partials = partials_from_columns(
+                columns["event_type"], timestamps_ms(columns["timestamp"]),
+                columns["session_duration_ms"].astype(np.int64)
+            )
+        self._write_rollups(self._prepare(INSERT_REBUILT_ROLLUP_CQL), rollup_partials, cutoff)
+        session.execute(self._prepare(UPDATE_ROLLUP_CUTOFF_CQL), [ROLLUP_CUTOFF_NAME, cutoff])
+        if previous is not None:
+            self._purge_rollups(previous)
+
+    def _purge_rollups(self, before):
+        """Supprime les partiels antérieurs à la génération `before` (plus lus par personne)"""
+        stale = {
+            (row.event_type, row.hour)
+            for row in self.session.execute(self._prepare("SELECT event_type, hour, partial_id FROM rollup_hourly"))
+            if row.partial_id.time < before.time
+        }
+        execute_concurrent_with_args(self.session, self._prepare(PURGE_ROLLUP_CQL),
+                                     [(event_type, hour, before) for event_type, hour in stale],
+                                     concurrency=WRITE_CONCURRENCY, raise_on_first_error=True)
+
+    # ============ TÂCHES ============
+
+    def plan_filter(self, node, mode):
+        """
+        Répartit les termes du filtre selon le schéma de logs_by_user :
+        partition (user_id), clustering (plage de timestamp dans les partitions demandées),
+        index (SASI en mode "index", description_tokens en mode "tokens"),
+        filtering (ALLOW FILTERING, évalué par Cassandra) ou résiduel (évalué sur les pages reçues)
+        """
+        plan, restricted = Plan(), set()
+        terms = conjuncts(node)
+        # La clé de partition d'abord : elle fait de la plage de timestamp une plage de clustering
+        partition = next((term for term in terms if isinstance(term, (Eq, In)) and term.field == "user_id"), None)
+        for term in terms:
+            field = getattr(term, "field", None)
+            via = None
+            if term is partition:
+                via = "partition"
+            elif field in restricted:
+                via = None  # une seule restriction par colonne dans une requête CQL
+            elif isinstance(term, Range) and field == "timestamp":
+                via = "clustering" if partition else ("index" if mode == "index" else "filtering")
+            elif isinstance(term, Eq) and field == "event_type":
+                via = "index" if mode == "index" else "filtering"
+            elif isinstance(term, Eq) and field in ("product_id", "log_id") and term.value is not None:
+                via = "filtering"
+            elif isinstance(term, Range) and field == "session_duration_ms":
+                via = "filtering"
+            elif isinstance(term, Text) and field == "description":
+                if mode == "index" or (mode == "tokens" and tokenize(term.text)):
+                    via = "index"
+            # IN sur une colonne hors clé, OU, texte en mode scan : résiduels
+            if via:
+                plan.push(term, via)
+                restricted.add(field)
+            else:
+                plan.keep(term)
+        return plan
+
+    @staticmethod
+    def _where(plan, mode):
+        """Prédicats CQL et valeurs liées des termes poussés"""
+        predicates, params = [], []
+        for term, via in plan.pushed:
+            if via == "partition":
+                predicates.append("user_id = ?" if isinstance(term, Eq) else "user_id IN ?")
+                params.append(term.value if isinstance(term, Eq) else term.values)
+            elif isinstance(term, Range):
+                for operator, bound in ((">=", term.low), ("<=", term.high)):
+                    if bound is not None:
+                        predicates.append(f"{term.field} {operator} ?")
+                        params.append(bound)
+            elif isinstance(term, Text) and mode == "tokens":
+                tokens = tokenize(term.text)
+                predicates.extend(["description_tokens CONTAINS ?"] * len(tokens))
+                params.extend(tokens)
+            elif isinstance(term, Text):
+                predicates.append("description LIKE ?")
+                params.append(f"%{term.text}%")
+            else:
+                predicates.append(f"{term.field} = ?")
+                params.append(uuid.UUID(term.value) if term.field == "log_id" else term.value)
+        return predicates, params
+
+    def fulltext(self, ctx, event_type=None, search_text=None, date_start=None, date_end=None,
+                 mode=None, sample_size=5, where=None):
+        mode = check_search_mode(mode)
+        if mode == "index":
+            self.ensure_search_indexes()
+        plan = self.plan_filter(task1_filter(event_type, search_text, date_start, date_end, where), mode)
+        predicates, params = self._where(plan, mode)
+        ctx.query = "SELECT * FROM logs_by_user"
+        if predicates:
+            ctx.query += " WHERE " + " AND ".join(predicates)
+        # Index combinés ou filtrage serveur : Cassandra exige ALLOW FILTERING
+        if plan.pushed_with("index", "filtering"):
+            ctx.query += " ALLOW FILTERING"
+        residual = plan.residual_filter()
+
+        # Pages décodées en colonnes et filtrées au fil de la lecture : seules les lignes
+        # d'exemple sont conservées, jamais tout le résultat
+        with ctx.phase("query"):
+            future = self.session.execute_async(self._prepare(ctx.query), params, trace=ctx.explain,
+                                                execution_profile=COLUMNAR_PROFILE)
+        with ctx.phase("first_row"):
+            result_set = future.result()
+        pages, count, samples, ctx.rows = iter(result_set), 0, [], 0
+        while True:
+            with ctx.phase("fetch"):
+                page = next(pages, None)
+            if page is None:
+                break
+            rows = column_length(page)
+            ctx.rows += rows
+            with ctx.phase("client"):
+                matches = np.flatnonzero(residual(page)) if residual and rows else np.arange(rows)
+                count += len(matches)
+                wanted = len(matches) if sample_size is None else max(0, sample_size - len(samples))
+                samples.extend(jsonable(row_at(page, index)) for index in matches[:wanted])
+
+        notes = {
+            "scan": "Scan + filtrage vectorisé des pages côté client",
+            "index": "Index SASI (LIKE CONTAINS + plage de timestamp)",
+            "tokens": "Index sur description_tokens (CONTAINS)"
+        }
+        leg = {
+            "count": count,
+            "mode": mode,
+            "note": notes[mode],
+            "plan": plan.describe(),
+            "sample_data": samples
+        }
+        if ctx.explain:
+            leg["explain"] = summarize_cassandra_traces(result_set.get_all_query_traces())
+        return leg
+
+    def latest_for_user(self, ctx, user_id, limit=100, sample_size=5, mode=None):
+        mode = check_mode(mode or TIMELINE_MODE, TIMELINE_MODES)
+        if mode == "buckets":
+            return self._latest_from_buckets(ctx, user_id, limit, sample_size)
+
+        ctx.query = "SELECT * FROM logs_by_user WHERE user_id = ? LIMIT ?"
+        rows, result_set = self._run(ctx, ctx.query, [user_id, limit])
+
+        with ctx.phase("serialize"):
+            leg = {
+                "count": len(rows),
+                "mode": "partition",
+                "note": "Optimisé: clé de partition + clustering",
+                "sample_data": [row_to_dict(r) for r in rows[:sample_size]]
+            }
+        if ctx.explain:
+            leg["explain"] = summarize_cassandra_traces(result_set.get_all_query_traces())
+        return leg
+
+    def _latest_from_buckets(self, ctx, user_id, limit, sample_size):
+        # Parcours des mois du plus récent au plus ancien ; le mois suivant est demandé
+        # pendant la lecture du mois courant et on s'arrête dès que `limit` lignes sont lues
+        session = self.session
+        ctx.query = "SELECT * FROM logs_by_user_month WHERE user_id = ? AND month_bucket = ? LIMIT ?"
+        with ctx.phase("query"):
+            buckets = [r.month_bucket for r in session.execute(
+                self._prepare("SELECT month_bucket FROM user_buckets WHERE user_id = ?"), [user_id]
+            )]
+        statement = self._prepare(ctx.query)
+
+        def request(bucket):
+            return session.execute_async(statement, [user_id, bucket, limit], trace=ctx.explain)
+
+        rows, traces, read = [], [], 0
+        future = request(buckets[0]) if buckets else None
+        for index, bucket in enumerate(buckets):
+            next_future = request(buckets[index + 1]) if index + 1 < len(buckets) else None
+            with ctx.phase("first_row" if not rows else "fetch"):
+                result_set = future.result()
+            with ctx.phase("fetch"):
+                rows.extend(result_set)
+            read += 1
+            if ctx.explain:
+                traces.extend(result_set.get_all_query_traces())
+            if len(rows) >= limit:
+                break
+            future = next_future
+        rows = rows[:limit]
+        ctx.rows = len(rows)
+
+        with ctx.phase("serialize"):
+            leg = {
+                "count": len(rows),
+                "mode": "buckets",
+                "buckets_read": read,
+                "buckets_total": len(buckets),
+                "note": "Partitions (user_id, mois) lues du plus récent au plus ancien",
+                "sample_data": [row_to_dict(r) for r in rows[:sample_size]]
+            }
+        if ctx.explain:
+            leg["explain"] = summarize_cassandra_traces(traces)
+        return leg
+
+    def latest_for_users(self, ctx, user_ids, limit=100, sample_size=5):
+        # Une lecture préparée par partition, READ_CONCURRENCY à la fois : chaque requête part
+        # directement vers un réplica de l'utilisateur (TokenAware), sans coordinateur multi-partitions
+        ctx.query = "SELECT * FROM logs_by_user WHERE user_id = ? LIMIT ?"
+        with ctx.phase("query"):
+            results = execute_concurrent_with_args(
+                self.session, self._prepare(ctx.query), [(user_id, limit) for user_id in user_ids],
+                concurrency=READ_CONCURRENCY, raise_on_first_error=True
+            )
+        with ctx.phase("fetch"):
+            timelines = {user_id: list(result) for user_id, (_, result) in zip(user_ids, results)}
+        ctx.rows = sum(len(rows) for rows in timelines.values())
+
+        with ctx.phase("serialize"):
+            leg = timelines_leg(user_ids, timelines, sample_size, row_to_dict)
+        leg["note"] = f"{len(user_ids)} lectures mono-partition concurrentes (execute_concurrent, {READ_CONCURRENCY} en vol)"
+        return leg
+
+    def aggregate(self, ctx, event_types, field="session_duration_ms", mode=None,
+                  date_start=None, date_end=None):
+        field = check_numeric_field(field)
+        # Le mode "tokens" ne concerne que la recherche texte : agrégation en scan
+        mode = "scan" if check_search_mode(mode) == "tokens" else check_search_mode(mode)
+        if mode == "index":
+            self.ensure_search_indexes()
+        start, end = parse_date_bounds(date_start, date_end)
+        predicates, window = ["event_type = ?"], []
+        if start:
+            predicates.append("timestamp >= ?")
+            window.append(start)
+        if end:
+            predicates.append("timestamp <= ?")
+            window.append(end)
+        ctx.query = f"SELECT {field} FROM logs_by_user WHERE " + " AND ".join(predicates)
+        # Un seul prédicat indexé (mode "index" sans fenêtre) : pas besoin d'ALLOW FILTERING
+        if mode == "scan" or window:
+            ctx.query += " ALLOW FILTERING"
+        aggregations = {}
+        traces = []
+        ctx.rows = 0
+
+        for event_type in event_types:
+            columns, result_set = self._run_columns(ctx, ctx.query, [event_type] + window)
+            rows = column_length(columns)
+            ctx.rows += rows
+            if ctx.explain:
+                traces.extend(result_set.get_all_query_traces())
+            with ctx.phase("client"):
+                if rows:
+                    aggregations[event_type] = summarize_column(columns[field])
+
+        leg = {
+            "mode": mode,
+            "note": "Index SASI sur event_type + agrégation côté client" if mode == "index"
+                    else "Scan complet + agrégation côté client",
+            "aggregations": aggregations
+        }
+        if ctx.explain:
+            leg["explain"] = summarize_cassandra_traces(traces)
+        return leg
+
+    def aggregate_rollup(self, ctx, event_types, date_start=None, date_end=None):
+        start, end = hour_window(date_start, date_end)
+        predicates, window = ["event_type = ?"], []
+        if start:
+            predicates.append("hour >= ?")
+            window.append(hour_start(start))
+        if end:
+            predicates.append("hour <= ?")
+            window.append(hour_start(end))
+        ctx.query = ("SELECT event_type, event_count, duration_sum, duration_min, duration_max, partial_id, rebuilt "
+                     "FROM rollup_hourly WHERE ") + " AND ".join(predicates)
+        buckets, traces = [], []
+        with ctx.phase("query"):
+            cutoff = self._rollup_cutoff()
+
+        # Une partition par type d'événement, lue sur la plage d'heures demandée
+        for event_type in event_types:
+            rows, result_set = self._run(ctx, ctx.query, [event_type] + window)
+            buckets.extend(rows)
+            if ctx.explain:
+                traces.extend(result_set.get_all_query_traces())
+        ctx.rows = len(buckets)
+
+        with ctx.phase("client"):
+            aggregations = finalize([
+                (r.event_type, {"count": r.event_count, "sum": r.duration_sum,
+                                "min": r.duration_min, "max": r.duration_max})
+                for r in buckets if counted(r, cutoff)
+            ])
+        leg = {
+            "source": "rollup",
+            "buckets": len(buckets),
+            "note": "Table rollup_hourly (agrégats partiels par heure)",
+            "aggregations": aggregations
+        }
+        if ctx.explain:
+            leg["explain"] = summarize_cassandra_traces(traces)
+        return leg
+
+    def aggregate_approx(self, ctx, event_types, date_start=None, date_end=None):
+        start, end = parse_date_bounds(date_start, date_end)
+        predicates, window = ["token(user_id) > ?", "token(user_id) <= ?"], []
+        if start:
+            predicates.append("timestamp >= ?")
+            window.append(start)
+        if end:
+            predicates.append("timestamp <= ?")
+            window.append(end)
+        ctx.query = ("SELECT event_type, user_id, session_duration_ms FROM logs_by_user WHERE "
+                     + " AND ".join(predicates))
+        if window:
+            ctx.query += " ALLOW FILTERING"
+        statement = self._prepare(ctx.query)
+        ranges = token_ranges(SCAN_SPLITS)
+        wanted = set(event_types)
+
+        # Toutes les plages sont demandées d'un coup ; chacune produit ses sketches, fusionnés ensuite
+        with ctx.phase("query"):
+            futures = [
+                self.session.execute_async(statement, [low, high] + window, trace=ctx.explain,
+                                           execution_profile=COLUMNAR_PROFILE)
+                for low, high in ranges
+            ]
+        sketches, traces = {}, []
+        ctx.rows = 0
+        for index, future in enumerate(futures):
+            with ctx.phase("first_row" if index == 0 else "fetch"):
+                result_set = future.result()
+                columns = concat_pages(result_set, result_set.column_names or ())
+            if ctx.explain:
+                traces.extend(result_set.get_all_query_traces())
+            ctx.rows += column_length(columns)
+            with ctx.phase("client"):
+                merge_sketches(sketches, event_sketches(columns, wanted))
+
+        with ctx.phase("client"):
+            aggregations = {event_type: sketch.summary() for event_type, sketch in sketches.items()}
+        leg = {
+            "source": "approx",
+            "ranges": len(ranges),
+            "note": f"Scan parallèle de {len(ranges)} plages de tokens, t-digest + HyperLogLog fusionnés",
+            "aggregations": aggregations
+        }
+        if ctx.explain:
+            leg["explain"] = summarize_cassandra_traces(traces)
+        return leg
+
+    # ============ AGRÉGATION GÉNÉRIQUE ============
+
+    def group_by(self, ctx, dimensions, metrics, field="session_duration_ms", filters=None, limit=1000):
+        field = check_numeric_field(field)
+        filters = filters or {}
+        # Dimensions et filtres couverts par rollup_hourly (une fenêtre en jours tombe sur des heures entières)
+        rollup = (set(dimensions) <= {"event_type", "hour", "day"}
+                  and not {"product_id", "user_id"}.intersection(filters)
+                  and all(len(filters.get(bound) or "") in (0, 10) for bound in ("date_start", "date_end")))
+        if rollup:
+            partials, note, traces = self._group_rollup(ctx, dimensions, filters)
+        else:
+            partials, note, traces = self._group_scan(ctx, dimensions, field, filters)
+        with ctx.phase("serialize"):
+            leg = group_leg(partials, dimensions, metrics, limit, source="rollup" if rollup else "scan", note=note)
+        if ctx.explain:
+            leg["explain"] = summarize_cassandra_traces(traces)
+        return leg
+
+    def _group_rollup(self, ctx, dimensions, filters):
+        start, end = hour_window(filters.get("date_start"), filters.get("date_end"))
+        predicates, window = [], []
+        if start:
+            predicates.append("hour >= ?")
+            window.append(hour_start(start))
+        if end:
+            predicates.append("hour <= ?")
+            window.append(hour_start(end))
+        select = ("SELECT event_type, hour, event_count, duration_sum, duration_min, duration_max, partial_id, rebuilt "
+                  "FROM rollup_hourly")
+        # Une partition par type d'événement demandé, sinon toute la table (une ligne par heure et par chargement)
+        if "event_type" in filters:
+            ctx.query = f"{select} WHERE " + " AND ".join(["event_type = ?"] + predicates)
+            requests = [[event_type] + window for event_type in filters["event_type"]]
+        else:
+            ctx.query = select + (" WHERE " + " AND ".join(predicates) + " ALLOW FILTERING" if predicates else "")
+            requests = [window]
+        statement = self._prepare(ctx.query)
+        with ctx.phase("query"):
+            cutoff = self._rollup_cutoff()
+            futures = [self.session.execute_async(statement, params, trace=ctx.explain) for params in requests]
+        partials, traces, ctx.rows = {}, [], 0
+        for future in futures:
+            with ctx.phase("fetch"):
+                result_set = future.result()
+                rows = list(result_set)
+            if ctx.explain:
+                traces.extend(result_set.get_all_query_traces())
+            ctx.rows += len(rows)
+            with ctx.phase("client"):
+                for r in rows:
+                    if not counted(r, cutoff):
+                        continue
+                    hour = hour_of(r.hour)
+                    values = {"event_type": r.event_type, "hour": hour, "day": hour[:10]}
+                    key = tuple(values[name] for name in dimensions)
+                    partial = {"count": r.event_count, "sum": r.duration_sum,
+                               "min": r.duration_min, "max": r.duration_max}
+                    if key in partials:
+                        merge(partials[key], partial)
+                    else:
+                        partials[key] = partial
+        return partials, "Table rollup_hourly (agrégats par heure)", traces
+
+    def _group_scan(self, ctx, dimensions, field, filters):
+        start, end = parse_date_bounds(filters.get("date_start"), filters.get("date_end"))
+        # Prédicats envoyés à Cassandra : fenêtre sur la clé de clustering, égalités à une seule valeur
+        # non nulle (CQL refuse `= null`) ; les listes de plusieurs valeurs et les null sont filtrés
+        # sur les colonnes reçues
+        predicates, pushed, residual = [], [], {}
+        if start:
+            predicates.append("timestamp >= ?")
+            pushed.append(start)
+        if end:
+            predicates.append("timestamp <= ?")
+            pushed.append(end)
+        for name in ("event_type", "product_id"):
+            if name in filters and len(filters[name]) == 1 and filters[name][0] is not None:
+                predicates.append(f"{name} = ?")
+                pushed.append(filters[name][0])
+            elif name in filters:
+                residual[name] = filters[name]
+        needed = {name for name in dimensions if name in ("event_type", "product_id", "user_id")} | set(residual)
+        if {"hour", "day"}.intersection(dimensions):
+            needed.add("timestamp")
+        selected = f"SELECT {', '.join(sorted(needed | {field}))} FROM logs_by_user WHERE "
+        filtering = " ALLOW FILTERING" if {"event_type", "product_id"}.intersection(
+            name for name in filters if name not in residual) else ""
+
+        if "user_id" in filters:
+            # Partitions demandées : lecture directe, fenêtre servie par la clé de clustering
+            ctx.query = selected + " AND ".join(["user_id = ?"] + predicates) + filtering
+            requests = [[user_id] + pushed for user_id in filters["user_id"]]
+            note = f"Lecture de {len(requests)} partitions + agrégation côté client"
+        else:
+            ctx.query = selected + " AND ".join(["token(user_id) > ?", "token(user_id) <= ?"] + predicates)
+            if predicates:
+                ctx.query += " ALLOW FILTERING"
+            requests = [[low, high] + pushed for low, high in token_ranges(SCAN_SPLITS)]
+            note = f"Scan parallèle de {len(requests)} plages de tokens, agrégats partiels fusionnés"
+        statement = self._prepare(ctx.query)
+
+        with ctx.phase("query"):
+            futures = [self.session.execute_async(statement, params, trace=ctx.explain,
+                                                  execution_profile=COLUMNAR_PROFILE) for params in requests]
+        partials, traces, ctx.rows = {}, [], 0
+        for index, future in enumerate(futures):
+            with ctx.phase("first_row" if index == 0 else "fetch"):
+                result_set = future.result()
+                columns = concat_pages(result_set, result_set.column_names or ())
+            if ctx.explain:
+                traces.extend(result_set.get_all_query_traces())
+            if not column_length(columns):
+                continue
+            with ctx.phase("client"):
+                mask = np.ones(column_length(columns), dtype=bool)
+                for name, values in residual.items():
+                    mask &= isin(columns[name], values)
+                ctx.rows += int(mask.sum())
+                keys = []
+                for name in dimensions:
+                    if name in ("hour", "day"):
+                        keys.append((time_buckets(name, timestamps_ms(columns["timestamp"][mask])),
+                                     lambda bucket, name=name: format_bucket(name, bucket)))
+                    else:
+                        keys.append((columns[name][mask], None))
+                merge_partials(partials, partials_from_arrays(keys, columns[field][mask]))
+        return partials, note, traces
@@ -0,0 +1,706 @@
+"""
+Adapter "columnar" : moteur colonnaire en mémoire (dans le processus)
+
+Les logs sont chargés dans des colonnes NumPy typées :
+- event_type, product_id, description : encodage par dictionnaire (codes entiers)
+- timestamp : int64 (epoch en millisecondes)
+- user_id, session_duration_ms : int32
+Deux index sont construits au chargement :
+- index inversé token -> lignes sur description (prolongé avec les seules lignes ajoutées)
+- index par utilisateur : lignes triées par (user_id, timestamp DESC) + offsets par user_id
+Colonnes et index forment un snapshot figé : un ajout de logs construit le
+snapshot suivant à côté puis le publie en remplaçant une seule référence.
+
+Sans réseau ni sérialisation, il donne une borne basse de ce que les bases
+pourraient atteindre, et permet de benchmarker sans aucun container.
+
+Sous gunicorn, chaque worker a son propre store : les écritures passent par un
+journal partagé (COLUMNAR_SHARED_DIR, voir ColumnarJournal) que chaque worker
+relit, pour que tous servent les mêmes données.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from scripts.backends.base import Backend, check_numeric_field, parse_date_bounds, timelines_leg
+from scripts.common.changelog import write_json_atomic
+from scripts.common.filters import Eq, In, Plan, Range, Text, conjuncts, task1_filter
+from scripts.common.groupby import FILTER_FIELDS, format_bucket, group_leg, partials_from_arrays, time_buckets
+from scripts.common.sketches import exact_summary
+from scripts.common.tokens import tokenize
+
+DATA_FILE = os.getenv('DATA_FILE', '/app/scripts/data/ecommerce_logs.json')
+# Journal partagé entre les workers ; vide : store propre au processus (scripts de tâches, tests)
+COLUMNAR_SHARED_DIR = os.getenv('COLUMNAR_SHARED_DIR', '/tmp/nosql_tp/columnar')
+# Délai maximal avant qu'un worker voie les écritures et bascules faites par un autre
+COLUMNAR_SYNC_TTL_S = float(os.getenv('COLUMNAR_SYNC_TTL_S', 1))
+
+# Logs par ligne du journal
+JOURNAL_BATCH_SIZE = 5000
+# Génération de départ : DATA_FILE puis les logs ajoutés
+INITIAL_POINTER = {"generation": "initial", "version": None, "data_file": True}
+
+def to_epoch_ms(values):
+    return np.array(values, dtype="datetime64[ms]").astype(np.int64)
+
+
+class Dictionary:
+    """Encodage par dictionnaire : valeur <-> code entier (None -> -1)"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self.codes.get(value, -2)
+
+    def decode(self, code):
+        return self.values[code] if code >= 0 else None
+
+
+class ColumnarSnapshot:
+    """
+    Colonnes + index figés : jamais modifiés après construction. Une requête lit un seul snapshot
+    du début à la fin ; les dictionnaires, partagés, ne font que grandir (codes existants stables).
+    """
+
+    def __init__(self, events, products, descriptions, log_ids=None, timestamp=None, user_id=None,
+                 event_code=None, product_code=None, description_code=None, duration=None, token_index=None):
+        self.events = events
+        self.products = products
+        self.descriptions = descriptions
+        self.log_ids = log_ids if log_ids is not None else np.empty(0, dtype=object)
+        self.timestamp = timestamp if timestamp is not None else np.empty(0, dtype=np.int64)
+        self.user_id = user_id if user_id is not None else np.empty(0, dtype=np.int32)
+        self.event_code = event_code if event_code is not None else np.empty(0, dtype=np.int16)
+        self.product_code = product_code if product_code is not None else np.empty(0, dtype=np.int32)
+        self.description_code = description_code if description_code is not None else np.empty(0, dtype=np.int32)
+        self.duration = duration if duration is not None else np.empty(0, dtype=np.int32)
+        self.token_index = token_index or {}
+
+        # Index utilisateur : tri par (user_id ASC, timestamp DESC)
+        self.user_order = np.lexsort((-self.timestamp, self.user_id))
+        sorted_users = self.user_id[self.user_order]
+        self.user_keys, starts = np.unique(sorted_users, return_index=True)
+        self.user_offsets = np.append(starts, len(sorted_users)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def rows_for_tokens(self, tokens):
+        """
+        Préfiltre d'une recherche par sous-chaîne : lignes dont, pour chaque token cherché, un token
+        de la description le contient ("critiq" -> "critique"). Sur-ensemble du résultat, la
+        sous-chaîne exacte est vérifiée ensuite sur les candidates
+        """
+        rows = None
+        for token in tokens:
+            parts = [postings for key, postings in self.token_index.items() if token in key]
+            if not parts:
+                return np.empty(0, dtype=np.int64)
+            postings = parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+            rows = postings if rows is None else np.intersect1d(rows, postings, assume_unique=True)
+        return rows
+
+    def user_rows(self, user_id, limit):
+        position = np.searchsorted(self.user_keys, user_id)
+        if position >= len(self.user_keys) or self.user_keys[position] != user_id:
+            return np.empty(0, dtype=np.int64)
+        start, end = self.user_offsets[position], self.user_offsets[position + 1]
+        return self.user_order[start:min(end, start + limit)]
+
+    def columns(self, rows, fields):
+        """Colonnes décodées (valeurs réelles) des lignes `rows`, pour les prédicats résiduels"""
+        decoded = {}
+        for field in fields:
+            if field in ("event_type", "product_id", "description"):
+                dictionary, codes = {"event_type": (self.events, self.event_code),
+                                     "product_id": (self.products, self.product_code),
+                                     "description": (self.descriptions, self.description_code)}[field]
+                # Code -1 (valeur nulle) -> dernier élément, None
+                decoded[field] = np.array(dictionary.values + [None], dtype=object)[codes[rows]]
+            elif field == "timestamp":
+                decoded[field] = self.timestamp[rows].astype("datetime64[ms]")
+            elif field == "log_id":
+                decoded[field] = self.log_ids[rows]
+            else:
+                decoded[field] = (self.user_id if field == "user_id" else self.duration)[rows]
+        return decoded
+
+    def row_to_dict(self, row):
+        return {
+            "log_id": self.log_ids[row],
+            "timestamp": np.datetime64(int(self.timestamp[row]), "ms").astype(datetime).isoformat(),
+            "user_id": int(self.user_id[row]),
+            "event_type": self.events.decode(int(self.event_code[row])),
+            "product_id": self.products.decode(int(self.product_code[row])),
+            "session_duration_ms": int(self.duration[row]),
+            "description": self.descriptions.decode(int(self.description_code[row]))
+        }
+
+
+class ColumnarStore:
+    """Logs en attente + snapshot publié ; chaque ajout construit un nouveau snapshot à côté"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.events = Dictionary()
+            self.products = Dictionary()
+            self.descriptions = Dictionary()
+            self.known_ids = set()
+            self._pending = []
+            self._tokens_by_code = {}  # code de description -> tokens (chaque texte découpé une fois)
+            self.snapshot = ColumnarSnapshot(self.events, self.products, self.descriptions)
+
+    def __len__(self):
+        return len(self.snapshot) + len(self._pending)
+
+    def append(self, logs, skip_known=False):
+        """Ajoute des logs ; avec skip_known, ceux dont le log_id est déjà présent sont ignorés"""
+        with self._lock:
+            if skip_known:
+                logs = [log for log in logs if str(log["log_id"]) not in self.known_ids]
+            self.known_ids.update(str(log["log_id"]) for log in logs)
+            self._pending.extend(logs)
+            return len(logs)
+
+    def ensure_built(self):
+        """Intègre les logs en attente ; renvoie le snapshot publié (une seule affectation de référence)"""
+        if self._pending:
+            with self._lock:
+                if self._pending:
+                    logs, self._pending = self._pending, []
+                    self.snapshot = self._extend(self.snapshot, logs)
+        return self.snapshot
+
+    def _extend(self, base, logs):
+        description_code = np.array([self.descriptions.encode(l.get("description")) for l in logs], dtype=np.int32)
+        return ColumnarSnapshot(
+            self.events, self.products, self.descriptions,
+            log_ids=np.concatenate([base.log_ids, np.array([str(l["log_id"]) for l in logs], dtype=object)]),
+            timestamp=np.concatenate([base.timestamp, to_epoch_ms([l["timestamp"] for l in logs])]),
+            user_id=np.concatenate([base.user_id, np.array([l["user_id"] for l in logs], dtype=np.int32)]),
+            event_code=np.concatenate([
+                base.event_code, np.array([self.events.encode(l["event_type"]) for l in logs], dtype=np.int16)
+            ]),
+            product_code=np.concatenate([
+                base.product_code, np.array([self.products.encode(l.get("product_id")) for l in logs], dtype=np.int32)
+            ]),
+            description_code=np.concatenate([base.description_code, description_code]),
+            duration=np.concatenate([
+                base.duration, np.array([l["session_duration_ms"] for l in logs], dtype=np.int32)
+            ]),
+            token_index=self._extend_token_index(base.token_index, description_code, len(base))
+        )
+
+    def _extend_token_index(self, index, description_code, offset):
+        """
+        Index inversé token -> lignes (triées), prolongé avec les seules lignes ajoutées : les listes
+        des tokens absents du lot restent partagées avec l'ancien snapshot
+        """
+        order = np.argsort(description_code, kind="stable")
+        codes, starts = np.unique(description_code[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        added = {}
+        for code, start, end in zip(codes.tolist(), starts, ends):
+            if code < 0:
+                continue
+            rows = offset + order[start:end]
+            for token in self._tokens(code):
+                added.setdefault(token, []).append(rows)
+        index = dict(index)
+        for token, parts in added.items():
+            rows = np.sort(np.concatenate(parts))
+            # Lignes ajoutées après toutes les anciennes : la concaténation reste triée
+            index[token] = np.concatenate([index[token], rows]) if token in index else rows
+        return index
+
+    def _tokens(self, code):
+        tokens = self._tokens_by_code.get(code)
+        if tokens is None:
+            tokens = self._tokens_by_code[code] = set(tokenize(self.descriptions.values[code]))
+        return tokens
+
+
+class ColumnarJournal:
+    """
+    Écritures du moteur colonnaire partagées entre processus (workers gunicorn)
+
+    Une génération est un fichier JSON lines (un lot de logs par ligne) ;
+    generation.json désigne la génération servie, comme le pointeur de version
+    Cassandra. Vider les données ou publier une version change de génération ;
+    une écriture ajoute des lignes à la génération courante. Chaque worker
+    intègre les lignes ajoutées, ou reconstruit son store si la génération a changé.
+    """
+
+    def __init__(self, directory=COLUMNAR_SHARED_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pointer_path = os.path.join(directory, "generation.json")
+        self.lock_path = os.path.join(directory, "journal.lock")
+
+    def _path(self, generation):
+        return os.path.join(self.directory, f"{generation}.jsonl")
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def pointer(self):
+        try:
+            with open(self.pointer_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return dict(INITIAL_POINTER)
+
+    def switch(self, pointer):
+        """Change la génération servie ; renvoie le pointeur remplacé"""
+        with self._file_lock():
+            previous = self.pointer()
+            write_json_atomic(self.pointer_path, pointer)
+        return previous
+
+    def append(self, logs, skip_known=False, generation=None):
+        """Ajoute des logs à `generation` (par défaut : la génération servie, relue sous verrou)"""
+        payload = "".join(
+            json.dumps({"skip_known": skip_known, "logs": logs[offset:offset + JOURNAL_BATCH_SIZE]},
+                       default=str) + "\n"
+            for offset in range(0, len(logs), JOURNAL_BATCH_SIZE)
+        ).encode()
+        with self._file_lock():
+            generation = generation or self.pointer()["generation"]
+            with open(self._path(generation), "ab") as f:
+                f.write(payload)
+
+    def replay(self, generation, offset, store):
+        """Ajoute au store les lots écrits après `offset` (octets) ; renvoie le nouvel offset"""
+        try:
+            f = open(self._path(generation), "rb")
+        except FileNotFoundError:
+            return offset
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # écriture en cours dans un autre processus
+                batch = json.loads(line)
+                store.append(batch["logs"], skip_known=batch["skip_known"])
+                offset += len(line)
+        return offset
+
+    def remove(self, generation):
+        """Supprime une génération qui n'est plus servie"""
+        with self._file_lock():
+            if self.pointer()["generation"] == generation:
+                return
+            try:
+                os.remove(self._path(generation))
+            except FileNotFoundError:
+                pass
+
+
+class ColumnarBackend(Backend):
+    name = "columnar"
+
+    def __init__(self, data_file=DATA_FILE, shared_dir=COLUMNAR_SHARED_DIR, generation=None):
+        self.data_file = data_file
+        self.journal = ColumnarJournal(shared_dir) if shared_dir else None
+        self.store = ColumnarStore()
+        self._loaded = False
+        self.version = None
+        # Génération que reflète le store (None : pas encore lue) ; `_pinned` (version en chargement)
+        # ne suit pas le pointeur
+        self.generation = generation
+        self._pinned = generation
+        self._offset = 0  # octets du journal de la génération déjà intégrés
+        self._next_sync = 0.0
+        self._sync_lock = threading.Lock()
+        # (pointeur, store, génération, offset, version) remplacés par la dernière publication,
+        # gardés jusqu'à drop_version
+        self._previous = None
+
+    # ============ ADMINISTRATION ============
+
+    def acquire(self):
+        self._sync()
+        # Snapshot figé : une requête lit les mêmes colonnes du début à la fin
+        return self.store.ensure_built()
+
+    def _load_data_file(self, store):
+        if self.data_file and os.path.exists(self.data_file):
+            with open(self.data_file, "r") as f:
+                store.append(json.load(f))
+
+    def _sync(self, force=False):
+        """Intègre les écritures des autres workers (au plus toutes les COLUMNAR_SYNC_TTL_S secondes)"""
+        if self.journal is None:
+            # Premier accès : chargement du fichier de logs généré s'il existe
+            if not self._loaded:
+                self._loaded = True
+                if not len(self.store):
+                    self._load_data_file(self.store)
+            return
+        if not force and time.monotonic() < self._next_sync:
+            return
+        # Un seul thread relit le journal ; les autres lecteurs gardent le snapshot publié
+        if not self._sync_lock.acquire(blocking=force):
+            return
+        try:
+            self._next_sync = time.monotonic() + COLUMNAR_SYNC_TTL_S
+            if self._pinned:
+                pointer = {"generation": self._pinned, "version": self.version, "data_file": False}
+            else:
+                pointer = self.journal.pointer()
+            if pointer["generation"] != self.generation:
+                # Génération remplacée (vidage, publication) : nouveau store construit à côté
+                store = ColumnarStore()
+                if pointer.get("data_file"):
+                    self._load_data_file(store)
+                offset = self.journal.replay(pointer["generation"], 0, store)
+                store.ensure_built()
+                self.store, self.generation, self._offset = store, pointer["generation"], offset
+            else:
+                self._offset = self.journal.replay(self.generation, self._offset, self.store)
+            self.version = pointer.get("version")
+        finally:
+            self._sync_lock.release()
+
+    def _write(self, logs, skip_known=False):
+        if self.journal is None:
+            self._loaded = True
+            return self.store.append(logs, skip_known=skip_known)
+        if skip_known:
+            self._sync(force=True)
+            logs = [log for log in logs if str(log["log_id"]) not in self.store.known_ids]
+        if logs:
+            self.journal.append(logs, skip_known=skip_known, generation=self._pinned)
+            # Ce worker voit ses écritures tout de suite, les autres au plus tard après COLUMNAR_SYNC_TTL_S
+            self._sync(force=True)
+        return len(logs)
+
+    def ping(self):
+        return True
+
+    def setup(self):
+        pass
+
+    def clear(self):
+        if self.journal is None:
+            self.store.clear()
+            self._loaded = True
+            return
+        previous = self.journal.switch({"generation": f"g{uuid.uuid4().hex[:12]}", "version": self.version,
+                                        "data_file": False})
+        self._sync(force=True)
+        self.journal.remove(previous["generation"])
+
+    def count(self):
+        return len(self.acquire())
+
+    # ============ STATISTIQUES ============
+    # Colonnes en mémoire : le comptage exact est aussi immédiat que les compteurs
+
+    def counters(self):
+        return self.count_by_event_type()
+
+    def estimate_count(self):
+        return {"total": self.count(), "by_event_type": None, "relative_error": 0.0, "source": "memory"}
+
+    def count_by_event_type(self):
+        store = self.acquire()
+        codes, counts = np.unique(store.event_code, return_counts=True)
+        return {store.events.decode(int(code)): int(count) for code, count in zip(codes, counts)}
+
+    def disk_size(self):
+        # Pas de disque : mémoire occupée par les colonnes
+        store = self.acquire()
+        return int(sum(column.nbytes for column in (
+            store.timestamp, store.user_id, store.event_code, store.product_code,
+            store.description_code, store.duration, store.user_order, store.user_keys, store.user_offsets
+        )))
+
+    def bulk_write(self, logs, progress=None):
+        self._write(logs)
+        if progress:
+            progress(len(logs), len(logs))
+        return len(logs)
+
+    def upsert_logs(self, logs):
+        return self._write(logs, skip_known=True)
+
+    # ============ VERSIONS DU JEU DE DONNÉES ============
+    # Nouveau store construit à côté (génération du journal nommée par la version) ; la publication
+    # déplace le pointeur de génération : ce worker bascule tout de suite, les autres reconstruisent
+    # leur store depuis le journal au plus tard après COLUMNAR_SYNC_TTL_S (les requêtes en cours
+    # gardent l'ancien store, libéré par le ramasse-miettes)
+
+    def live_version(self):
+        self._sync()
+        return self.version
+
+    def staging(self, version):
+        staging = ColumnarBackend(data_file=None, shared_dir=self.journal and self.journal.directory,
+                                  generation=version)
+        staging._loaded = True
+        staging.version = version
+        return staging
+
+    def prepare_publish(self, staging):
+        staging.store.ensure_built()
+
+    def publish(self, staging, version):
+        pointer = {"generation": staging.generation, "version": version, "data_file": False}
+        if self.journal is None:
+            previous = {"generation": self.generation or INITIAL_POINTER["generation"], "version": self.version}
+        else:
+            previous = self.journal.switch(pointer)
+        with self._sync_lock:
+            self._previous = (previous, self.store, self.generation, self._offset, self.version)
+            self.store, self._loaded, self.version = staging.store, True, version
+            self.generation, self._offset = staging.generation, staging._offset
+        # L'ancien store reste disponible pour rollback jusqu'à drop_version
+        return previous["generation"]
+
+    def rollback(self, staging, retired, version):
+        previous, *state = self._previous
+        if self.journal is not None:
+            self.journal.switch(previous)
+        with self._sync_lock:
+            self.store, self.generation, self._offset, self.version = state
+        self._previous = None
+
+    def drop_version(self, retired):
+        if self._previous and self._previous[0]["generation"] == retired:
+            self._previous = None
+        if self.journal is not None:
+            self.journal.remove(retired)
+
+    def discard(self, staging):
+        staging.store.clear()
+        if self.journal is not None:
+            self.journal.remove(staging.generation)
+
+    # ============ TÂCHES ============
+
+    def plan_filter(self, node):
+        """Texte préfiltré par l'index inversé, égalités et plages sur les colonnes (codes), le reste en résiduel"""
+        plan = Plan()
+        for term in conjuncts(node):
+            if (isinstance(term, Text) and term.field == "description" and tokenize(term.text)
+                    and not plan.pushed_with("inverted_index")):
+                # L'index ne connaît que des tokens : il réduit les candidates, la sous-chaîne
+                # (sémantique du scan Cassandra et de la regex MongoDB) reste vérifiée en résiduel
+                plan.push(term, "inverted_index")
+                plan.keep(term)
+            elif isinstance(term, (Eq, In)) and term.field in ("event_type", "product_id", "user_id"):
+                plan.push(term, "columns")
+            elif isinstance(term, Range) and term.field in ("timestamp", "session_duration_ms"):
+                plan.push(term, "columns")
+            else:
+                plan.keep(term)
+        return plan
+
+    @staticmethod
+    def _column_mask(store, term, rows):
+        if isinstance(term, Range):
+            if term.field == "timestamp":
+                column = store.timestamp[rows]
+                low, high = [to_epoch_ms([bound])[0] if bound is not None else None for bound in (term.low, term.high)]
+            else:
+                column, low, high = store.duration[rows], term.low, term.high
+            mask = np.ones(len(rows), dtype=bool)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+            return mask
+        values = [term.value] if isinstance(term, Eq) else term.values
+        if term.field == "user_id":
+            return np.isin(store.user_id[rows], values)
+        # Comparaison des codes : les valeurs absentes du dictionnaire ne correspondent à aucune ligne
+        dictionary, codes = ((store.events, store.event_code) if term.field == "event_type"
+                             else (store.products, store.product_code))
+        return np.isin(codes[rows], [dictionary.lookup(value) if value is not None else -1 for value in values])
+
+    def fulltext(self, ctx, event_type=None, search_text=None, date_start=None, date_end=None,
+                 mode=None, sample_size=5, where=None):
+        store = self.acquire()
+        plan = self.plan_filter(task1_filter(event_type, search_text, date_start, date_end, where))
+        ctx.query = plan.describe()
+
+        with ctx.phase("query"):
+            texts = plan.pushed_with("inverted_index")
+            rows = store.rows_for_tokens(tokenize(texts[0].text)) if texts else np.arange(len(store.timestamp))
+            mask = np.ones(len(rows), dtype=bool)
+            for term in plan.pushed_with("columns"):
+                mask &= self._column_mask(store, term, rows)
+            matches = rows[mask]
+            residual = plan.residual_filter()
+            if residual:
+                matches = matches[residual(store.columns(matches, plan.residual_fields()))]
+
+        with ctx.phase("serialize"):
+            selected = matches[:sample_size] if sample_size is not None else matches
+            leg = {
+                "count": int(len(matches)),
+                "mode": "inverted_index",
+                "note": "Colonnes NumPy en mémoire + index inversé",
+                "plan": plan.describe(),
+                "sample_data": [store.row_to_dict(row) for row in selected]
+            }
+        return leg
+
+    def latest_for_user(self, ctx, user_id, limit=100, sample_size=5, mode=None):
+        store = self.acquire()
+        ctx.query = {"user_id": user_id, "limit": limit}
+        with ctx.phase("query"):
+            rows = store.user_rows(user_id, limit)
+
+        with ctx.phase("serialize"):
+            selected = rows[:sample_size] if sample_size is not None else rows
+            leg = {
+                "count": int(len(rows)),
+                "note": "Index trié par (user_id, timestamp DESC)",
+                "sample_data": [store.row_to_dict(row) for row in selected]
+            }
+        return leg
+
+    def latest_for_users(self, ctx, user_ids, limit=100, sample_size=5):
+        store = self.acquire()
+        ctx.query = {"user_ids": len(user_ids), "limit": limit}
+        with ctx.phase("query"):
+            timelines = {user_id: store.user_rows(user_id, limit) for user_id in user_ids}
+
+        with ctx.phase("serialize"):
+            leg = timelines_leg(user_ids, timelines, sample_size, store.row_to_dict)
+        leg["note"] = "Index trié par (user_id, timestamp DESC), une tranche par utilisateur"
+        return leg
+
+    def aggregate(self, ctx, event_types, field="session_duration_ms", mode=None,
+                  date_start=None, date_end=None):
+        check_numeric_field(field)
+        store = self.acquire()
+        ctx.query = {"event_types": event_types, "date_start": date_start, "date_end": date_end}
+
+        with ctx.phase("query"):
+            window = self._window(store, date_start, date_end)
+            aggregations = {}
+            for event_type in event_types:
+                values = store.duration[window & (store.event_code == store.events.lookup(event_type))]
+                if len(values):
+                    total = int(values.sum(dtype=np.int64))
+                    aggregations[event_type] = {
+                        "count": int(len(values)),
+                        "sum_duration": total,
+                        "avg_duration": round(total / len(values), 2),
+                        "min_duration": int(values.min()),
+                        "max_duration": int(values.max())
+                    }
+
+        return {
+            "note": "Agrégation vectorisée en mémoire",
+            "aggregations": aggregations
+        }
+
+    def aggregate_approx(self, ctx, event_types, date_start=None, date_end=None):
+        # Toutes les colonnes sont en mémoire : valeurs exactes (erreur nulle), référence des sketches
+        store = self.acquire()
+        ctx.query = {"event_types": event_types, "date_start": date_start, "date_end": date_end}
+
+        with ctx.phase("query"):
+            window = self._window(store, date_start, date_end)
+            aggregations = {}
+            for event_type in event_types:
+                rows = window & (store.event_code == store.events.lookup(event_type))
+                if rows.any():
+                    aggregations[event_type] = exact_summary(store.duration[rows], store.user_id[rows])
+
+        return {
+            "source": "approx",
+            "note": "Valeurs exactes (np.quantile, np.unique) sur les colonnes en mémoire",
+            "aggregations": aggregations
+        }
+
+    def group_by(self, ctx, dimensions, metrics, field="session_duration_ms", filters=None, limit=1000):
+        check_numeric_field(field)
+        store = self.acquire()
+        filters = filters or {}
+        ctx.query = {"dimensions": dimensions, "filters": filters}
+
+        with ctx.phase("query"):
+            mask = self._window(store, filters.get("date_start"), filters.get("date_end"))
+            rows = np.arange(len(mask))
+            for name in FILTER_FIELDS:
+                if name in filters:
+                    # Même comparaison des codes que la Tâche 1 (null -> code -1)
+                    mask &= self._column_mask(store, In(name, filters[name]), rows)
+            # Dimensions codées : décodage une fois par valeur distincte, pas par ligne
+            keys = []
+            for name in dimensions:
+                if name == "event_type":
+                    keys.append((store.event_code[mask], store.events.decode))
+                elif name == "product_id":
+                    keys.append((store.product_code[mask], store.products.decode))
+                elif name == "user_id":
+                    keys.append((store.user_id[mask], None))
+                else:
+                    keys.append((time_buckets(name, store.timestamp[mask]),
+                                 lambda bucket, name=name: format_bucket(name, bucket)))
+            partials = partials_from_arrays(keys, store.duration[mask])
+        ctx.rows = int(mask.sum())
+
+        with ctx.phase("serialize"):
+            return group_leg(partials, dimensions, metrics, limit, source="columns",
+                             note="Clés codées + réductions NumPy par groupe")
+
+    @staticmethod
+    def _window(store, date_start, date_end):
+        timestamp = store.timestamp
+        window = np.ones(len(timestamp), dtype=bool)
+        start, end = parse_date_bounds(date_start, date_end)
+        if start:
+            window &= timestamp >= to_epoch_ms([start])[0]
+        if end:
+            window &= timestamp <= to_epoch_ms([end])[0]
+        return window
+
+    # ============ ROLLUPS ============
+    # Les colonnes en mémoire répondent déjà en un passage vectorisé : pas de table de rollups
+
+    def update_rollups(self, partials):
+        pass
+
+    def rebuild_rollups(self):
+        pass
+
+    def aggregate_rollup(self, ctx, event_types, date_start=None, date_end=None):
+        leg = self.aggregate(ctx, event_types, date_start=date_start, date_end=date_end)
+        leg["source"] = "raw"
+        leg["note"] = "Pas de rollups : agrégation vectorisée sur les colonnes"
+        return leg
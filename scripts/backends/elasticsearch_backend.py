@@ -0,0 +1,673 @@
+"""
+Adapter Elasticsearch
+
+Index `ecommerce_logs` (mapping dynamique : event_type.keyword pour les filtres exacts).
+Index `ecommerce_logs_rollup_hourly` : un document pré-agrégé par (event_type, heure).
+Recalculé dans un index à part, puis désigné par l'alias du même nom (bascule atomique).
+"""
+
+import os
+import threading
+import time
+
+from elasticsearch import helpers
+
+from scripts.backends.base import Backend, check_numeric_field, timelines_leg
+from scripts.common.connections import ES_INDEX, get_elasticsearch
+from scripts.common.explain import summarize_es_profile
+from scripts.common.filters import FIELDS, Eq, In, Or, Text, conjuncts, push_all, task1_filter
+from scripts.common.groupby import FILTER_FIELDS, group_leg
+from scripts.common.rollup import finalize, hour_window, partials
+from scripts.common.sketches import COMPRESSION, PERCENTILES, percentile_key
+
+ROLLUP_INDEX = f"{ES_INDEX}_rollup_hourly"
+# Alias posé sur l'index de rollups en cours de recalcul : les mises à jour y sont aussi appliquées
+BUILDING_SUFFIX = "_building"
+# Durée de cache de cet alias dans chaque processus (le recalcul attend autant avant de lire les logs)
+REBUILD_MARKER_TTL_S = float(os.getenv('ES_ROLLUP_REBUILD_MARKER_TTL_S', 1))
+
+# Agrégation `cardinality` (HyperLogLog++) : proche de l'exact sous ce seuil (max. 40000)
+CARDINALITY_THRESHOLD = 40000
+
+ROLLUP_MAPPINGS = {
+    "properties": {
+        "event_type": {"type": "keyword"},
+        "hour": {"type": "date", "format": "yyyy-MM-dd'T'HH"},
+        "count": {"type": "long"},
+        "sum": {"type": "long"},
+        "min": {"type": "integer"},
+        "max": {"type": "integer"}
+    }
+}
+
+# Fusion d'un agrégat partiel dans le document de la même heure (upsert si absent)
+ROLLUP_MERGE_SCRIPT = """
+ctx._source.count += params.count;
+ctx._source.sum += params.sum;
+if (params.min != null && (ctx._source.min == null || params.min < ctx._source.min)) { ctx._source.min = params.min; }
+if (params.max != null && (ctx._source.max == null || params.max > ctx._source.max)) { ctx._source.max = params.max; }
+"""
+
+# Agrégation composite : source de chaque dimension (clés dans l'ordre des dimensions)
+GROUP_SOURCES = {
+    "event_type": {"terms": {"field": "event_type.keyword"}},
+    "product_id": {"terms": {"field": "product_id.keyword", "missing_bucket": True}},
+    "user_id": {"terms": {"field": "user_id"}},
+    "hour": {"date_histogram": {"field": "timestamp", "calendar_interval": "hour", "format": "yyyy-MM-dd'T'HH"}},
+    "day": {"date_histogram": {"field": "timestamp", "calendar_interval": "day", "format": "yyyy-MM-dd"}}
+}
+# index.max_inner_result_window (100 par défaut) : au-delà, Tâche 2 par lot en _msearch
+MAX_INNER_RESULT_WINDOW = int(os.getenv('ES_MAX_INNER_RESULT_WINDOW', 100))
+# index.max_result_window : hits renvoyés au plus par une recherche (sample_size=None)
+MAX_RESULT_WINDOW = int(os.getenv('ES_MAX_RESULT_WINDOW', 10000))
+# Buckets par page de l'agrégation composite
+COMPOSITE_PAGE_SIZE = int(os.getenv('ES_COMPOSITE_PAGE_SIZE', 1000))
+
+
+def es_field(field):
+    # Filtres exacts des champs texte sur le sous-champ keyword (mapping dynamique)
+    return f"{field}.keyword" if FIELDS[field] in ("keyword", "uuid") else field
+
+
+def terms_filter(field, values):
+    """term / terms ; une valeur nulle correspond à un champ absent (null n'est pas indexé)"""
+    present = [value for value in values if value is not None]
+    clauses = []
+    if present:
+        clauses.append({"term": {es_field(field): present[0]}} if len(present) == 1
+                       else {"terms": {es_field(field): present}})
+    if len(present) < len(values):
+        clauses.append({"bool": {"must_not": [{"exists": {"field": field}}]}})
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+
+def compile_filter(node):
+    """Arbre de filtre (common/filters.py) -> requête bool ; le texte est cherché par `match` (score)"""
+    if isinstance(node, Text):
+        return {"bool": {"must": [{"match": {node.field: node.text}}]}}
+    if isinstance(node, Or):
+        return {"bool": {"should": [compile_filter(child) for child in node.children], "minimum_should_match": 1}}
+    must, filters = [], []
+    for child in conjuncts(node):
+        if isinstance(child, Text):
+            must.append({"match": {child.field: child.text}})
+        elif isinstance(child, Or):
+            filters.append(compile_filter(child))
+        elif isinstance(child, (Eq, In)):
+            filters.append(terms_filter(child.field, [child.value] if isinstance(child, Eq) else child.values))
+        else:
+            bounds = {key: bound.isoformat() if hasattr(bound, "isoformat") else bound
+                      for key, bound in (("gte", child.low), ("lte", child.high)) if bound is not None}
+            filters.append({"range": {child.field: bounds}})
+    return {"bool": {"must": must, "filter": filters}}
+
+
+def rollup_id(event_type, hour):
+    return f"{event_type}|{hour}"
+
+
+class ElasticsearchBackend(Backend):
+    name = "elasticsearch"
+
+    def __init__(self, index=ES_INDEX, rollup_index=ROLLUP_INDEX, loading=False):
+        # Noms lus par les requêtes : alias de la version publiée, ou index d'une version en chargement
+        self.index = index
+        self.rollup_index = rollup_index
+        # Version en chargement : pas de refresh périodique jusqu'à la publication
+        self.loading = loading
+        self._building = None  # (index en recalcul ou None, lu à)
+        self._building_lock = threading.Lock()
+
+    @property
+    def es(self):
+        return get_elasticsearch()
+
+    def _search(self, ctx, query, **kwargs):
+        if ctx.explain:
+            query["profile"] = True
+        ctx.query = query
+        with ctx.phase("query"):
+            return self.es.search(index=self.index, body=query, **kwargs)
+
+    # ============ ADMINISTRATION ============
+
+    def acquire(self):
+        return get_elasticsearch()
+
+    def ping(self):
+        self.es.options(request_timeout=5).cluster.health()
+
+    def setup(self):
+        if not self.es.indices.exists(index=self.index):
+            settings = {"refresh_interval": "-1"} if self.loading else None
+            self.es.indices.create(index=self.index, settings=settings)
+        self._create_rollup_index()
+
+    def _create_rollup_index(self):
+        if not self.es.indices.exists(index=self.rollup_index):
+            self.es.indices.create(index=self.rollup_index, mappings=ROLLUP_MAPPINGS)
+
+    def _delete(self, name):
+        # Un alias (version publiée) ne se supprime pas directement : supprimer les index qu'il désigne
+        if self.es.indices.exists(index=name):
+            self.es.indices.delete(index=list(self.es.indices.get(index=name)))
+
+    def clear(self):
+        for index in (self.index, self.rollup_index):
+            self._delete(index)
+
+    def count(self):
+        if not self.es.indices.exists(index=self.index):
+            return 0
+        return self.es.count(index=self.index)['count']
+
+    # ============ VERSIONS DU JEU DE DONNÉES ============
+    # Un index par version ; ES_INDEX et ROLLUP_INDEX deviennent des alias basculés atomiquement
+
+    def live_version(self):
+        if not self.es.indices.exists_alias(name=self.index):
+            return None
+        return next(iter(self.es.indices.get_alias(name=self.index)))[len(ES_INDEX) + 1:]
+
+    def staging(self, version):
+        return ElasticsearchBackend(index=f"{ES_INDEX}_{version}", rollup_index=f"{ROLLUP_INDEX}_{version}",
+                                    loading=True)
+
+    def prepare_publish(self, staging):
+        for index in (staging.index, staging.rollup_index):
+            if not self.es.indices.exists(index=index):
+                raise RuntimeError(f"Index absent : {index}")
+        # Refresh rétabli et forcé : la version est entièrement visible dès la bascule
+        self.es.indices.put_settings(index=staging.index, settings={"refresh_interval": None})
+        self.es.indices.refresh(index=[staging.index, staging.rollup_index])
+
+    def publish(self, staging, version):
+        actions, retired = [], []
+        for alias, target in ((self.index, staging.index), (self.rollup_index, staging.rollup_index)):
+            if self.es.indices.exists_alias(name=alias):
+                for index in self.es.indices.get_alias(name=alias):
+                    actions.append({"remove": {"index": index, "alias": alias}})
+                    retired.append(index)
+            elif self.es.indices.exists(index=alias):
+                # Premier passage : l'index historique porte le nom de l'alias, supprimé dans la même opération
+                actions.append({"remove_index": {"index": alias}})
+            actions.append({"add": {"index": target, "alias": alias}})
+        # Une seule requête _aliases : les lecteurs voient l'ancienne ou la nouvelle version, jamais un mélange
+        self.es.indices.update_aliases(actions=actions)
+        return retired
+
+    def rollback(self, staging, retired, version):
+        previous = {self.index: [], self.rollup_index: []}
+        for index in retired:
+            previous[self.rollup_index if index.startswith(ROLLUP_INDEX) else self.index].append(index)
+        actions = []
+        for alias, target in ((self.index, staging.index), (self.rollup_index, staging.rollup_index)):
+            if not previous[alias]:
+                # Premier passage : l'index historique a été supprimé par la bascule
+                raise RuntimeError(f"Pas de version précédente pour l'alias {alias}")
+            actions.append({"remove": {"index": target, "alias": alias}})
+            actions.extend({"add": {"index": index, "alias": alias}} for index in previous[alias])
+        self.es.indices.update_aliases(actions=actions)
+
+    def drop_version(self, indices):
+        if indices:
+            self.es.indices.delete(index=indices, ignore_unavailable=True)
+
+    def discard(self, staging):
+        self.drop_version([staging.index, staging.rollup_index])
+
+    # ============ STATISTIQUES ============
+
+    def counters(self):
+        if not self.es.indices.exists(index=self.rollup_index):
+            return {}
+        response = self.es.search(index=self.rollup_index, size=0, aggs={
+            "by_type": {"terms": {"field": "event_type", "size": 1000}, "aggs": {"count": {"sum": {"field": "count"}}}}
+        })
+        return {bucket["key"]: int(bucket["count"]["value"])
+                for bucket in response["aggregations"]["by_type"]["buckets"]}
+
+    def estimate_count(self):
+        # _cat/count : documents visibles depuis le dernier refresh (~1 s)
+        if not self.es.indices.exists(index=self.index):
+            return {"total": 0, "by_event_type": None, "relative_error": 0.0, "source": "_cat/count"}
+        rows = self.es.cat.count(index=self.index, format="json")
+        return {"total": int(rows[0]["count"]), "by_event_type": None, "relative_error": None,
+                "source": "_cat/count"}
+
+    def count_by_event_type(self):
+        if not self.es.indices.exists(index=self.index):
+            return {}
+        response = self.es.search(index=self.index, size=0, track_total_hits=True, aggs={
+            "by_type": {"terms": {"field": "event_type.keyword", "size": 1000}}
+        })
+        return {bucket["key"]: bucket["doc_count"] for bucket in response["aggregations"]["by_type"]["buckets"]}
+
+    def disk_size(self):
+        # Index des logs et des rollups, primaires et répliques
+        stats = self.es.indices.stats(index=[self.index, self.rollup_index], metric="store", ignore_unavailable=True)
+        return stats["_all"]["total"].get("store", {}).get("size_in_bytes", 0)
+
+    def bulk_write(self, logs, progress=None):
+        actions = [
+            {"_index": self.index, "_id": log["log_id"], "_source": log}
+            for log in logs
+        ]
+        success, _ = helpers.bulk(self.es, actions)
+        self.update_rollups(partials(logs))
+        if progress:
+            progress(success, len(logs))
+        return success
+
+    def upsert_logs(self, logs):
+        # op_type "create" : un log déjà indexé (même _id) répond 409 et n'est pas réécrit
+        actions = [
+            {"_op_type": "create", "_index": self.index, "_id": log["log_id"], "_source": log}
+            for log in logs
+        ]
+        inserted = []
+        for log, (ok, item) in zip(logs, helpers.streaming_bulk(self.es, actions, raise_on_error=False)):
+            if ok:
+                inserted.append(log)
+            elif item["create"].get("status") != 409:
+                raise RuntimeError(f"Échec de l'indexation de {log['log_id']} : {item['create'].get('error')}")
+        self.update_rollups(partials(inserted))
+        return len(inserted)
+
+    # ============ ROLLUPS ============
+
+    def update_rollups(self, rollup_partials):
+        if not rollup_partials:
+            return
+        self._create_rollup_index()
+        # Pendant un recalcul, l'index en construction reçoit aussi les mises à jour (sinon perdues à la bascule)
+        targets = [self.rollup_index] + [index for index in [self._building_index()] if index]
+        helpers.bulk(self.es, self._rollup_actions(targets, rollup_partials))
+
+    @staticmethod
+    def _rollup_actions(targets, rollup_partials):
+        return [
+            {
+                "_op_type": "update",
+                "_index": target,
+                "_id": rollup_id(event_type, hour),
+                "script": {"source": ROLLUP_MERGE_SCRIPT, "params": partial},
+                "upsert": dict(partial, event_type=event_type, hour=hour),
+                "retry_on_conflict": 3
+            }
+            for target in targets
+            for (event_type, hour), partial in rollup_partials.items()
+        ]
+
+    def _building_index(self):
+        building = self._building
+        if building is None or time.monotonic() - building[1] > REBUILD_MARKER_TTL_S:
+            with self._building_lock:
+                marker = self.rollup_index + BUILDING_SUFFIX
+                index = next(iter(self.es.indices.get_alias(name=marker)), None) \
+                    if self.es.indices.exists_alias(name=marker) else None
+                building = self._building = (index, time.monotonic())
+        return building[0]
+
+    def rebuild_rollups(self):
+        """
+        Recalcul dans un index à part, puis bascule de l'alias en une requête _aliases : les lecteurs
+        gardent les anciens rollups jusqu'à la bascule. Un lot dont les logs sont lus par le recalcul
+        mais dont les rollups arrivent après la pose du marqueur peut être compté deux fois, jusqu'au
+        recalcul suivant.
+        """
+        if not self.es.indices.exists(index=self.index):
+            return
+        target = f"{ROLLUP_INDEX}_r{int(time.time() * 1000)}"
+        marker = self.rollup_index + BUILDING_SUFFIX
+        self.es.indices.create(index=target, mappings=ROLLUP_MAPPINGS, aliases={marker: {}})
+        try:
+            # Tous les processus voient le marqueur avant la lecture des logs
+            time.sleep(REBUILD_MARKER_TTL_S)
+            self._build_rollups(target)
+            self.es.indices.refresh(index=target)
+            self._switch_rollups(target, marker)
+        except Exception:
+            self.es.indices.delete(index=target, ignore_unavailable=True)
+            raise
+
+    def _switch_rollups(self, target, marker):
+        if self.es.indices.exists_alias(name=self.rollup_index):
+            # Anciens index de rollups supprimés dans la même opération que la bascule
+            actions = [{"remove_index": {"index": index}} for index in self.es.indices.get_alias(name=self.rollup_index)]
+        elif self.es.indices.exists(index=self.rollup_index):
+            # Premier recalcul : l'index historique porte le nom de l'alias
+            actions = [{"remove_index": {"index": self.rollup_index}}]
+        else:
+            actions = []
+        actions.append({"add": {"index": target, "alias": self.rollup_index}})
+        actions.append({"remove": {"index": target, "alias": marker}})
+        self.es.indices.update_aliases(actions=actions)
+
+    def _build_rollups(self, target):
+        # Rendre visibles les documents tout juste indexés
+        self.es.indices.refresh(index=self.index)
+        # Agrégation composite paginée (event_type, heure) sur l'index brut
+        composite = {
+            "size": 1000,
+            "sources": [
+                {"event_type": {"terms": {"field": "event_type.keyword"}}},
+                {"hour": {"date_histogram": {"field": "timestamp", "calendar_interval": "hour",
+                                             "format": "yyyy-MM-dd'T'HH"}}}
+            ]
+        }
+        rollup_partials = {}
+        while True:
+            result = self.es.search(index=self.index, size=0, aggs={
+                "rollup": {
+                    "composite": composite,
+                    "aggs": {"stats_duration": {"stats": {"field": "session_duration_ms"}}}
+                }
+            })
+            aggregation = result["aggregations"]["rollup"]
+            for bucket in aggregation["buckets"]:
+                stats = bucket["stats_duration"]
+                rollup_partials[(bucket["key"]["event_type"], bucket["key"]["hour"])] = {
+                    "count": bucket["doc_count"],
+                    "sum": int(stats["sum"]),
+                    "min": int(stats["min"]) if stats["min"] is not None else None,
+                    "max": int(stats["max"]) if stats["max"] is not None else None
+                }
+            if "after_key" not in aggregation:
+                break
+            composite["after"] = aggregation["after_key"]
+        # Fusion (pas de remplacement) : les mises à jour reçues pendant le recalcul sont conservées
+        helpers.bulk(self.es, self._rollup_actions([target], rollup_partials))
+
+    # ============ TÂCHES ============
+
+    def fulltext(self, ctx, event_type=None, search_text=None, date_start=None, date_end=None,
+                 mode=None, sample_size=5, where=None):
+        node = task1_filter(event_type, search_text, date_start, date_end, where)
+        query = {
+            "query": compile_filter(node) if node is not None else {"match_all": {}},
+            "track_total_hits": True
+        }
+        # Autant de hits que l'échantillon des autres bases (tous avec sample_size=None, dans la fenêtre ES)
+        result = self._search(ctx, query, size=min(sample_size, MAX_RESULT_WINDOW)
+                              if sample_size is not None else MAX_RESULT_WINDOW)
+
+        with ctx.phase("serialize"):
+            hits = result['hits']['hits']
+            leg = {
+                "count": result['hits']['total']['value'],
+                "mode": "match",
+                "plan": push_all(node).describe(),
+                "sample_data": [hit['_source'] for hit in hits]
+            }
+            if sample_size is None and leg["count"] > len(hits):
+                leg["note"] = f"Échantillon limité à {MAX_RESULT_WINDOW} hits (index.max_result_window)"
+        if ctx.explain:
+            leg["explain"] = summarize_es_profile(result.get('profile'))
+        return leg
+
+    def latest_for_user(self, ctx, user_id, limit=100, sample_size=5, mode=None):
+        query = {
+            "query": {"term": {"user_id": user_id}},
+            "sort": [{"timestamp": {"order": "desc"}}],
+            "size": limit
+        }
+        result = self._search(ctx, query)
+
+        with ctx.phase("serialize"):
+            hits = result['hits']['hits']
+            leg = {
+                "count": len(hits),
+                "sample_data": [hit['_source'] for hit in (hits[:sample_size] if sample_size is not None else hits)]
+            }
+        if ctx.explain:
+            leg["explain"] = summarize_es_profile(result.get('profile'))
+        return leg
+
+    def latest_for_users(self, ctx, user_ids, limit=100, sample_size=5):
+        if limit > MAX_INNER_RESULT_WINDOW:
+            return self._latest_for_users_msearch(ctx, user_ids, limit, sample_size)
+        # Un hit par utilisateur (collapse sur user_id), ses `limit` logs les plus récents en inner_hits
+        query = {
+            "query": {"terms": {"user_id": user_ids}},
+            "collapse": {
+                "field": "user_id",
+                "inner_hits": {"name": "latest", "size": limit, "sort": [{"timestamp": {"order": "desc"}}]}
+            },
+            "size": len(user_ids),
+            "_source": False,
+            "track_total_hits": False
+        }
+        result = self._search(ctx, query)
+
+        with ctx.phase("serialize"):
+            timelines = {
+                hit['fields']['user_id'][0]: [inner['_source'] for inner in hit['inner_hits']['latest']['hits']['hits']]
+                for hit in result['hits']['hits']
+            }
+            ctx.rows = sum(len(rows) for rows in timelines.values())
+            leg = timelines_leg(user_ids, timelines, sample_size, lambda source: source)
+        leg["note"] = "terms + collapse (inner_hits triés par timestamp)"
+        if ctx.explain:
+            leg["explain"] = summarize_es_profile(result.get('profile'))
+        return leg
+
+    def _latest_for_users_msearch(self, ctx, user_ids, limit, sample_size):
+        # inner_hits refusés au-delà de index.max_inner_result_window : une recherche par utilisateur,
+        # envoyées ensemble (_msearch)
+        searches = []
+        for user_id in user_ids:
+            searches.append({})
+            searches.append({
+                "query": {"term": {"user_id": user_id}},
+                "sort": [{"timestamp": {"order": "desc"}}],
+                "size": limit,
+                "track_total_hits": False
+            })
+        ctx.query = searches[1]
+        with ctx.phase("query"):
+            result = self.es.msearch(index=self.index, searches=searches)
+
+        with ctx.phase("serialize"):
+            timelines = {}
+            for user_id, response in zip(user_ids, result['responses']):
+                if 'error' in response:
+                    raise RuntimeError(f"user_id {user_id} : {response['error']}")
+                timelines[user_id] = [hit['_source'] for hit in response['hits']['hits']]
+            ctx.rows = sum(len(rows) for rows in timelines.values())
+            leg = timelines_leg(user_ids, timelines, sample_size, lambda source: source)
+        leg["note"] = f"_msearch, une recherche par utilisateur (limit > {MAX_INNER_RESULT_WINDOW})"
+        return leg
+
+    def aggregate(self, ctx, event_types, field="session_duration_ms", mode=None,
+                  date_start=None, date_end=None):
+        field = check_numeric_field(field)
+        filters = [{"terms": {"event_type.keyword": event_types}}]
+        if date_start or date_end:
+            bounds = {key: value for key, value in (("gte", date_start), ("lte", date_end)) if value}
+            filters.append({"range": {"timestamp": bounds}})
+        query = {
+            "size": 0,
+            "query": {"bool": {"filter": filters}},
+            "aggs": {
+                "by_event_type": {
+                    "terms": {"field": "event_type.keyword"},
+                    "aggs": {
+                        "stats_duration": {"stats": {"field": field}}
+                    }
+                }
+            }
+        }
+        result = self._search(ctx, query)
+
+        with ctx.phase("serialize"):
+            aggregations = {}
+            for bucket in result['aggregations']['by_event_type']['buckets']:
+                stats = bucket['stats_duration']
+                aggregations[bucket['key']] = {
+                    "count": bucket['doc_count'],
+                    "sum_duration": stats['sum'],
+                    "avg_duration": round(stats['avg'], 2),
+                    "min_duration": stats['min'],
+                    "max_duration": stats['max']
+                }
+            leg = {"aggregations": aggregations}
+        if ctx.explain:
+            leg["explain"] = summarize_es_profile(result.get('profile'))
+        return leg
+
+    def group_by(self, ctx, dimensions, metrics, field="session_duration_ms", filters=None, limit=1000):
+        field = check_numeric_field(field)
+        filters = filters or {}
+        # null : champ absent, comme MongoDB et Cassandra
+        conditions = [terms_filter(name, filters[name]) for name in FILTER_FIELDS if name in filters]
+        if filters.get("date_start") or filters.get("date_end"):
+            date_end = filters.get("date_end")
+            if date_end and len(date_end) == 10:
+                date_end += "T23:59:59.999"
+            bounds = {key: value for key, value in (("gte", filters.get("date_start")), ("lte", date_end)) if value}
+            conditions.append({"range": {"timestamp": bounds}})
+        composite = {"sources": [{name: GROUP_SOURCES[name]} for name in dimensions]}
+        partials, pages, after = {}, 0, None
+
+        # Pages triées par clé : on s'arrête dès que limit + 1 groupes sont lus (résultat tronqué)
+        while len(partials) <= limit:
+            composite["size"] = min(COMPOSITE_PAGE_SIZE, limit + 1 - len(partials))
+            if after:
+                composite["after"] = after
+            query = {
+                "size": 0,
+                "query": {"bool": {"filter": conditions}},
+                "aggs": {"groups": {"composite": dict(composite), "aggs": {"stats": {"stats": {"field": field}}}}}
+            }
+            result = self._search(ctx, query)
+            pages += 1
+            groups = result['aggregations']['groups']
+            with ctx.phase("client"):
+                for bucket in groups['buckets']:
+                    stats = bucket['stats']
+                    partials[tuple(bucket['key'][name] for name in dimensions)] = {
+                        "count": bucket['doc_count'],
+                        "sum": int(stats['sum']),
+                        "min": int(stats['min']) if stats['count'] else None,
+                        "max": int(stats['max']) if stats['count'] else None
+                    }
+            after = groups.get('after_key')
+            if not after or not groups['buckets']:
+                break
+
+        with ctx.phase("serialize"):
+            leg = group_leg(partials, dimensions, metrics, limit, source="composite", pages=pages,
+                            note=f"Agrégation composite paginée ({COMPOSITE_PAGE_SIZE} buckets par page)")
+        if ctx.explain:
+            leg["explain"] = summarize_es_profile(result.get('profile'))
+        return leg
+
+    def aggregate_rollup(self, ctx, event_types, date_start=None, date_end=None):
+        start, end = hour_window(date_start, date_end)
+        filters = [{"terms": {"event_type": event_types}}]
+        if start or end:
+            filters.append({"range": {"hour": {key: value for key, value in (("gte", start), ("lte", end)) if value}}})
+        query = {
+            "size": 0,
+            "query": {"bool": {"filter": filters}},
+            "aggs": {
+                "by_event_type": {
+                    "terms": {"field": "event_type", "size": max(len(event_types), 1)},
+                    "aggs": {
+                        "count": {"sum": {"field": "count"}},
+                        "sum": {"sum": {"field": "sum"}},
+                        "min": {"min": {"field": "min"}},
+                        "max": {"max": {"field": "max"}}
+                    }
+                }
+            }
+        }
+        if ctx.explain:
+            query["profile"] = True
+        ctx.query = query
+        with ctx.phase("query"):
+            result = self.es.search(index=self.rollup_index, body=query)
+
+        with ctx.phase("serialize"):
+            buckets = result['aggregations']['by_event_type']['buckets']
+            aggregations = finalize([
+                (bucket['key'], {
+                    "count": int(bucket['count']['value']),
+                    "sum": int(bucket['sum']['value']),
+                    "min": int(bucket['min']['value']) if bucket['min']['value'] is not None else None,
+                    "max": int(bucket['max']['value']) if bucket['max']['value'] is not None else None
+                })
+                for bucket in buckets
+            ])
+            leg = {
+                "source": "rollup",
+                "buckets": sum(bucket['doc_count'] for bucket in buckets),
+                "note": f"Index pré-agrégé {self.rollup_index}",
+                "aggregations": aggregations
+            }
+        if ctx.explain:
+            leg["explain"] = summarize_es_profile(result.get('profile'))
+        return leg
+
+    def aggregate_approx(self, ctx, event_types, date_start=None, date_end=None):
+        filters = [{"terms": {"event_type.keyword": event_types}}]
+        if date_start or date_end:
+            bounds = {key: value for key, value in (("gte", date_start), ("lte", date_end)) if value}
+            filters.append({"range": {"timestamp": bounds}})
+        # Le t-digest et le HyperLogLog++ d'Elasticsearch ne publient pas leur erreur (autre
+        # implémentation, autre fonction d'échelle que nos sketches) : valeurs seules, sans bornes
+        percents = [q * 100 for q in PERCENTILES]
+        query = {
+            "size": 0,
+            "query": {"bool": {"filter": filters}},
+            "aggs": {
+                "by_event_type": {
+                    "terms": {"field": "event_type.keyword"},
+                    "aggs": {
+                        "percentiles_duration": {"percentiles": {
+                            "field": "session_duration_ms",
+                            "percents": percents,
+                            "keyed": False,
+                            "tdigest": {"compression": COMPRESSION}
+                        }},
+                        "distinct_users": {"cardinality": {
+                            "field": "user_id", "precision_threshold": CARDINALITY_THRESHOLD
+                        }}
+                    }
+                }
+            }
+        }
+        result = self._search(ctx, query)
+
+        with ctx.phase("serialize"):
+            aggregations = {}
+            for bucket in result['aggregations']['by_event_type']['buckets']:
+                values = {round(item['key'], 6): item['value'] for item in bucket['percentiles_duration']['values']}
+                aggregations[bucket['key']] = {
+                    "count": bucket['doc_count'],
+                    "percentiles": {
+                        percentile_key(q): self._estimate(values.get(round(q * 100, 6)), "rank_error", 2)
+                        for q in PERCENTILES
+                    },
+                    "distinct_users": self._estimate(bucket['distinct_users']['value'], "relative_error")
+                }
+            leg = {
+                "source": "approx",
+                "note": "Agrégations percentiles (t-digest) + cardinality (HyperLogLog++), erreur non publiée",
+                "aggregations": aggregations
+            }
+        if ctx.explain:
+            leg["explain"] = summarize_es_profile(result.get('profile'))
+        return leg
+
+    @staticmethod
+    def _estimate(value, error_key, digits=None):
+        """Valeur estimée par Elasticsearch : même forme que les sketches, erreur et bornes inconnues (null)"""
+        return {
+            "value": round(value, digits) if value is not None else None,
+            error_key: None,
+            "bounds": None
+        }
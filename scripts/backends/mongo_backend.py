@@ -0,0 +1,541 @@
+"""
+Adapter MongoDB
+
+Collection `logs_ecommerce` : timestamps stockés en chaînes ISO,
+index user_id, index texte sur description et index multikey sur
+description_tokens (tokens normalisés calculés à l'ingestion).
+
+Collection `logs_ecommerce_rollup_hourly` : un document par (event_type, heure),
+maintenu par $merge à chaque insertion et reconstruit par $out.
+
+Versions du jeu de données : les lecteurs suivent un pointeur (collection
+dataset_versions) qui désigne la paire de collections publiée.
+"""
+
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from scripts.backends.base import Backend, check_numeric_field, timelines_leg
+from scripts.common.columns import column_array
+from scripts.common.connections import MONGO_COLLECTION, MONGO_DB, get_mongo_client
+from scripts.common.explain import mongo_explain_find, mongo_explain_aggregate
+from scripts.common.filters import And, Eq, In, Or, Text, push_all, task1_filter
+from scripts.common.groupby import FILTER_FIELDS, group_leg
+from scripts.common.rollup import finalize, hour_window, partials
+from scripts.common.sketches import event_sketches, merge_sketches
+from scripts.common.timing import drain
+from scripts.common.tokens import tokenize
+
+# Index composé de la Tâche 2 (accès ciblé + tri)
+TIMELINE_INDEX = "idx_user_timestamp"
+
+# Documents par lot de sketches (agrégation approchée)
+SKETCH_BATCH = 10000
+
+ROLLUP_COLLECTION = f"{MONGO_COLLECTION}_rollup_hourly"
+
+# Clé de groupe de chaque dimension (timestamps en chaînes ISO : heure et jour sont des préfixes)
+GROUP_KEYS = {
+    "event_type": "$event_type",
+    "product_id": "$product_id",
+    "user_id": "$user_id",
+    "hour": {"$substrBytes": ["$timestamp", 0, 13]},
+    "day": {"$substrBytes": ["$timestamp", 0, 10]}
+}
+
+# Pointeur de version : {_id: MONGO_COLLECTION, version, collection, rollups} ; sans pointeur (ou
+# document d'avant le pointeur, sans noms) : collections d'origine
+DATASET_META_COLLECTION = "dataset_versions"
+POINTER_ID = MONGO_COLLECTION
+POINTER_TTL_S = float(os.getenv('MONGO_VERSION_POINTER_TTL_S', 1))
+
+# Fusion d'un agrégat partiel dans le document existant de la même heure
+ROLLUP_MERGE = {
+    "into": ROLLUP_COLLECTION,
+    "on": "_id",
+    "whenMatched": [{"$set": {
+        "count": {"$add": ["$count", "$$new.count"]},
+        "sum": {"$add": ["$sum", "$$new.sum"]},
+        "min": {"$min": ["$min", "$$new.min"]},
+        "max": {"$max": ["$max", "$$new.max"]}
+    }}],
+    "whenNotMatched": "insert"
+}
+
+
+def serialize_docs(docs):
+    # Convertir ObjectId en string
+    for doc in docs:
+        doc['_id'] = str(doc['_id'])
+    return docs
+
+
+def compile_filter(node, mode="regex"):
+    """Arbre de filtre (common/filters.py) -> filtre MongoDB ; mode : traduction de la recherche texte"""
+    if isinstance(node, (And, Or)):
+        parts = [compile_filter(child, mode) for child in node.children]
+        if isinstance(node, Or):
+            return {"$or": parts}
+        # Champs distincts : un seul document de filtre, sinon $and
+        if len({key for part in parts for key in part}) == sum(len(part) for part in parts):
+            return {key: value for part in parts for key, value in part.items()}
+        return {"$and": parts}
+    if isinstance(node, Text):
+        if mode == "text":
+            return {"$text": {"$search": node.text}}
+        if mode == "tokens":
+            return {"description_tokens": {"$all": tokenize(node.text)}}
+        return {node.field: {"$regex": re.escape(node.text), "$options": "i"}}
+    if isinstance(node, Eq):
+        return {node.field: stored_value(node.value)}
+    if isinstance(node, In):
+        return {node.field: {"$in": [stored_value(value) for value in node.values]}}
+    return {node.field: {key: stored_value(bound) for key, bound in (("$gte", node.low), ("$lte", node.high))
+                         if bound is not None}}
+
+
+def stored_value(value):
+    # Timestamps stockés en chaînes ISO : bornes au même format
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def date_range(date_start, date_end):
+    # Timestamps stockés en chaînes ISO : une date_end seule couvre toute la journée
+    bounds = {}
+    if date_start:
+        bounds["$gte"] = date_start
+    if date_end:
+        bounds["$lte"] = date_end + "T23:59:59" if len(date_end) == 10 else date_end
+    return bounds
+
+
+class MongoBackend(Backend):
+    name = "mongodb"
+
+    def __init__(self, collection_name=None, rollup_name=None):
+        # Noms fixés : version en cours de chargement ; None : version publiée (pointeur)
+        self._names = (collection_name, rollup_name) if collection_name else None
+        self._pointer = None  # (collection, rollups, version, lu à)
+        self._pointer_lock = threading.Lock()
+
+    @property
+    def collection_name(self):
+        return self._names[0] if self._names else self._read_pointer()[0]
+
+    @property
+    def rollup_name(self):
+        return self._names[1] if self._names else self._read_pointer()[1]
+
+    def _meta(self):
+        return get_mongo_client()[MONGO_DB][DATASET_META_COLLECTION]
+
+    def _read_pointer(self):
+        pointer = self._pointer
+        if pointer is None or time.monotonic() - pointer[3] > POINTER_TTL_S:
+            with self._pointer_lock:
+                meta = self._meta().find_one({"_id": POINTER_ID}) or {}
+                pointer = self._pointer = (meta.get("collection", MONGO_COLLECTION),
+                                           meta.get("rollups", ROLLUP_COLLECTION),
+                                           meta.get("version"), time.monotonic())
+        return pointer
+
+    def _write_pointer(self, collection_name, rollup_name, version):
+        self._meta().replace_one({"_id": POINTER_ID}, {
+            "collection": collection_name, "rollups": rollup_name, "version": version,
+            "switched_at": datetime.now().isoformat()
+        }, upsert=True)
+        # Ce processus bascule immédiatement, les autres au plus tard après POINTER_TTL_S
+        with self._pointer_lock:
+            self._pointer = (collection_name, rollup_name, version, time.monotonic())
+
+    @property
+    def collection(self):
+        return get_mongo_client()[MONGO_DB][self.collection_name]
+
+    @property
+    def rollups(self):
+        return get_mongo_client()[MONGO_DB][self.rollup_name]
+
+    # ============ ADMINISTRATION ============
+
+    def acquire(self):
+        return self.collection
+
+    def ping(self):
+        get_mongo_client().admin.command('ping')
+
+    def setup(self):
+        # Les deux collections existent même vides (chargement sans logs, rollups jamais écrits)
+        db = get_mongo_client()[MONGO_DB]
+        existing = set(db.list_collection_names())
+        for name in (self.collection_name, self.rollup_name):
+            if name not in existing:
+                try:
+                    db.create_collection(name)
+                except CollectionInvalid:
+                    pass  # créée entre-temps par un autre processus
+        # Index pour accélérer les requêtes
+        self.collection.create_index("user_id")
+        # Clé des upserts idempotents (upsert_logs : propagation, chargement incrémental)
+        self.collection.create_index("log_id", unique=True)
+        # Index texte pour la recherche full-text (Tâche 1)
+        self.collection.create_index([("description", "text")])
+        # Index multikey sur les tokens (mode "tokens" de la Tâche 1)
+        self.collection.create_index("description_tokens")
+
+    def create_timeline_index(self):
+        self.collection.create_index([("user_id", 1), ("timestamp", DESCENDING)], name=TIMELINE_INDEX)
+
+    def drop_timeline_index(self):
+        if TIMELINE_INDEX in self.collection.index_information():
+            self.collection.drop_index(TIMELINE_INDEX)
+
+    def clear(self):
+        self.collection.delete_many({})
+        self.rollups.delete_many({})
+
+    def reset(self):
+        # Effacer l'ancienne collection pour un test propre
+        self.collection.drop()
+        self.rollups.drop()
+
+    def count(self):
+        return self.collection.count_documents({})
+
+    # ============ VERSIONS DU JEU DE DONNÉES ============
+    # Deux collections par version ; le pointeur désigne les deux à la fois et se remplace en une
+    # seule écriture (deux renameCollection successifs laisseraient voir une paire mélangée)
+
+    def live_version(self):
+        return self._read_pointer()[2]
+
+    def staging(self, version):
+        return MongoBackend(f"{MONGO_COLLECTION}_{version}", f"{ROLLUP_COLLECTION}_{version}")
+
+    def prepare_publish(self, staging):
+        existing = set(get_mongo_client()[MONGO_DB].list_collection_names())
+        missing = [name for name in (staging.collection_name, staging.rollup_name) if name not in existing]
+        if missing:
+            raise RuntimeError(f"Collections absentes : {', '.join(missing)}")
+
+    def publish(self, staging, version):
+        retired = [self.collection_name, self.rollup_name]
+        self._write_pointer(staging.collection_name, staging.rollup_name, version)
+        return retired
+
+    def rollback(self, staging, retired, version):
+        self._write_pointer(retired[0], retired[1], version)
+
+    def drop_version(self, retired):
+        db = get_mongo_client()[MONGO_DB]
+        for name in retired:
+            db.drop_collection(name)
+
+    def discard(self, staging):
+        staging.collection.drop()
+        staging.rollups.drop()
+
+    # ============ STATISTIQUES ============
+
+    def counters(self):
+        pipeline = [{"$group": {"_id": "$_id.event_type", "count": {"$sum": "$count"}}}]
+        return {doc["_id"]: doc["count"] for doc in self.rollups.aggregate(pipeline)}
+
+    def estimate_count(self):
+        # Compteur des métadonnées de la collection : pas de parcours, pas de filtre possible
+        return {"total": self.collection.estimated_document_count(), "by_event_type": None,
+                "relative_error": None, "source": "estimated_document_count"}
+
+    def count_by_event_type(self):
+        pipeline = [{"$group": {"_id": "$event_type", "count": {"$sum": 1}}}]
+        return {doc["_id"]: doc["count"] for doc in self.collection.aggregate(pipeline, allowDiskUse=True)}
+
+    def disk_size(self):
+        size = 0
+        for collection in (self.collection, self.rollups):
+            try:
+                for doc in collection.aggregate([{"$collStats": {"storageStats": {}}}]):
+                    size += doc["storageStats"]["storageSize"] + doc["storageStats"]["totalIndexSize"]
+            except OperationFailure:
+                pass  # collection pas encore créée
+        return size
+
+    def bulk_write(self, logs, progress=None):
+        # insert_many ajoute _id aux documents : insérer des copies pour ne pas modifier l'appelant
+        self.collection.insert_many([
+            dict(log, description_tokens=tokenize(log.get("description")))
+            for log in logs
+        ])
+        self.update_rollups(partials(logs))
+        if progress:
+            progress(len(logs), len(logs))
+        return len(logs)
+
+    def upsert_logs(self, logs):
+        # $setOnInsert : un log déjà présent n'est pas modifié ; seuls les nouveaux alimentent les rollups
+        result = self.collection.bulk_write([
+            UpdateOne({"log_id": log["log_id"]},
+                      {"$setOnInsert": dict(log, description_tokens=tokenize(log.get("description")))},
+                      upsert=True)
+            for log in logs
+        ], ordered=False)
+        inserted = [logs[index] for index in result.upserted_ids]
+        self.update_rollups(partials(inserted))
+        return len(inserted)
+
+    # ============ ROLLUPS ============
+
+    def update_rollups(self, rollup_partials):
+        if not rollup_partials:
+            return
+        documents = [
+            dict(partial, _id={"event_type": event_type, "hour": hour})
+            for (event_type, hour), partial in rollup_partials.items()
+        ]
+        # $documents + $merge : la fusion est faite par le serveur, sans lecture préalable
+        get_mongo_client()[MONGO_DB].aggregate([
+            {"$documents": documents},
+            {"$merge": dict(ROLLUP_MERGE, into=self.rollup_name)}
+        ])
+
+    def rebuild_rollups(self):
+        # $out remplace la collection de rollups de façon atomique
+        self.collection.aggregate([
+            {"$group": {
+                "_id": {"event_type": "$event_type", "hour": {"$substrBytes": ["$timestamp", 0, 13]}},
+                "count": {"$sum": 1},
+                "sum": {"$sum": "$session_duration_ms"},
+                "min": {"$min": "$session_duration_ms"},
+                "max": {"$max": "$session_duration_ms"}
+            }},
+            {"$out": self.rollup_name}
+        ])
+
+    # ============ TÂCHES ============
+
+    def fulltext(self, ctx, event_type=None, search_text=None, date_start=None, date_end=None,
+                 mode=None, sample_size=5, where=None):
+        mode = mode or "regex"
+        node = task1_filter(event_type, search_text, date_start, date_end, where)
+        # Tout le filtre est traduit dans la requête : aucun prédicat résiduel
+        mongo_filter = compile_filter(node, mode) if node is not None else {}
+        ctx.query = mongo_filter
+
+        with ctx.phase("query"):
+            cursor = self.collection.find(mongo_filter)
+        docs = drain(cursor, ctx.timer)
+
+        with ctx.phase("serialize"):
+            leg = {
+                "count": len(docs),
+                "mode": mode,
+                "plan": push_all(node).describe(),
+                "sample_data": serialize_docs(docs[:sample_size] if sample_size is not None else docs)
+            }
+        if ctx.explain:
+            leg["explain"] = mongo_explain_find(self.collection, mongo_filter)
+        return leg
+
+    def latest_for_user(self, ctx, user_id, limit=100, sample_size=5, mode=None):
+        ctx.query = {"filter": {"user_id": user_id}, "sort": {"timestamp": -1}, "limit": limit}
+        with ctx.phase("query"):
+            cursor = (
+                self.collection.find({"user_id": user_id})
+                .sort("timestamp", DESCENDING)
+                .limit(limit)
+            )
+        docs = drain(cursor, ctx.timer)
+
+        with ctx.phase("serialize"):
+            leg = {
+                "count": len(docs),
+                "note": "Avec index composé recommandé",
+                "sample_data": serialize_docs(docs[:sample_size] if sample_size is not None else docs)
+            }
+        if ctx.explain:
+            leg["explain"] = mongo_explain_find(
+                self.collection, {"user_id": user_id}, sort={"timestamp": -1}, limit=limit
+            )
+        return leg
+
+    def latest_for_users(self, ctx, user_ids, limit=100, sample_size=5):
+        # Un seul pipeline : $topN ne garde que les `limit` logs les plus récents de chaque
+        # utilisateur pendant le $group, sans trier tous les logs des utilisateurs demandés
+        pipeline = [
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$group": {
+                "_id": "$user_id",
+                "logs": {"$topN": {"n": limit, "sortBy": {"timestamp": -1}, "output": "$$ROOT"}}
+            }}
+        ]
+        ctx.query = pipeline
+        with ctx.phase("query"):
+            cursor = self.collection.aggregate(pipeline)
+        groups = drain(cursor, ctx.timer)
+        ctx.rows = sum(len(group["logs"]) for group in groups)
+
+        with ctx.phase("serialize"):
+            leg = timelines_leg(user_ids, {group["_id"]: group["logs"] for group in groups}, sample_size,
+                                lambda doc: serialize_docs([doc])[0])
+        leg["note"] = "$in + $group / $topN en un seul pipeline"
+        if ctx.explain:
+            leg["explain"] = mongo_explain_aggregate(self.collection, pipeline)
+        return leg
+
+    def aggregate(self, ctx, event_types, field="session_duration_ms", mode=None,
+                  date_start=None, date_end=None):
+        field = check_numeric_field(field)
+        match = {"event_type": {"$in": event_types}}
+        if date_start or date_end:
+            match["timestamp"] = date_range(date_start, date_end)
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": "$event_type",
+                "avg_duration": {"$avg": f"${field}"},
+                "sum_duration": {"$sum": f"${field}"},
+                "count": {"$sum": 1},
+                "min_duration": {"$min": f"${field}"},
+                "max_duration": {"$max": f"${field}"}
+            }}
+        ]
+        ctx.query = pipeline
+
+        # aggregate() exécute le pipeline et renvoie le premier batch
+        with ctx.phase("query"):
+            cursor = self.collection.aggregate(pipeline)
+        results = drain(cursor, ctx.timer)
+
+        with ctx.phase("serialize"):
+            aggregations = {}
+            for r in results:
+                aggregations[r['_id']] = {
+                    "count": r['count'],
+                    "sum_duration": r['sum_duration'],
+                    "avg_duration": round(r['avg_duration'], 2),
+                    "min_duration": r['min_duration'],
+                    "max_duration": r['max_duration']
+                }
+            leg = {"aggregations": aggregations}
+        if ctx.explain:
+            leg["explain"] = mongo_explain_aggregate(self.collection, pipeline)
+        return leg
+
+    def group_by(self, ctx, dimensions, metrics, field="session_duration_ms", filters=None, limit=1000):
+        field = check_numeric_field(field)
+        filters = filters or {}
+        # $match en tête : seul étage capable d'utiliser les index (user_id, timeline)
+        match = {name: {"$in": filters[name]} for name in FILTER_FIELDS if name in filters}
+        if filters.get("date_start") or filters.get("date_end"):
+            match["timestamp"] = date_range(filters.get("date_start"), filters.get("date_end"))
+        # $project : seuls les champs utiles traversent le $group
+        needed = {"event_type", "product_id", "user_id", field}.intersection(dimensions) | {field}
+        if {"hour", "day"}.intersection(dimensions):
+            needed.add("timestamp")
+        pipeline = [
+            {"$match": match},
+            {"$project": dict({name: 1 for name in sorted(needed)}, _id=0)},
+            {"$group": {
+                "_id": {name: GROUP_KEYS[name] for name in dimensions},
+                "count": {"$sum": 1},
+                "sum": {"$sum": f"${field}"},
+                "min": {"$min": f"${field}"},
+                "max": {"$max": f"${field}"}
+            }},
+            # Un groupe de plus que demandé : indique si le résultat est tronqué
+            {"$sort": {f"_id.{name}": 1 for name in dimensions}},
+            {"$limit": limit + 1}
+        ]
+        ctx.query = pipeline
+        with ctx.phase("query"):
+            cursor = self.collection.aggregate(pipeline, allowDiskUse=True)
+        results = drain(cursor, ctx.timer)
+
+        with ctx.phase("serialize"):
+            partials = {
+                tuple(r["_id"].get(name) for name in dimensions):
+                    {"count": r["count"], "sum": r["sum"], "min": r["min"], "max": r["max"]}
+                for r in results
+            }
+            leg = group_leg(partials, dimensions, metrics, limit, source="pipeline",
+                            note="$match / $project / $group / $sort / $limit (allowDiskUse)")
+        if ctx.explain:
+            leg["explain"] = mongo_explain_aggregate(self.collection, pipeline)
+        return leg
+
+    def aggregate_rollup(self, ctx, event_types, date_start=None, date_end=None):
+        start, end = hour_window(date_start, date_end)
+        rollup_filter = {"_id.event_type": {"$in": event_types}}
+        if start or end:
+            rollup_filter["_id.hour"] = {
+                key: value for key, value in (("$gte", start), ("$lte", end)) if value
+            }
+        ctx.query = rollup_filter
+
+        with ctx.phase("query"):
+            cursor = self.rollups.find(rollup_filter)
+        buckets = drain(cursor, ctx.timer)
+        ctx.rows = len(buckets)
+
+        with ctx.phase("client"):
+            aggregations = finalize([(doc["_id"]["event_type"], doc) for doc in buckets])
+        leg = {
+            "source": "rollup",
+            "buckets": len(buckets),
+            "note": f"Collection {self.rollup_name} (maintenue par $merge)",
+            "aggregations": aggregations
+        }
+        if ctx.explain:
+            leg["explain"] = mongo_explain_find(self.rollups, rollup_filter)
+        return leg
+
+    def aggregate_approx(self, ctx, event_types, date_start=None, date_end=None):
+        match = {"event_type": {"$in": event_types}}
+        if date_start or date_end:
+            match["timestamp"] = date_range(date_start, date_end)
+        # $percentile ne publie pas l'erreur de son t-digest et $addToSet garde tous les user_id en
+        # mémoire : seules les trois colonnes utiles sont lues, par lots de SKETCH_BATCH documents ;
+        # chaque lot produit ses sketches (t-digest + HyperLogLog), fusionnés comme les plages Cassandra
+        pipeline = [
+            {"$match": match},
+            {"$project": {"_id": 0, "event_type": 1, "user_id": 1, "session_duration_ms": 1}}
+        ]
+        ctx.query = pipeline
+        wanted = set(event_types)
+
+        with ctx.phase("query"):
+            cursor = self.collection.aggregate(pipeline, allowDiskUse=True, batchSize=SKETCH_BATCH)
+        # Le curseur est lu lot par lot : un seul lot de documents en mémoire à la fois
+        iterator = iter(cursor)
+        with ctx.phase("first_row"):
+            batch = list(islice(iterator, 1))
+        sketches, ctx.rows = {}, 0
+        while True:
+            with ctx.phase("fetch"):
+                batch.extend(islice(iterator, SKETCH_BATCH - len(batch)))
+            if not batch:
+                break
+            ctx.rows += len(batch)
+            with ctx.phase("client"):
+                columns = {name: column_array([doc.get(name) for doc in batch])
+                           for name in ("event_type", "user_id", "session_duration_ms")}
+                merge_sketches(sketches, event_sketches(columns, wanted))
+            batch = []
+
+        with ctx.phase("client"):
+            aggregations = {event_type: sketch.summary() for event_type, sketch in sketches.items()}
+            leg = {
+                "source": "approx",
+                "note": f"Lecture par lots de {SKETCH_BATCH}, t-digest + HyperLogLog fusionnés",
+                "aggregations": aggregations
+            }
+        if ctx.explain:
+            leg["explain"] = mongo_explain_aggregate(self.collection, pipeline)
+        return leg
@@ -0,0 +1 @@
+# Utilitaires partagés entre l'API, les benchmarks et les scripts d'insertion
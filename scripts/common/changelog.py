@@ -0,0 +1,362 @@
+"""
+Écriture sur une base primaire + propagation asynchrone vers les autres
+
+Les logs sont écrits dans la base primaire (REPLICATION_PRIMARY, Cassandra par
+défaut) puis ajoutés au journal local `Changelog` (JSON lines, fsync). Un
+`Propagator` par base secondaire relit le journal depuis son point de reprise
+(checkpoint), applique les lots avec `upsert_logs` (idempotent par log_id) et
+n'avance le checkpoint qu'après succès : un arrêt ou une erreur reprend au
+dernier lot non confirmé, et `replay` relit le journal depuis un offset donné.
+Chaque checkpoint porte la génération du journal (renouvelée par `reset`) : un
+lot commencé avant un reset ou un replay n'écrase pas le nouveau point de reprise.
+"""
+
+import bisect
+import fcntl
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+REPLICATION_PRIMARY = os.getenv('REPLICATION_PRIMARY', 'cassandra')
+# Dossier partagé (volume ./scripts) entre l'API et les scripts de chargement (primary_insert.py)
+CHANGELOG_DIR = os.getenv('CHANGELOG_DIR', '/app/scripts/data/changelog')
+PROPAGATION_BATCH_SIZE = int(os.getenv('PROPAGATION_BATCH_SIZE', 5000))
+PROPAGATION_RETRY_S = float(os.getenv('PROPAGATION_RETRY_S', 2.0))
+
+# Un repère (offset, position en octets) tous les INDEX_EVERY enregistrements
+INDEX_EVERY = 1000
+
+
+def write_json_atomic(path, data):
+    """Écriture atomique (fichier temporaire + rename) : jamais de checkpoint à moitié écrit"""
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+# ============================================================================
+# JOURNAL DES MODIFICATIONS
+# ============================================================================
+
+class Changelog:
+    """
+    Journal append-only : une ligne JSON par log, l'offset est le numéro de ligne
+
+    Plusieurs processus (workers gunicorn) peuvent partager le journal : les
+    écritures sont sérialisées par un verrou fcntl et chaque processus intègre
+    les lignes ajoutées par les autres avant de lire ou d'écrire.
+    """
+
+    def __init__(self, directory=CHANGELOG_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, "changelog.jsonl")
+        self.checkpoints_path = os.path.join(directory, "checkpoints.json")
+        self.lock_path = os.path.join(directory, "changelog.lock")
+        self.generation_path = os.path.join(directory, "generation")
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self._forget()
+        with self._lock, self._file_lock():
+            self._repair()
+            if not os.path.exists(self.generation_path):
+                self._new_generation()
+            self._sync()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _new_generation(self):
+        temporary = self.generation_path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temporary, self.generation_path)
+
+    @property
+    def generation(self):
+        """Identifiant du journal courant, renouvelé à chaque reset"""
+        try:
+            with open(self.generation_path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _forget(self):
+        self._marks = [(0, 0)]
+        self._end = 0
+        self._size = 0
+        self._inode = None
+
+    def _repair(self):
+        # Dernière ligne incomplète (arrêt brutal pendant une écriture) : tronquée
+        if not os.path.exists(self.path):
+            open(self.path, "ab").close()
+            return
+        with open(self.path, "rb+") as f:
+            position = f.seek(0, os.SEEK_END)
+            if position == 0:
+                return
+            f.seek(position - 1)
+            if f.read(1) == b"\n":
+                return
+            while position > 0:
+                start = max(0, position - 65536)
+                f.seek(start)
+                index = f.read(position - start).rfind(b"\n")
+                if index >= 0:
+                    f.truncate(start + index + 1)
+                    return
+                position = start
+            f.truncate(0)
+
+    def _sync(self):
+        """Intègre les lignes ajoutées depuis le dernier passage (par ce processus ou un autre)"""
+        stat = os.stat(self.path)
+        if stat.st_ino != self._inode or stat.st_size < self._size:
+            # Journal remplacé par reset (éventuellement dans un autre processus)
+            self._forget()
+            self._inode = stat.st_ino
+        if stat.st_size == self._size:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._size)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # écriture en cours dans un autre processus
+                self._size += len(line)
+                self._end += 1
+                if self._end % INDEX_EVERY == 0:
+                    self._marks.append((self._end, self._size))
+
+    @property
+    def end(self):
+        with self._lock:
+            self._sync()
+            return self._end
+
+    def append(self, logs):
+        """Ajoute des logs de façon durable ; renvoie (premier offset, offset de fin)"""
+        payload = "".join(json.dumps(log, default=str) + "\n" for log in logs).encode()
+        with self._lock, self._file_lock():
+            self._sync()
+            first = self._end
+            with open(self.path, "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self._sync()
+            self._appended.notify_all()
+            return first, self._end
+
+    def reset(self):
+        """Vide le journal et les checkpoints (rechargement complet des bases)"""
+        with self._lock, self._file_lock():
+            # Nouveau fichier (nouvel inode) : les autres processus détectent le remplacement
+            temporary = self.path + ".tmp"
+            open(temporary, "wb").close()
+            os.replace(temporary, self.path)
+            if os.path.exists(self.checkpoints_path):
+                os.remove(self.checkpoints_path)
+            self._new_generation()
+            self._forget()
+            self._sync()
+
+    def read(self, offset, limit):
+        """Logs [offset, offset + limit) du journal"""
+        with self._lock:
+            self._sync()
+            mark = self._marks[bisect.bisect_right(self._marks, (offset, float("inf"))) - 1]
+            end = min(self._end, offset + limit)
+        logs = []
+        if offset >= end:
+            return logs
+        current, position = mark
+        with open(self.path, "rb") as f:
+            f.seek(position)
+            for line in f:
+                if current >= end:
+                    break
+                if current >= offset:
+                    logs.append(json.loads(line))
+                current += 1
+        return logs
+
+    def wait(self, offset, timeout):
+        """Attend qu'un enregistrement existe après `offset` (réveil immédiat si ajouté par ce processus)"""
+        with self._lock:
+            self._sync()
+            if self._end <= offset:
+                self._appended.wait(timeout)
+                self._sync()
+            return self._end > offset
+
+    # ============ CHECKPOINTS ============
+
+    def _read_checkpoints(self):
+        try:
+            with open(self.checkpoints_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _offset(entry, generation):
+        # Ancien format (offset seul) : rattaché au journal courant
+        if isinstance(entry, int):
+            return entry
+        return entry["offset"] if entry and entry.get("generation") == generation else 0
+
+    def checkpoints(self):
+        """{consommateur: offset} dans le journal courant (un checkpoint d'une autre génération vaut 0)"""
+        generation = self.generation
+        return {consumer: self._offset(entry, generation) for consumer, entry in self._read_checkpoints().items()}
+
+    def checkpoint(self, consumer, offset, generation=None, expected=None):
+        """
+        Enregistre le point de reprise ; avec `generation` et `expected` (offset de départ du lot),
+        seulement si le journal n'a pas été remplacé et le checkpoint n'a pas bougé entre-temps
+        (reset, replay). Renvoie True si le checkpoint a été écrit.
+        """
+        with self._lock, self._file_lock():
+            current = self.generation
+            checkpoints = self._read_checkpoints()
+            if generation is not None:
+                if generation != current or self._offset(checkpoints.get(consumer), current) != expected:
+                    return False
+            checkpoints[consumer] = {"offset": offset, "generation": current}
+            write_json_atomic(self.checkpoints_path, checkpoints)
+            return True
+
+
+# ============================================================================
+# PROPAGATION
+# ============================================================================
+
+class Propagator:
+    """
+    Un thread par base secondaire : journal -> upsert_logs par lots, checkpoint après chaque lot
+
+    Avec plusieurs processus (workers gunicorn), un seul propage : celui qui
+    obtient le verrou propagator.lock, gardé jusqu'à sa sortie. Les autres
+    retentent à chaque appel de `start`.
+    """
+
+    def __init__(self, changelog, secondaries, batch_size=PROPAGATION_BATCH_SIZE, on_caught_up=None):
+        self.changelog = changelog
+        self.secondaries = secondaries
+        self.batch_size = batch_size
+        self.on_caught_up = on_caught_up
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._status = {name: {"propagated": 0, "batches": 0, "last_error": None} for name in secondaries}
+        self._stop = threading.Event()
+        self._lease = None
+
+    def _acquire_lease(self):
+        if self._lease is None:
+            lease = open(os.path.join(self.changelog.directory, "propagator.lock"), "a")
+            try:
+                fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lease.close()
+                return False
+            self._lease = lease
+        return True
+
+    def start(self):
+        with self._lock:
+            if not self._acquire_lease():
+                return
+            for name in self.secondaries:
+                thread = self._threads.get(name)
+                if thread is None or not thread.is_alive():
+                    thread = threading.Thread(target=self._run, args=(name,), name=f"propagator-{name}", daemon=True)
+                    self._threads[name] = thread
+                    thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, name):
+        prepared = False
+        while not self._stop.is_set():
+            offset = self.changelog.checkpoints().get(name, 0)
+            if not self.changelog.wait(offset, timeout=1.0):
+                continue
+            try:
+                if not prepared:
+                    self.secondaries[name].setup()
+                    prepared = True
+                self.propagate_batch(name, offset)
+            except Exception as e:
+                with self._lock:
+                    self._status[name]["last_error"] = {"error": str(e), "at": datetime.now().isoformat()}
+                self._stop.wait(PROPAGATION_RETRY_S)
+
+    def propagate_batch(self, name, offset):
+        """Applique un lot à partir de `offset` ; renvoie le nouvel offset"""
+        generation = self.changelog.generation
+        logs = self.changelog.read(offset, self.batch_size)
+        if not logs:
+            return offset
+        self.secondaries[name].upsert_logs(logs)
+        if not self.changelog.checkpoint(name, offset + len(logs), generation=generation, expected=offset):
+            # Journal vidé ou relu pendant le lot : on repart du checkpoint enregistré
+            return self.changelog.checkpoints().get(name, 0)
+        offset += len(logs)
+        with self._lock:
+            status = self._status[name]
+            status["propagated"] += len(logs)
+            status["batches"] += 1
+            status["last_error"] = None
+        if offset >= self.changelog.end and self.on_caught_up:
+            self.on_caught_up(name)
+        return offset
+
+    def drain(self, name):
+        """Propagation synchrone jusqu'à la fin du journal (scripts d'insertion)"""
+        backend = self.secondaries[name]
+        backend.setup()
+        offset = self.changelog.checkpoints().get(name, 0)
+        while offset < self.changelog.end:
+            offset = self.propagate_batch(name, offset)
+        return offset
+
+    def replay(self, name, from_offset=0):
+        """Relit le journal depuis `from_offset` (upserts idempotents : sans effet sur les logs déjà présents)"""
+        if name not in self.secondaries:
+            raise ValueError(f"Base secondaire inconnue : {name} (attendu : {', '.join(self.secondaries)})")
+        self.changelog.checkpoint(name, max(0, min(from_offset, self.changelog.end)))
+
+    def status(self):
+        checkpoints = self.changelog.checkpoints()
+        end = self.changelog.end
+        with self._lock:
+            secondaries = {}
+            for name in self.secondaries:
+                thread = self._threads.get(name)
+                offset = checkpoints.get(name, 0)
+                secondaries[name] = dict(self._status[name], checkpoint=offset, lag=end - offset,
+                                         running=thread is not None and thread.is_alive())
+        return {"changelog_end": end, "leader": self._lease is not None, "pid": os.getpid(),
+                "secondaries": secondaries}
+
+
+def write_primary(primary, changelog, logs):
+    """Écrit dans la base primaire puis dans le journal ; renvoie (nombre inséré, offsets)"""
+    # Primaire d'abord : le journal ne contient que des logs acceptés par la primaire
+    inserted = primary.bulk_write(logs)
+    first, end = changelog.append(logs)
+    return inserted, {"first": first, "end": end}
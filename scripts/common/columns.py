@@ -0,0 +1,102 @@
+"""
+Lecture colonnaire des résultats Cassandra
+
+`columnar_row_factory` remplace `named_tuple_factory` : chaque page décodée par
+le driver devient un seul dict {colonne: tableau NumPy} au lieu d'un namedtuple
+(puis d'un dict) par ligne. Les agrégations et le scan de la Tâche 1 calculent
+directement sur les colonnes ; seules les lignes renvoyées au client sont
+reconstruites.
+"""
+
+import numpy as np
+
+# Profil d'exécution du cluster qui utilise la row factory colonnaire
+COLUMNAR_PROFILE = "columnar"
+
+
+def column_array(values):
+    """Tableau 1D : typé (int, float, str...) si possible, sinon tableau d'objets (collections, nulls)"""
+    try:
+        array = np.array(values)
+        if array.ndim == 1:
+            return array
+    except ValueError:
+        pass  # collections de tailles différentes
+    array = np.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        array[index] = value
+    return array
+
+
+def columnar_row_factory(colnames, rows):
+    """Row factory du driver : une page -> [{colonne: tableau}]"""
+    columns = list(zip(*rows)) if rows else [()] * len(colnames)
+    return [{name: column_array(values) for name, values in zip(colnames, columns)}]
+
+
+def concat_pages(pages, colnames=()):
+    """Concatène les pages d'un ResultSet colonnaire"""
+    pages = list(pages)
+    if not pages:
+        return {name: np.array([]) for name in colnames}
+    if len(pages) == 1:
+        return pages[0]
+    return {name: np.concatenate([page[name] for page in pages]) for name in pages[0]}
+
+
+def column_length(columns):
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def numeric(column):
+    """Colonne numérique sans les valeurs nulles"""
+    if column.dtype == object:
+        column = np.array([v for v in column if v is not None])
+    return column
+
+
+def isin(column, values):
+    """Masque des lignes dont la valeur est dans `values` (colonnes d'objets avec None comprises)"""
+    if column.dtype == object:
+        wanted = set(values)
+        return np.fromiter((value in wanted for value in column), dtype=bool, count=len(column))
+    return np.isin(column, values)
+
+
+def summarize_column(column):
+    """Équivalent vectorisé de `summarize` : count / sum / avg / min / max"""
+    values = numeric(column)
+    if not len(values):
+        return {"count": len(column), "sum_duration": 0, "avg_duration": 0, "min_duration": 0, "max_duration": 0}
+    total = values.sum(dtype=np.int64).item()
+    return {
+        "count": len(column),
+        "sum_duration": total,
+        "avg_duration": round(total / len(values), 2),
+        "min_duration": values.min().item(),
+        "max_duration": values.max().item()
+    }
+
+
+def timestamps_ms(column):
+    return column.astype("datetime64[ms]").astype(np.int64)
+
+
+def to_ms(value):
+    return np.datetime64(value, "ms").astype(np.int64)
+
+
+def lowercase(column):
+    """Colonne texte en minuscules (valeurs nulles -> "")"""
+    if column.dtype == object:
+        column = np.array(["" if value is None else value for value in column], dtype=str)
+    return np.char.lower(column.astype(str))
+
+
+def row_at(columns, index):
+    """Reconstruit une ligne (dict de valeurs Python) à partir des colonnes"""
+    row = {}
+    for name, column in columns.items():
+        value = column[index]
+        row[name] = value.item() if isinstance(value, np.generic) else value
+    return row
@@ -0,0 +1,73 @@
+"""
+Compression HTTP des réponses des APIs Flask (gzip / brotli)
+
+L'encodage est choisi d'après Accept-Encoding (brotli préféré s'il est installé)
+pour les réponses JSON dépassant HTTP_COMPRESS_MIN_BYTES. Les réponses en flux
+(direct_passthrough) et déjà encodées ne sont pas touchées.
+
+HTTP_COMPRESSION : "br,gzip" (défaut), "gzip" ou "none".
+"""
+
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : gzip seul
+    brotli = None
+
+HTTP_COMPRESSION = [name.strip() for name in os.getenv('HTTP_COMPRESSION', 'br,gzip').split(',')
+                    if name.strip() and name.strip() != "none"]
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv('HTTP_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('HTTP_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('HTTP_BROTLI_QUALITY', 4))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson")
+
+
+def available_encodings(preferred=None):
+    encodings = preferred if preferred is not None else HTTP_COMPRESSION
+    return [name for name in encodings if name == "gzip" or (name == "br" and brotli is not None)]
+
+
+def accepted_encodings(header):
+    """Encodages acceptés par le client (q=0 exclus)"""
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def enable_compression(app, encodings=None):
+    """Ajoute la compression des réponses à une application Flask"""
+    encodings = available_encodings(encodings)
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add("Accept-Encoding")
+        if (not encodings or response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or "Content-Encoding" in response.headers
+                or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)):
+            return response
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding"))
+        encoding = next((name for name in encodings if name in accepted or "*" in accepted), None)
+        body = response.get_data()
+        if encoding is None or len(body) < HTTP_COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    return app
@@ -0,0 +1,178 @@
+"""
+Connexions partagées (pool) vers Cassandra, MongoDB et Elasticsearch
+
+Chaque client est créé une seule fois par processus puis réutilisé :
+le driver Cassandra, MongoClient et le client Elasticsearch gèrent
+eux-mêmes leur pool de connexions et sont thread-safe.
+
+Cassandra : routage token-aware (la requête part directement vers un réplica
+de la partition) et registre des requêtes préparées, préparées une seule fois
+par session. Une session par keyspace : chaque version du jeu de données a
+son keyspace (voir scripts/common/datasets.py). Les valeurs liées à une requête préparée fournissent au driver
+la clé de routage (routing key).
+
+Après un fork (workers gunicorn avec preload), `reset_after_fork` abandonne
+les clients hérités du processus parent : sockets et threads du driver ne
+survivent pas au fork, chaque worker ouvre ses propres connexions.
+
+Compression sur le réseau (variables d'environnement) :
+- CASSANDRA_COMPRESSION : "lz4" (défaut), "snappy" ou "none" (protocole natif)
+- MONGO_COMPRESSORS     : liste ordonnée négociée avec le serveur, ex. "zstd,snappy" ("" : aucune)
+- ES_HTTP_COMPRESS      : corps HTTP gzip vers Elasticsearch (1 / 0)
+"""
+
+import os
+import threading
+
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.connection import locally_supported_compressions
+from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
+from pymongo import MongoClient
+from elasticsearch import Elasticsearch
+
+from scripts.common.columns import COLUMNAR_PROFILE, columnar_row_factory
+
+# Configuration
+CASSANDRA_HOST = os.getenv('CASSANDRA_HOST', 'cassandra')
+CASSANDRA_PORT = int(os.getenv('CASSANDRA_PORT', 9042))
+CASSANDRA_DC = os.getenv('CASSANDRA_DC', 'datacenter1')
+MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
+MONGO_PORT = int(os.getenv('MONGO_PORT', 27017))
+ES_HOST = os.getenv('ES_HOST', 'elasticsearch')
+ES_PORT = int(os.getenv('ES_PORT', 9200))
+
+CASSANDRA_COMPRESSION = os.getenv('CASSANDRA_COMPRESSION', 'lz4')
+MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zstd,snappy')
+ES_HTTP_COMPRESS = os.getenv('ES_HTTP_COMPRESS', '1') == '1'
+
+KEYSPACE = "nosql_tp"
+MONGO_DB = "nosql_tp"
+MONGO_COLLECTION = "logs_ecommerce"
+ES_INDEX = "ecommerce_logs"
+
+_lock = threading.Lock()
+_cluster = None
+_sessions = {}
+_prepared = {}
+_mongo_client = None
+_es = None
+
+
+def cassandra_compression():
+    # Module lz4 / snappy absent (exécution hors Docker) : pas de compression plutôt qu'un échec de connexion
+    if CASSANDRA_COMPRESSION in locally_supported_compressions:
+        return CASSANDRA_COMPRESSION
+    return False
+
+
+def get_cassandra_cluster():
+    global _cluster
+    if _cluster is None:
+        with _lock:
+            if _cluster is None:
+                routing = TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=CASSANDRA_DC))
+                _cluster = Cluster(
+                    [CASSANDRA_HOST], port=CASSANDRA_PORT,
+                    compression=cassandra_compression(),
+                    execution_profiles={
+                        EXEC_PROFILE_DEFAULT: ExecutionProfile(load_balancing_policy=routing),
+                        # Scans : pages décodées en colonnes (voir scripts/common/columns.py)
+                        COLUMNAR_PROFILE: ExecutionProfile(load_balancing_policy=routing,
+                                                           row_factory=columnar_row_factory)
+                    }
+                )
+    return _cluster
+
+
+def get_cassandra_session(keyspace=KEYSPACE):
+    global _cluster
+    session = _sessions.get(keyspace)
+    if session is None:
+        cluster = get_cassandra_cluster()
+        with _lock:
+            session = _sessions.get(keyspace)
+            if session is None:
+                try:
+                    session = _sessions[keyspace] = cluster.connect(keyspace)
+                except Exception:
+                    if not _sessions:
+                        # Le driver arrête le Cluster après un échec : en recréer un au prochain appel
+                        cluster.shutdown()
+                        _cluster = None
+                    raise
+    return session
+
+
+def close_cassandra_session(keyspace):
+    """Ferme la session d'un keyspace supprimé (version remplacée du jeu de données)"""
+    with _lock:
+        session = _sessions.pop(keyspace, None)
+        for key in [key for key in _prepared if key[0] == keyspace]:
+            del _prepared[key]
+    if session is not None:
+        session.shutdown()
+
+
+def prepare(cql, keyspace=KEYSPACE):
+    """Requête préparée (une seule préparation par session et par texte CQL, paramètres `?`)"""
+    statement = _prepared.get((keyspace, cql))
+    if statement is None:
+        session = get_cassandra_session(keyspace)
+        with _lock:
+            statement = _prepared.get((keyspace, cql))
+            if statement is None:
+                statement = _prepared[(keyspace, cql)] = session.prepare(cql)
+    return statement
+
+
+def get_mongo_client():
+    global _mongo_client
+    if _mongo_client is None:
+        with _lock:
+            if _mongo_client is None:
+                options = {"compressors": MONGO_COMPRESSORS} if MONGO_COMPRESSORS else {}
+                _mongo_client = MongoClient(
+                    f"mongodb://{MONGO_HOST}:{MONGO_PORT}/",
+                    serverSelectionTimeoutMS=5000,
+                    **options
+                )
+    return _mongo_client
+
+
+def get_mongo_collection():
+    return get_mongo_client()[MONGO_DB][MONGO_COLLECTION]
+
+
+def get_elasticsearch():
+    global _es
+    if _es is None:
+        with _lock:
+            if _es is None:
+                _es = Elasticsearch(hosts=[{'host': ES_HOST, 'port': ES_PORT, 'scheme': 'http'}],
+                                    http_compress=ES_HTTP_COMPRESS)
+    return _es
+
+
+def shutdown():
+    """Ferme proprement toutes les connexions du processus"""
+    global _cluster, _mongo_client, _es
+    with _lock:
+        if _cluster is not None:
+            _cluster.shutdown()
+        if _mongo_client is not None:
+            _mongo_client.close()
+        if _es is not None:
+            _es.close()
+        _sessions.clear()
+        _prepared.clear()
+        _cluster = _mongo_client = _es = None
+
+
+def reset_after_fork():
+    """Oublie les clients hérités du parent sans les fermer (leurs sockets appartiennent encore au parent)"""
+    global _lock, _cluster, _mongo_client, _es
+    # Le verrou a pu être copié pris par un autre thread du parent
+    _lock = threading.Lock()
+    _sessions.clear()
+    _prepared.clear()
+    _cluster = _mongo_client = _es = None
@@ -0,0 +1,251 @@
+"""
+Versions du jeu de données : chargement à côté de la version publiée, puis bascule
+
+Un nouveau jeu de données est chargé dans une version à part (index
+Elasticsearch, collections MongoDB et keyspace Cassandra suffixés par la
+version) pendant que les lecteurs continuent d'interroger la version publiée.
+Quand toutes les bases ont fini le chargement et que chaque version chargée
+est vérifiée (prepare_publish), chacune bascule ses lecteurs :
+- Elasticsearch : alias ES_INDEX déplacé en une seule requête _aliases
+- MongoDB       : pointeur de version (collection dataset_versions)
+- Cassandra     : pointeur de version (table dataset_pointer)
+- colonnaire    : pointeur de génération du journal colonnaire (COLUMNAR_SHARED_DIR)
+
+Les versions remplacées sont supprimées en arrière-plan après
+DATASET_DROP_DELAY_S (requêtes en cours, cache du pointeur dans les autres
+workers). Si une base échoue pendant le chargement ou la vérification, rien
+n'est publié et la version partielle est supprimée. Si une bascule échoue,
+les bases déjà basculées reviennent à la version publiée (rollback) : la
+version publiée n'est enregistrée que si toutes les bases ont basculé.
+
+L'état (version publiée, chargements, versions à supprimer) est partagé entre
+les workers dans DATASET_STATE_FILE ; un seul chargement à la fois (verrou fcntl).
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from scripts.common.changelog import write_json_atomic
+
+DATASET_STATE_FILE = os.getenv('DATASET_STATE_FILE', '/tmp/nosql_tp/datasets.json')
+DATASET_DROP_DELAY_S = float(os.getenv('DATASET_DROP_DELAY_S', 30))
+DATASET_BATCH_SIZE = int(os.getenv('DATASET_BATCH_SIZE', 5000))
+
+# Chargements conservés dans l'état (GET /api/datasets)
+HISTORY_SIZE = 10
+
+
+def new_version():
+    # Nom utilisable tel quel dans un index, une collection et un keyspace (millisecondes : deux
+    # chargements successifs dans la même seconde ne partagent pas de nom)
+    now = datetime.now()
+    return now.strftime("v%Y%m%d%H%M%S") + f"{now.microsecond // 1000:03d}"
+
+
+class LoadInProgress(Exception):
+    """Un chargement de version est déjà en cours (dans ce processus ou un autre worker)"""
+
+
+class DatasetManager:
+    """Chargement d'une version dans toutes les bases, publication, suppression différée des anciennes"""
+
+    def __init__(self, backends, state_file=DATASET_STATE_FILE, drop_delay=DATASET_DROP_DELAY_S,
+                 batch_size=DATASET_BATCH_SIZE, on_published=None):
+        self.backends = backends
+        self.state_file = state_file
+        self.drop_delay = drop_delay
+        self.batch_size = batch_size
+        self.on_published = on_published
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dropper = None
+        os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+
+    # ============ ÉTAT PARTAGÉ ============
+
+    @contextmanager
+    def _state(self):
+        """État lu et réécrit sous verrou fichier (plusieurs workers)"""
+        with self._lock, open(self.state_file + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = self._read()
+                yield state
+                write_json_atomic(self.state_file, state)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"current": None, "jobs": [], "retired": []}
+
+    def _update_job(self, job):
+        with self._state() as state:
+            state["jobs"] = [job] + [other for other in state["jobs"] if other["version"] != job["version"]]
+            del state["jobs"][HISTORY_SIZE:]
+
+    # ============ CHARGEMENT ============
+
+    def load(self, make_logs, description=None):
+        """Lance le chargement d'une nouvelle version en arrière-plan ; renvoie le suivi du chargement"""
+        lease = open(self.state_file + ".load.lock", "a")
+        try:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lease.close()
+            raise LoadInProgress("Un chargement de version est déjà en cours")
+        job = {
+            "version": new_version(),
+            "description": description,
+            "status": "loading",
+            "started_at": datetime.now().isoformat(),
+            "databases": {name: {"status": "pending", "written": 0} for name in self.backends}
+        }
+        self._update_job(job)
+        threading.Thread(target=self._run, args=(job, make_logs, lease),
+                         name=f"dataset-{job['version']}", daemon=True).start()
+        return job
+
+    def _run(self, job, make_logs, lease):
+        try:
+            stagings = {}
+            try:
+                logs = make_logs()
+                for name, backend in self.backends.items():
+                    stagings[name] = backend.staging(job["version"])
+                    self._load_backend(job, name, stagings[name], logs)
+            except Exception as e:
+                self._abandon(job, stagings, str(e))
+                return
+            self._publish(job, stagings)
+        finally:
+            lease.close()
+
+    def _abandon(self, job, stagings, error, keep=()):
+        """La version publiée n'a pas bougé : la version partielle est supprimée (sauf `keep`, encore lue)"""
+        job.update(status="failed", error=error, finished_at=datetime.now().isoformat())
+        self._update_job(job)
+        for name, staging in stagings.items():
+            if name in keep:
+                continue
+            try:
+                self.backends[name].discard(staging)
+            except Exception:
+                pass
+
+    def _load_backend(self, job, name, staging, logs):
+        database = job["databases"][name]
+        database["status"] = "loading"
+        self._update_job(job)
+        start = time.perf_counter()
+        try:
+            staging.setup()
+            for offset in range(0, len(logs), self.batch_size):
+                database["written"] += staging.bulk_write(logs[offset:offset + self.batch_size])
+        except Exception as e:
+            database.update(status="error", error=str(e))
+            raise RuntimeError(f"{name} : {e}")
+        database.update(status="loaded", duration_ms=round((time.perf_counter() - start) * 1000, 2))
+        self._update_job(job)
+
+    def _publish(self, job, stagings):
+        version, previous = job["version"], self._read()["current"]
+        # Toutes les bases sont chargées : chaque version est vérifiée avant la première bascule
+        for name, staging in stagings.items():
+            try:
+                self.backends[name].prepare_publish(staging)
+            except Exception as e:
+                job["databases"][name].update(status="error", error=str(e))
+                self._abandon(job, stagings, f"{name} : {e}")
+                return
+        # Bascule de chacune, à la suite ; un échec ramène les précédentes sur la version publiée
+        switched = []
+        for name, staging in stagings.items():
+            try:
+                switched.append((name, self.backends[name].publish(staging, version)))
+                job["databases"][name]["status"] = "published"
+            except Exception as e:
+                job["databases"][name].update(status="error", error=str(e))
+                stuck = self._rollback(job, stagings, switched, previous)
+                self._abandon(job, stagings, f"{name} : {e}", keep=stuck)
+                return
+        drop_after = time.time() + self.drop_delay
+        retired = [{"backend": name, "target": target, "drop_after": drop_after}
+                   for name, target in switched if target]
+        job.update(status="published", finished_at=datetime.now().isoformat())
+        with self._state() as state:
+            state["current"] = version
+            state["retired"].extend(retired)
+            state["jobs"] = [job] + [other for other in state["jobs"] if other["version"] != version]
+            del state["jobs"][HISTORY_SIZE:]
+        if self.on_published:
+            self.on_published(version)
+        self.start()
+
+    def _rollback(self, job, stagings, switched, previous):
+        """Ramène les bases basculées sur `previous` ; renvoie celles restées sur la nouvelle version"""
+        stuck = []
+        for name, retired in reversed(switched):
+            try:
+                self.backends[name].rollback(stagings[name], retired, previous)
+                job["databases"][name]["status"] = "rolled_back"
+            except Exception as e:
+                job["databases"][name].update(status="error", error=f"rollback : {e}")
+                stuck.append(name)
+        return stuck
+
+    # ============ SUPPRESSION DES VERSIONS REMPLACÉES ============
+
+    def start(self):
+        """Thread de suppression différée (reprend aussi les suppressions restées en attente au redémarrage)"""
+        with self._lock:
+            if self._dropper is None or not self._dropper.is_alive():
+                self._dropper = threading.Thread(target=self._drop_retired, name="dataset-dropper", daemon=True)
+                self._dropper.start()
+        self._wake.set()
+
+    def _drop_retired(self):
+        while True:
+            self._wake.clear()
+            with self._lock:
+                pending = self._read()["retired"]
+                if not pending:
+                    self._dropper = None
+                    return
+            now = time.time()
+            for entry in [entry for entry in pending if entry["drop_after"] <= now]:
+                try:
+                    self.backends[entry["backend"]].drop_version(entry["target"])
+                    entry.pop("error", None)
+                    done = True
+                except Exception as e:
+                    entry["error"], done = str(e), False
+                with self._state() as state:
+                    state["retired"] = [
+                        other for other in state["retired"]
+                        if (other["backend"], other["target"]) != (entry["backend"], entry["target"])
+                    ]
+                    if not done:
+                        # Nouvel essai après un délai
+                        state["retired"].append(dict(entry, drop_after=now + self.drop_delay))
+            remaining = [entry["drop_after"] for entry in self._read()["retired"]]
+            if remaining:
+                self._wake.wait(max(1.0, min(remaining) - time.time()))
+
+    def status(self):
+        state = self._read()
+        live = {}
+        for name, backend in self.backends.items():
+            try:
+                live[name] = backend.live_version()
+            except Exception as e:
+                live[name] = {"error": str(e)}
+        return dict(state, live=live)
@@ -0,0 +1,157 @@
+"""
+Capture des plans d'exécution et statistiques moteur (option "explain")
+
+Chaque fonction renvoie un résumé compact, affichable à côté du résultat d'une branche :
+- MongoDB       : explain("executionStats") -> documents / clés examinés, index utilisé
+- Elasticsearch : Profile API -> temps query / collector par shard
+- Cassandra     : tracing -> réplicas contactés, SSTables lues, tombstones
+"""
+
+import re
+
+_SSTABLES_RE = re.compile(r"Merged data from memtables and (\d+) sstables")
+_ROWS_RE = re.compile(r"Read (\d+) live rows and (\d+) tombstone cells")
+_SCANNED_RE = re.compile(r"Scanned (\d+) rows and matched (\d+)")
+
+
+def _ns_to_ms(nanos):
+    return round(nanos / 1_000_000, 3)
+
+
+# ============================================================================
+# MONGODB
+# ============================================================================
+
+def _find_key(node, key):
+    """Recherche récursive de la première occurrence d'une clé dans un document explain"""
+    if isinstance(node, dict):
+        if key in node:
+            return node[key]
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan, stages=None, indexes=None):
+    """Liste les étapes (COLLSCAN, IXSCAN, FETCH...) et index d'un winningPlan"""
+    stages = [] if stages is None else stages
+    indexes = [] if indexes is None else indexes
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        if isinstance(plan.get("indexName"), str):
+            indexes.append(plan["indexName"])
+        for key in ("queryPlan", "inputStage", "inputStages"):
+            if key in plan:
+                _plan_stages(plan[key], stages, indexes)
+    elif isinstance(plan, list):
+        for child in plan:
+            _plan_stages(child, stages, indexes)
+    return stages, indexes
+
+
+def summarize_mongo_explain(doc):
+    stats = _find_key(doc, "executionStats") or {}
+    planner = _find_key(doc, "queryPlanner") or {}
+    stages, indexes = _plan_stages(planner.get("winningPlan", {}))
+    return {
+        "index_used": indexes[0] if indexes else None,
+        "stages": stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+        "execution_time_ms": stats.get("executionTimeMillis")
+    }
+
+
+def mongo_explain_find(collection, filter, sort=None, limit=None):
+    command = {"find": collection.name, "filter": filter}
+    if sort:
+        command["sort"] = sort
+    if limit:
+        command["limit"] = limit
+    doc = collection.database.command("explain", command, verbosity="executionStats")
+    return summarize_mongo_explain(doc)
+
+
+def mongo_explain_aggregate(collection, pipeline):
+    command = {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}}
+    doc = collection.database.command("explain", command, verbosity="executionStats")
+    return summarize_mongo_explain(doc)
+
+
+# ============================================================================
+# ELASTICSEARCH
+# ============================================================================
+
+def summarize_es_profile(profile):
+    shards = []
+    for shard in (profile or {}).get("shards", []):
+        queries, collectors = [], []
+        for search in shard.get("searches", []):
+            queries.extend(search.get("query", []))
+            collectors.extend(search.get("collector", []))
+        aggregations = shard.get("aggregations", [])
+        shards.append({
+            "shard": shard.get("id"),
+            "query_ms": _ns_to_ms(sum(q.get("time_in_nanos", 0) for q in queries)),
+            "collector_ms": _ns_to_ms(sum(c.get("time_in_nanos", 0) for c in collectors)),
+            "aggregation_ms": _ns_to_ms(sum(a.get("time_in_nanos", 0) for a in aggregations)),
+            "queries": [
+                {"type": q.get("type"), "time_ms": _ns_to_ms(q.get("time_in_nanos", 0))}
+                for q in queries
+            ]
+        })
+    return {"shards": shards}
+
+
+# ============================================================================
+# CASSANDRA
+# ============================================================================
+
+def summarize_cassandra_traces(traces):
+    """Fusionne les traces (une par page / requête) en un résumé unique"""
+    summary = {
+        "coordinators": set(),
+        "replicas": set(),
+        "duration_ms": 0.0,
+        "sstables_read": 0,
+        "live_rows": 0,
+        "tombstones": 0,
+        "rows_scanned": 0,
+        "requests": 0
+    }
+    for trace in traces:
+        if trace is None:
+            continue
+        summary["requests"] += 1
+        if trace.coordinator:
+            summary["coordinators"].add(str(trace.coordinator))
+        if trace.duration:
+            summary["duration_ms"] += trace.duration.total_seconds() * 1000
+        for event in trace.events or []:
+            if event.source:
+                summary["replicas"].add(str(event.source))
+            activity = event.description or ""
+            match = _SSTABLES_RE.search(activity)
+            if match:
+                summary["sstables_read"] += int(match.group(1))
+            match = _ROWS_RE.search(activity)
+            if match:
+                summary["live_rows"] += int(match.group(1))
+                summary["tombstones"] += int(match.group(2))
+            match = _SCANNED_RE.search(activity)
+            if match:
+                summary["rows_scanned"] += int(match.group(1))
+
+    summary["coordinators"] = sorted(summary["coordinators"])
+    summary["replicas"] = sorted(summary["replicas"])
+    summary["duration_ms"] = round(summary["duration_ms"], 2)
+    return summary
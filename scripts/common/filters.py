@@ -0,0 +1,351 @@
+"""
+Expressions de filtre et plan d'exécution par base
+
+Un filtre est un petit arbre, construit depuis les paramètres de la Tâche 1
+(`task1_filter`) ou depuis une expression JSON (`parse`) :
+- Eq(champ, valeur), In(champ, valeurs), Range(champ, min, max) (bornes incluses)
+- Text(champ, texte) : recherche texte, interprétée par chaque base (regex, match, LIKE, tokens)
+- And(...), Or(...)
+
+Chaque adapter classe les termes du ET de tête (`conjuncts`) : ceux qu'il sait
+envoyer dans sa requête (clé de partition, plage de clustering, index,
+filtrage côté serveur) et les résiduels, évalués côté client par un prédicat
+compilé (`compile_columns`) sur chaque page reçue. Le `Plan` est renvoyé dans
+le résultat de la branche pour inspection.
+
+Syntaxe JSON :
+    {"event_type": "ERROR_404", "user_id": [1, 2],
+     "timestamp": {"gte": "2025-10-01", "lte": "2025-10-31"},
+     "description": {"contains": "critique"}}
+    {"or": [{"event_type": "PURCHASE"}, {"session_duration_ms": {"gte": 30000}}]}
+"""
+
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from scripts.common.columns import isin, lowercase, timestamps_ms, to_ms
+
+# Champs filtrables et leur type
+FIELDS = {
+    "log_id": "uuid",
+    "timestamp": "timestamp",
+    "user_id": "integer",
+    "event_type": "keyword",
+    "product_id": "keyword",
+    "session_duration_ms": "integer",
+    "description": "text"
+}
+# Champs ordonnés : seuls acceptés par gte / lte
+RANGE_KINDS = ("timestamp", "integer")
+
+
+def parse_timestamp(value, upper=False):
+    """Timestamp ISO ; une date seule en borne haute couvre toute la journée"""
+    if isinstance(value, datetime):
+        return value
+    if upper and len(value) == 10:
+        value += "T23:59:59"
+    return datetime.fromisoformat(value)
+
+
+def coerce(field, value):
+    if value is None:
+        return None
+    kind = FIELDS[field]
+    if kind == "integer":
+        return int(value)
+    if kind == "timestamp":
+        return parse_timestamp(value)
+    if kind == "uuid":
+        # Forme canonique (minuscules, tirets) : celle des bases qui stockent log_id en texte
+        return str(uuid.UUID(str(value)))
+    return str(value)
+
+
+def present(column):
+    """Masque des lignes dont la valeur n'est pas nulle (une valeur absente ne correspond à aucun prédicat)"""
+    if column.dtype == object:
+        return np.fromiter((value is not None for value in column), dtype=bool, count=len(column))
+    return np.ones(len(column), dtype=bool)
+
+
+def comparable(field, column):
+    """Colonne au type des valeurs du filtre (UUID du driver Cassandra -> texte canonique)"""
+    if FIELDS[field] == "uuid" and column.dtype == object:
+        return np.array([None if value is None else str(value) for value in column], dtype=object)
+    return column
+
+
+# ============================================================================
+# ARBRE
+# ============================================================================
+
+class Predicate:
+    """Nœud de l'arbre de filtre"""
+
+    def describe(self):
+        raise NotImplementedError
+
+    def compile_columns(self):
+        """Fonction {colonne: tableau} -> masque booléen des lignes retenues"""
+        raise NotImplementedError
+
+    def fields(self):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return self.describe()
+
+
+class Eq(Predicate):
+    def __init__(self, field, value):
+        self.field, self.value = field, coerce(field, value)
+
+    def describe(self):
+        return f"{self.field} = {self.value!r}"
+
+    def compile_columns(self):
+        field, values = self.field, [self.value]
+        return lambda columns: isin(comparable(field, columns[field]), values)
+
+    def fields(self):
+        return {self.field}
+
+
+class In(Predicate):
+    def __init__(self, field, values):
+        self.field, self.values = field, [coerce(field, value) for value in values]
+
+    def describe(self):
+        return f"{self.field} IN {self.values!r}"
+
+    def compile_columns(self):
+        field, values = self.field, self.values
+        return lambda columns: isin(comparable(field, columns[field]), values)
+
+    def fields(self):
+        return {self.field}
+
+
+class Range(Predicate):
+    def __init__(self, field, low=None, high=None):
+        if FIELDS[field] == "timestamp":
+            low = parse_timestamp(low) if low is not None else None
+            high = parse_timestamp(high, upper=True) if high is not None else None
+        else:
+            low, high = coerce(field, low), coerce(field, high)
+        self.field, self.low, self.high = field, low, high
+
+    def describe(self):
+        shown = str if FIELDS[self.field] == "timestamp" else (lambda bound: bound)
+        bounds = []
+        if self.low is not None:
+            bounds.append(f"{self.field} >= {shown(self.low)!r}")
+        if self.high is not None:
+            bounds.append(f"{self.field} <= {shown(self.high)!r}")
+        return " AND ".join(bounds)
+
+    def compile_columns(self):
+        field, low, high = self.field, self.low, self.high
+        if FIELDS[field] == "timestamp":
+            # Comparaison en millisecondes, jamais sur des chaînes
+            convert = timestamps_ms
+            low, high = (to_ms(low) if low is not None else None), (to_ms(high) if high is not None else None)
+        else:
+            convert = lambda column: column.astype(np.int64)
+
+        def matches(columns):
+            column = columns[field]
+            # Valeurs nulles écartées avant la conversion : jamais comparées aux bornes
+            mask = present(column)
+            values = convert(column[mask])
+            selected = np.ones(len(values), dtype=bool)
+            if low is not None:
+                selected &= values >= low
+            if high is not None:
+                selected &= values <= high
+            mask[mask] = selected
+            return mask
+        return matches
+
+    def fields(self):
+        return {self.field}
+
+
+class Text(Predicate):
+    def __init__(self, field, text):
+        self.field, self.text = field, str(text)
+
+    def describe(self):
+        return f"{self.field} CONTAINS {self.text!r}"
+
+    def compile_columns(self):
+        # Sous-chaîne insensible à la casse (sémantique du scan Cassandra)
+        field, needle = self.field, self.text.lower()
+        return lambda columns: np.char.find(lowercase(columns[field]), needle) >= 0
+
+    def fields(self):
+        return {self.field}
+
+
+class And(Predicate):
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def describe(self):
+        return " AND ".join(f"({child.describe()})" if isinstance(child, Or) else child.describe()
+                            for child in self.children)
+
+    def compile_columns(self):
+        compiled = [child.compile_columns() for child in self.children]
+
+        def matches(columns):
+            mask = np.ones(len(next(iter(columns.values()))), dtype=bool)
+            for predicate in compiled:
+                mask &= predicate(columns)
+            return mask
+        return matches
+
+    def fields(self):
+        return set().union(*(child.fields() for child in self.children))
+
+
+class Or(Predicate):
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def describe(self):
+        return " OR ".join(f"({child.describe()})" for child in self.children)
+
+    def compile_columns(self):
+        compiled = [child.compile_columns() for child in self.children]
+
+        def matches(columns):
+            mask = np.zeros(len(next(iter(columns.values()))), dtype=bool)
+            for predicate in compiled:
+                mask |= predicate(columns)
+            return mask
+        return matches
+
+    def fields(self):
+        return set().union(*(child.fields() for child in self.children))
+
+
+def conjuncts(node):
+    """Termes du ET de tête (ET imbriqués aplatis)"""
+    if node is None:
+        return []
+    if isinstance(node, And):
+        return [term for child in node.children for term in conjuncts(child)]
+    return [node]
+
+
+def conjunction(terms):
+    terms = [term for term in terms if term is not None]
+    if not terms:
+        return None
+    return terms[0] if len(terms) == 1 else And(*terms)
+
+
+# ============================================================================
+# CONSTRUCTION
+# ============================================================================
+
+def parse(expression):
+    """Expression JSON -> arbre (None si vide) ; ValueError si elle est invalide"""
+    if not expression:
+        return None
+    try:
+        return _parse_expression(expression)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Filtre invalide : {e}")
+
+
+def _parse_expression(expression):
+    if not isinstance(expression, dict) or not expression:
+        raise ValueError("objet JSON non vide attendu")
+    return conjunction([_parse_entry(key, value) for key, value in expression.items()])
+
+
+def _parse_entry(key, value):
+    if key in ("and", "or"):
+        if not isinstance(value, list) or not value:
+            raise ValueError(f"{key} : liste non vide attendue")
+        children = [_parse_expression(child) for child in value]
+        return And(*children) if key == "and" else Or(*children)
+    if key not in FIELDS:
+        raise ValueError(f"champ inconnu : {key} (attendu : {', '.join(FIELDS)})")
+    if isinstance(value, list):
+        return In(key, value)
+    if not isinstance(value, dict):
+        return Eq(key, value)
+    terms = []
+    for operator, operand in value.items():
+        if operator == "eq":
+            terms.append(Eq(key, operand))
+        elif operator == "in":
+            terms.append(In(key, operand))
+        elif operator == "contains":
+            terms.append(Text(key, operand))
+        elif operator not in ("gte", "lte"):
+            raise ValueError(f"opérateur inconnu : {operator} (attendu : eq, in, gte, lte, contains)")
+    if "gte" in value or "lte" in value:
+        if FIELDS[key] not in RANGE_KINDS:
+            raise ValueError(f"gte / lte : champ numérique ou timestamp attendu ({key})")
+        terms.append(Range(key, value.get("gte"), value.get("lte")))
+    return conjunction(terms)
+
+
+def task1_filter(event_type=None, search_text=None, date_start=None, date_end=None, where=None):
+    """Arbre des paramètres de la Tâche 1, complété par une expression JSON optionnelle"""
+    return conjunction([
+        Eq("event_type", event_type) if event_type else None,
+        Text("description", search_text) if search_text else None,
+        Range("timestamp", date_start, date_end) if date_start or date_end else None,
+        parse(where)
+    ])
+
+
+# ============================================================================
+# PLAN
+# ============================================================================
+
+class Plan:
+    """Prédicats envoyés à la base (avec le moyen utilisé) et résiduels évalués côté client"""
+
+    def __init__(self):
+        self.pushed = []
+        self.residual = []
+
+    def push(self, predicate, via):
+        self.pushed.append((predicate, via))
+
+    def keep(self, predicate):
+        self.residual.append(predicate)
+
+    def pushed_with(self, *ways):
+        return [predicate for predicate, via in self.pushed if via in ways]
+
+    def residual_filter(self):
+        """Prédicat compilé des résiduels sur une page de colonnes (None si tout est poussé)"""
+        node = conjunction(self.residual)
+        return node.compile_columns() if node is not None else None
+
+    def residual_fields(self):
+        return set().union(*(predicate.fields() for predicate in self.residual))
+
+    def describe(self):
+        return {
+            "pushed": [{"predicate": predicate.describe(), "via": via} for predicate, via in self.pushed],
+            "residual": [predicate.describe() for predicate in self.residual]
+        }
+
+
+def push_all(node, via="query"):
+    """Plan d'une base qui traduit tout l'arbre dans sa requête"""
+    plan = Plan()
+    for term in conjuncts(node):
+        plan.push(term, via)
+    return plan
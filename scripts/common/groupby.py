@@ -0,0 +1,165 @@
+"""
+Agrégation générique (POST /api/aggregate)
+
+Regroupement par une ou plusieurs dimensions (event_type, product_id, user_id,
+hour, day), métriques count / sum / avg / min / max sur un champ numérique et
+filtre optionnel. Chaque adapter pousse le travail au plus près des données et
+produit des agrégats partiels {clé: {count, sum, min, max}} (même format que les
+rollups), mis en forme ici :
+- MongoDB       : pipeline $match / $project / $group / $sort / $limit (allowDiskUse)
+- Elasticsearch : agrégation composite paginée (after_key), stats par bucket
+- Cassandra     : table rollup_hourly quand la demande s'y prête, sinon scan parallèle
+                  des plages de tokens (ou lecture des partitions demandées)
+- colonnaire    : codes des clés + réductions NumPy par groupe
+
+Clés temporelles : hour "2025-10-01T14" (format des rollups), day "2025-10-01".
+"""
+
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from scripts.common.rollup import HOUR_FORMAT, merge
+
+GROUP_DIMENSIONS = ("event_type", "product_id", "user_id", "hour", "day")
+GROUP_METRICS = ("count", "sum", "avg", "min", "max")
+# Filtres d'égalité (une valeur ou une liste) ; la fenêtre de temps passe par date_start / date_end
+FILTER_FIELDS = ("event_type", "product_id", "user_id")
+AGGREGATE_MAX_GROUPS = int(os.getenv('AGGREGATE_MAX_GROUPS', 10000))
+
+# Largeur d'un bucket temporel en millisecondes et format de sa clé
+TIME_BUCKETS = {"hour": (3_600_000, HOUR_FORMAT), "day": (86_400_000, "%Y-%m-%d")}
+
+
+def group_spec(dimensions, metrics=None, filters=None, limit=1000):
+    """Valide une demande d'agrégation ; ValueError si elle est invalide"""
+    dimensions = [dimensions] if isinstance(dimensions, str) else list(dimensions or ())
+    unknown = [name for name in dimensions if name not in GROUP_DIMENSIONS]
+    if not dimensions or unknown or len(set(dimensions)) != len(dimensions):
+        raise ValueError(f"group_by : une ou plusieurs dimensions distinctes parmi {', '.join(GROUP_DIMENSIONS)}")
+    metrics = [metrics] if isinstance(metrics, str) else list(metrics or ("count", "avg", "min", "max"))
+    if not metrics or any(name not in GROUP_METRICS for name in metrics):
+        raise ValueError(f"metrics : parmi {', '.join(GROUP_METRICS)}")
+    filters = dict(filters or {})
+    unknown = set(filters) - set(FILTER_FIELDS) - {"date_start", "date_end"}
+    if unknown:
+        raise ValueError(f"Filtre inconnu : {', '.join(sorted(unknown))}")
+    for name in FILTER_FIELDS:
+        if name in filters:
+            values = filters[name] if isinstance(filters[name], list) else [filters[name]]
+            filters[name] = [int(value) for value in values] if name == "user_id" else values
+    limit = int(limit)
+    if not 1 <= limit <= AGGREGATE_MAX_GROUPS:
+        raise ValueError(f"limit : entre 1 et {AGGREGATE_MAX_GROUPS}")
+    return {"dimensions": dimensions, "metrics": metrics, "filters": filters, "limit": limit}
+
+
+# ============================================================================
+# CLÉS
+# ============================================================================
+
+def time_buckets(dimension, timestamps_ms):
+    """Numéro de bucket (heure ou jour depuis l'epoch) de chaque timestamp"""
+    return timestamps_ms // TIME_BUCKETS[dimension][0]
+
+
+def format_bucket(dimension, bucket):
+    width, key_format = TIME_BUCKETS[dimension]
+    return datetime.fromtimestamp(int(bucket) * width / 1000, tz=timezone.utc).strftime(key_format)
+
+
+def encode(column):
+    """(codes, valeurs distinctes) d'une colonne ; les colonnes d'objets peuvent contenir None"""
+    if column.dtype == object:
+        lookup = {}
+        codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in column),
+                            dtype=np.int64, count=len(column))
+        return codes, list(lookup)
+    uniques, codes = np.unique(column, return_inverse=True)
+    return codes.reshape(-1), uniques.tolist()
+
+
+def partials_from_arrays(keys, values):
+    """
+    keys : [(colonne, décodage ou None)] dans l'ordre des dimensions ; values : colonne du champ
+    Renvoie {tuple de clés: {count, sum, min, max}} (valeurs nulles comptées, ignorées pour sum/min/max)
+    """
+    rows = len(values)
+    if not rows:
+        return {}
+    combined, radix, decoded = np.zeros(rows, dtype=np.int64), 1, []
+    for column, decode in keys:
+        codes, uniques = encode(column)
+        combined += codes * radix
+        radix *= max(len(uniques), 1)
+        decoded.append([decode(value) if decode else value for value in uniques])
+    groups, inverse = np.unique(combined, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    if values.dtype == object:
+        valid = np.array([value is not None for value in values], dtype=bool)
+        values = np.array([value if value is not None else 0 for value in values], dtype=np.int64)
+    else:
+        valid = np.ones(rows, dtype=bool)
+    counts = np.bincount(inverse, minlength=len(groups))
+    sums = np.bincount(inverse[valid], weights=values[valid], minlength=len(groups))
+    present = np.bincount(inverse[valid], minlength=len(groups))
+    mins = np.full(len(groups), np.iinfo(np.int64).max, dtype=np.int64)
+    maxs = np.full(len(groups), np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(mins, inverse[valid], values[valid].astype(np.int64))
+    np.maximum.at(maxs, inverse[valid], values[valid].astype(np.int64))
+
+    result = {}
+    for index, group in enumerate(groups.tolist()):
+        key = []
+        for values_of_dimension in decoded:
+            key.append(values_of_dimension[group % len(values_of_dimension)])
+            group //= len(values_of_dimension)
+        result[tuple(key)] = {
+            "count": int(counts[index]),
+            "sum": int(sums[index]),
+            "min": int(mins[index]) if present[index] else None,
+            "max": int(maxs[index]) if present[index] else None
+        }
+    return result
+
+
+def merge_partials(target, partials):
+    """Fusionne des agrégats partiels par clé dans `target` (modifié sur place)"""
+    for key, partial in partials.items():
+        if key in target:
+            merge(target[key], partial)
+        else:
+            target[key] = dict(partial)
+    return target
+
+
+# ============================================================================
+# RÉSULTAT
+# ============================================================================
+
+def sort_key(key):
+    # None en premier, comme le tri des clés de MongoDB et les buckets manquants d'Elasticsearch
+    return tuple((value is not None, value) for value in key)
+
+
+def finalize_groups(partials, dimensions, metrics, limit):
+    """(groupes triés par clé, tronqué) : [{"key": {dimension: valeur}, métrique: valeur}]"""
+    groups = []
+    for key in sorted(partials, key=sort_key)[:limit]:
+        partial = partials[key]
+        group = {"key": dict(zip(dimensions, key))}
+        for metric in metrics:
+            if metric == "avg":
+                group["avg"] = round(partial["sum"] / partial["count"], 2) if partial["count"] else None
+            else:
+                group[metric] = partial[metric]
+        groups.append(group)
+    return groups, len(partials) > limit
+
+
+def group_leg(partials, dimensions, metrics, limit, **extra):
+    """Résultat commun des adapters pour l'opération group_by"""
+    groups, truncated = finalize_groups(partials, dimensions, metrics, limit)
+    return dict(extra, count=len(groups), truncated=truncated, groups=groups)
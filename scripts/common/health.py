@@ -0,0 +1,98 @@
+"""
+Sonde de santé en arrière-plan
+
+Un thread vérifie chaque base à intervalle régulier via les connexions partagées
+et conserve une fenêtre glissante de latences / disponibilité.
+/api/health répond instantanément à partir de cet état.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+HEALTH_INTERVAL_S = float(os.getenv('HEALTH_INTERVAL_S', 10))
+HEALTH_WINDOW = int(os.getenv('HEALTH_WINDOW', 30))
+
+
+class BackendHealth:
+    """Historique glissant des vérifications d'une base"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.status = "unknown"
+        self.last_latency_ms = None
+        self.last_checked = None
+        self.last_error = None
+        self.checks = 0
+
+    def record(self, ok, latency_ms, error=None):
+        self.samples.append((ok, latency_ms))
+        self.status = "ok" if ok else f"error: {error}"
+        self.last_latency_ms = round(latency_ms, 2)
+        self.last_checked = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        self.checks += 1
+        if not ok:
+            self.last_error = error
+
+    def stats(self):
+        latencies = sorted(latency for ok, latency in self.samples if ok)
+        available = sum(1 for ok, _ in self.samples if ok)
+        return {
+            "status": self.status,
+            "last_latency_ms": self.last_latency_ms,
+            "avg_latency_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p95_latency_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2) if latencies else None,
+            "availability": round(available / len(self.samples), 3) if self.samples else None,
+            "checks": self.checks,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error
+        }
+
+
+class HealthProber:
+    """Vérifie périodiquement chaque base (checks : nom -> fonction sans argument)"""
+
+    def __init__(self, checks, interval_s=HEALTH_INTERVAL_S, window=HEALTH_WINDOW):
+        self.checks = checks
+        self.interval_s = interval_s
+        self.backends = {name: BackendHealth(window) for name in checks}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._first_round = threading.Event()
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.interval_s)
+
+    def probe(self, name):
+        start = time.perf_counter()
+        try:
+            self.checks[name]()
+            self.backends[name].record(True, (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            self.backends[name].record(False, (time.perf_counter() - start) * 1000, str(e))
+
+    def probe_all(self):
+        for name in self.checks:
+            self.probe(name)
+        self._first_round.set()
+
+    def wait_first_round(self, timeout=None):
+        return self._first_round.wait(timeout)
+
+    def snapshot(self):
+        return {
+            "databases": {name: backend.status for name, backend in self.backends.items()},
+            "stats": {name: backend.stats() for name, backend in self.backends.items()}
+        }
@@ -0,0 +1,235 @@
+"""
+Ingestion temps réel par micro-lots (POST /api/events)
+
+Chaque événement accepté est mis en file pour chaque base. Un thread par base
+vide sa file par lots dès que INGEST_BATCH_SIZE événements attendent ou que le
+plus ancien attend depuis INGEST_MAX_DELAY_MS, et les écrit avec
+`write_events` (INSERT concurrents Cassandra, insert_many MongoDB, _bulk
+Elasticsearch).
+
+Accusé de réception :
+- ack=queued  : réponse dès la mise en file (202)
+- ack=written : réponse quand toutes les bases ont écrit (ou abandonné) le lot (201)
+
+Quand une file dépasse INGEST_QUEUE_SIZE, les nouveaux événements sont refusés
+(429) : le client ralentit au lieu de faire grossir la mémoire de l'API.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 500))
+INGEST_MAX_DELAY_MS = float(os.getenv('INGEST_MAX_DELAY_MS', 200))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 50000))
+INGEST_RETRIES = int(os.getenv('INGEST_RETRIES', 3))
+INGEST_ACK_TIMEOUT_S = float(os.getenv('INGEST_ACK_TIMEOUT_S', 10))
+
+ACK_MODES = ("queued", "written")
+REQUIRED_FIELDS = ("user_id", "event_type")
+
+
+class QueueFull(Exception):
+    """File d'une base pleine : l'appelant doit réessayer plus tard"""
+
+    def __init__(self, name, depth):
+        super().__init__(f"File d'ingestion {name} pleine ({depth} événements en attente)")
+        self.name = name
+
+
+def normalize_event(event):
+    """Complète un événement reçu (log_id, timestamp, champs optionnels) ; ValueError si invalide"""
+    if not isinstance(event, dict):
+        raise ValueError("Chaque événement doit être un objet JSON")
+    missing = [field for field in REQUIRED_FIELDS if event.get(field) is None]
+    if missing:
+        raise ValueError(f"Champs obligatoires manquants : {', '.join(missing)}")
+    try:
+        user_id = int(event["user_id"])
+        duration = int(event.get("session_duration_ms") or 0)
+        log_id = str(uuid.UUID(str(event["log_id"]))) if event.get("log_id") else str(uuid.uuid4())
+        timestamp = event.get("timestamp") or datetime.now().isoformat(timespec="milliseconds")
+        datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Événement invalide : {e}")
+    return {
+        "log_id": log_id,
+        "timestamp": timestamp,
+        "user_id": user_id,
+        "event_type": str(event["event_type"]),
+        "product_id": event.get("product_id"),
+        "session_duration_ms": duration,
+        "description": event.get("description") or ""
+    }
+
+
+class MicroBatchWriter:
+    """File + thread d'écriture d'une base ; chaque événement reçoit un numéro de séquence"""
+
+    def __init__(self, name, write, batch_size=INGEST_BATCH_SIZE, max_delay_ms=INGEST_MAX_DELAY_MS,
+                 max_queue=INGEST_QUEUE_SIZE):
+        self.name = name
+        self.write = write
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.max_queue = max_queue
+        self._queue = deque()  # (séquence, heure de mise en file, événement)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._next_seq = 0
+        self._done_seq = 0
+        # Plages de séquences abandonnées après INGEST_RETRIES échecs (pour ack=written)
+        self._failed = deque(maxlen=1000)
+        self.metrics = {"enqueued": 0, "written": 0, "failed": 0, "rejected": 0, "batches": 0,
+                        "last_batch_size": 0, "last_flush_ms": None, "last_error": None}
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"ingest-{self.name}", daemon=True)
+                self._thread.start()
+
+    def has_room(self, count):
+        with self._cond:
+            return len(self._queue) + count <= self.max_queue
+
+    def reject(self, count):
+        with self._cond:
+            self.metrics["rejected"] += count
+            return QueueFull(self.name, len(self._queue))
+
+    def enqueue(self, events):
+        """Met des événements en file ; renvoie leur plage de numéros de séquence (premier, dernier)"""
+        now = time.monotonic()
+        with self._cond:
+            if len(self._queue) + len(events) > self.max_queue:
+                self.metrics["rejected"] += len(events)
+                raise QueueFull(self.name, len(self._queue))
+            first = self._next_seq + 1
+            for event in events:
+                self._next_seq += 1
+                self._queue.append((self._next_seq, now, event))
+            self.metrics["enqueued"] += len(events)
+            self._cond.notify_all()
+            return first, self._next_seq
+
+    def _take_batch(self):
+        # Attend un lot complet ou l'expiration du délai du plus ancien événement
+        with self._cond:
+            while True:
+                if len(self._queue) >= self.batch_size:
+                    break
+                if self._queue:
+                    remaining = self._queue[0][1] + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            size = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            events = [event for _, _, event in batch]
+            first, last = batch[0][0], batch[-1][0]
+            start = time.perf_counter()
+            error = None
+            for attempt in range(INGEST_RETRIES):
+                try:
+                    self.write(events)
+                    error = None
+                    break
+                except Exception as e:
+                    error = str(e)
+                    if attempt + 1 < INGEST_RETRIES:
+                        time.sleep(0.1 * 2 ** attempt)
+            with self._cond:
+                self.metrics["batches"] += 1
+                self.metrics["last_batch_size"] = len(events)
+                self.metrics["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                if error is None:
+                    self.metrics["written"] += len(events)
+                else:
+                    self.metrics["failed"] += len(events)
+                    self.metrics["last_error"] = {"error": error, "at": datetime.now().isoformat()}
+                    self._failed.append((first, last))
+                self._done_seq = last
+                self._cond.notify_all()
+
+    def wait(self, ticket, timeout):
+        """Attend que la plage `ticket` soit traitée ; renvoie "written", "failed" ou "timeout\""""
+        first, last = ticket
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._done_seq < last:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return "timeout"
+                self._cond.wait(remaining)
+            failed = any(low <= last and first <= high for low, high in self._failed)
+            return "failed" if failed else "written"
+
+    def drain(self, timeout):
+        """Attend que la file soit écrite (arrêt propre) ; False si le délai expire"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._done_seq < self._next_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None or not self._thread.is_alive():
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stats(self):
+        with self._cond:
+            oldest = self._queue[0][1] if self._queue else None
+            return dict(
+                self.metrics,
+                queue_depth=len(self._queue),
+                max_queue=self.max_queue,
+                oldest_wait_ms=round((time.monotonic() - oldest) * 1000, 2) if oldest else 0
+            )
+
+
+class IngestPipeline:
+    """Un MicroBatchWriter par base ; la mise en file est tout-ou-rien"""
+
+    def __init__(self, writers):
+        self.writers = {name: MicroBatchWriter(name, write) for name, write in writers.items()}
+        self._lock = threading.Lock()
+
+    def submit(self, events):
+        """Met les événements en file pour toutes les bases ; renvoie {base: plage de séquences}. QueueFull si saturé"""
+        with self._lock:
+            # Vérification préalable : un événement n'est jamais mis en file pour une partie des bases seulement
+            for writer in self.writers.values():
+                if not writer.has_room(len(events)):
+                    raise writer.reject(len(events))
+            tickets = {}
+            for name, writer in self.writers.items():
+                writer.start()
+                tickets[name] = writer.enqueue(events)
+            return tickets
+
+    def wait(self, tickets, timeout=INGEST_ACK_TIMEOUT_S):
+        deadline = time.monotonic() + timeout
+        return {
+            name: self.writers[name].wait(ticket, max(0.0, deadline - time.monotonic()))
+            for name, ticket in tickets.items()
+        }
+
+    def drain(self, timeout=INGEST_ACK_TIMEOUT_S):
+        """Écrit les événements encore en file avant l'arrêt du processus ; renvoie {base: vidée ?}"""
+        deadline = time.monotonic() + timeout
+        return {
+            name: writer.drain(max(0.0, deadline - time.monotonic()))
+            for name, writer in self.writers.items()
+        }
+
+    def stats(self):
+        return {name: writer.stats() for name, writer in self.writers.items()}
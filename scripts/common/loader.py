@@ -0,0 +1,139 @@
+"""
+Chargement incrémental et reprenable des fichiers de logs
+
+Le fichier est découpé en lots de LOAD_CHUNK_SIZE logs écrits avec
+`upsert_logs` (idempotent par log_id). Après chaque lot, le numéro du dernier
+lot validé est enregistré par base et par fichier (empreinte SHA-256) : une
+relance saute les lots déjà chargés et reprend au premier lot non validé, et un
+nouveau fichier (logs du jour) s'ajoute sans recharger l'historique.
+`--reset` retrouve l'ancien comportement (base vidée, checkpoints oubliés).
+Les checkpoints sont aussi oubliés quand les bases sont vidées ou remplacées
+ailleurs (/api/data/clear, bascule de version, primary_insert.py).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+from scripts.common.changelog import write_json_atomic
+
+DATA_FILE = "/app/scripts/data/ecommerce_logs.json"
+LOAD_CHUNK_SIZE = int(os.getenv('LOAD_CHUNK_SIZE', 5000))
+LOAD_CHECKPOINT_DIR = os.getenv('LOAD_CHECKPOINT_DIR', '/app/scripts/data/checkpoints')
+
+
+def fingerprint(path):
+    """Empreinte du contenu : un fichier modifié est rechargé, un fichier renommé ne l'est pas"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LoadCheckpoints:
+    """Lots validés par fichier pour une base : {empreinte: {file, chunks_done, ...}}"""
+
+    def __init__(self, backend_name, directory=LOAD_CHECKPOINT_DIR):
+        # Dossier créé à la première sauvegarde : l'API peut oublier des checkpoints sans lui
+        self.directory = directory
+        self.path = os.path.join(directory, f"load_{backend_name}.json")
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, key):
+        return self.load().get(key)
+
+    def save(self, key, entry):
+        checkpoints = self.load()
+        checkpoints[key] = entry
+        os.makedirs(self.directory, exist_ok=True)
+        write_json_atomic(self.path, checkpoints)
+
+    def forget(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass  # rien à oublier (dossier ou fichier absent)
+
+
+def forget_checkpoints(backend_names, directory=LOAD_CHECKPOINT_DIR):
+    """Bases vidées ou remplacées (clear, bascule de version, rechargement primaire) : lots à recharger"""
+    for name in backend_names:
+        LoadCheckpoints(name, directory).forget()
+
+
+def load_incremental(backend, path, chunk_size=LOAD_CHUNK_SIZE, checkpoints=None, progress=None):
+    """Charge `path` dans `backend` lot par lot en sautant les lots déjà validés ; renvoie un résumé"""
+    checkpoints = checkpoints or LoadCheckpoints(backend.name)
+    key = fingerprint(path)
+    entry = checkpoints.get(key) or {"file": path, "chunks_done": 0, "inserted": 0}
+
+    with open(path, "r") as f:
+        logs = json.load(f)
+    chunks_total = (len(logs) + chunk_size - 1) // chunk_size
+    # Un changement de taille de lot invalide la numérotation : reprise au début (les upserts restent idempotents)
+    if entry.get("chunk_size", chunk_size) != chunk_size:
+        entry = {"file": path, "chunks_done": 0, "inserted": 0}
+    skipped = entry["chunks_done"]
+
+    for index in range(entry["chunks_done"], chunks_total):
+        chunk = logs[index * chunk_size:(index + 1) * chunk_size]
+        entry["inserted"] += backend.upsert_logs(chunk)
+        entry.update(chunks_done=index + 1, chunks_total=chunks_total, chunk_size=chunk_size,
+                     updated_at=datetime.now().isoformat())
+        checkpoints.save(key, entry)
+        if progress:
+            progress(min((index + 1) * chunk_size, len(logs)), len(logs))
+
+    return {
+        "file": path,
+        "logs": len(logs),
+        "chunks_total": chunks_total,
+        "chunks_skipped": skipped,
+        "inserted": entry["inserted"]
+    }
+
+
+def run_loader(backend, description):
+    """Point d'entrée commun des scripts d'insertion"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("files", nargs="*", default=[DATA_FILE], help="Fichiers JSON de logs (défaut : %(default)s)")
+    parser.add_argument("--reset", action="store_true", help="Vide la base et oublie les checkpoints avant le chargement")
+    parser.add_argument("--chunk-size", type=int, default=LOAD_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    checkpoints = LoadCheckpoints(backend.name)
+    # setup avant reset : le schéma Cassandra doit exister pour être vidé
+    backend.setup()
+    if args.reset:
+        backend.reset()
+        backend.setup()
+        checkpoints.forget()
+        print(f"{backend.name} réinitialisé.")
+
+    loaded = False
+    for path in args.files:
+        start = time.perf_counter()
+        summary = load_incremental(
+            backend, path, args.chunk_size, checkpoints,
+            progress=lambda done, total: print(f"  {done} / {total} logs...")
+        )
+        loaded = loaded or summary["chunks_skipped"] < summary["chunks_total"]
+        print(f"✅ {path} : {summary['inserted']} logs écrits, "
+              f"{summary['chunks_skipped']} / {summary['chunks_total']} lots déjà chargés "
+              f"({time.perf_counter() - start:.1f}s)")
+
+    if loaded:
+        # upsert_logs tient les rollups à jour, mais un arrêt entre l'écriture d'un lot et celle de ses
+        # rollups les laisse incomplets (la reprise ne réécrit pas les logs présents) : recalcul complet
+        backend.rebuild_rollups()
+        print("Rollups recalculés.")
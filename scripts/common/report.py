@@ -0,0 +1,53 @@
+"""
+Affichage console des benchmarks (scripts task*_simple.py)
+
+BENCH_BACKENDS restreint les branches exécutées, par ex. `BENCH_BACKENDS=columnar`
+pour benchmarker hors ligne, sans aucun container.
+"""
+
+import os
+
+BENCH_BACKENDS = [name.strip() for name in os.getenv('BENCH_BACKENDS', '').split(',') if name.strip()]
+
+
+def selected(name):
+    return not BENCH_BACKENDS or name in BENCH_BACKENDS
+
+
+def print_leg(label, leg, suffix=""):
+    """Affiche une ligne de résultat pour une branche et la renvoie"""
+    if leg["status"] != "success":
+        print(f"{label:<20}: ERREUR ({leg['error']})")
+    elif "count" in leg:
+        print(f"{label:<20}: {leg['count']} résultats en {leg['execution_time_ms']:.2f} ms{suffix}")
+    else:
+        print(f"{label:<20}: {leg['execution_time_ms']:.2f} ms{suffix}")
+    return leg
+
+
+def print_aggregations(leg):
+    for event_type, agg in leg.get("aggregations", {}).items():
+        print(f"  - {event_type}: avg={agg['avg_duration']:.2f} ms ({agg['count']} events)")
+
+
+def print_summary(title, legs, with_count=True):
+    """Tableau récapitulatif : legs = [(label, leg), ...]"""
+    width = 25
+    print("\n" + "="*60)
+    print(title)
+    print("="*60)
+    if with_count:
+        print(f"{'SGBD':<{width}} {'Temps':>10} {'Résultats':>10}")
+        print("-"*(width + 25))
+    else:
+        print(f"{'SGBD':<{width}} {'Temps':>10}")
+        print("-"*(width + 14))
+    for label, leg in legs:
+        if leg is None:
+            continue
+        if leg["status"] != "success":
+            print(f"{label:<{width}} {'ERREUR':>10}")
+        elif with_count:
+            print(f"{label:<{width}} {leg['execution_time_ms']:>8.2f} ms {leg['count']:>10}")
+        else:
+            print(f"{label:<{width}} {leg['execution_time_ms']:>8.2f} ms")
@@ -0,0 +1,153 @@
+"""
+Rollups horaires pour la Tâche 3
+
+Pour chaque (event_type, heure) : count, sum, min et max de session_duration_ms.
+Les agrégats partiels sont calculés à l'ingestion et fusionnés dans chaque base ;
+une requête sur une fenêtre de temps ne lit alors que les heures concernées
+(O(buckets)) au lieu de tous les logs.
+
+`RollupRefresher` recalcule les rollups depuis les données brutes en tâche de
+fond, après les chargements en masse.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Format des clés horaires : "2025-10-01T14" (préfixe des timestamps ISO)
+HOUR_FORMAT = "%Y-%m-%dT%H"
+
+
+def hour_of(timestamp):
+    if isinstance(timestamp, str):
+        return timestamp[:13]
+    return timestamp.strftime(HOUR_FORMAT)
+
+
+def hour_start(hour):
+    return datetime.strptime(hour, HOUR_FORMAT)
+
+
+def hour_window(date_start, date_end):
+    """Bornes horaires (incluses) d'une fenêtre de dates ISO ; une date seule couvre toute la journée"""
+    if date_start and len(date_start) == 10:
+        date_start += "T00"
+    start = hour_of(date_start) if date_start else None
+    if date_end and len(date_end) == 10:
+        date_end += "T23"
+    end = hour_of(date_end) if date_end else None
+    return start, end
+
+
+def new_partial(value):
+    return {"count": 1, "sum": value or 0, "min": value, "max": value}
+
+
+def merge(target, partial):
+    """Fusionne un agrégat partiel dans `target` (modifié sur place)"""
+    target["count"] += partial["count"]
+    target["sum"] += partial["sum"]
+    for key, pick in (("min", min), ("max", max)):
+        if partial[key] is not None:
+            target[key] = partial[key] if target[key] is None else pick(target[key], partial[key])
+    return target
+
+
+def partials(logs, field="session_duration_ms"):
+    """{(event_type, heure): agrégat partiel} d'une liste de logs"""
+    result = {}
+    for log in logs:
+        key = (log["event_type"], hour_of(log["timestamp"]))
+        partial = new_partial(log.get(field))
+        if key in result:
+            merge(result[key], partial)
+        else:
+            result[key] = partial
+    return result
+
+
+def partials_from_columns(event_types, timestamps_ms, values):
+    """Même résultat que `partials`, calculé sur des colonnes (tri + reduceat par type d'événement)"""
+    result = {}
+    hours = timestamps_ms // 3_600_000
+    for event_type in np.unique(event_types):
+        mask = event_types == event_type
+        event_hours, event_values = hours[mask], values[mask]
+        order = np.argsort(event_hours, kind="stable")
+        event_hours, event_values = event_hours[order], event_values[order]
+        keys, starts, counts = np.unique(event_hours, return_index=True, return_counts=True)
+        sums = np.add.reduceat(event_values, starts)
+        mins = np.minimum.reduceat(event_values, starts)
+        maxs = np.maximum.reduceat(event_values, starts)
+        for key, count, total, low, high in zip(keys, counts, sums, mins, maxs):
+            hour = datetime.fromtimestamp(int(key) * 3600, tz=timezone.utc).strftime(HOUR_FORMAT)
+            result[(str(event_type), hour)] = {
+                "count": int(count), "sum": int(total), "min": int(low), "max": int(high)
+            }
+    return result
+
+
+def finalize(rows):
+    """rows = [(event_type, partial), ...] -> agrégations au format de la Tâche 3"""
+    totals = {}
+    for event_type, partial in rows:
+        if event_type in totals:
+            merge(totals[event_type], partial)
+        else:
+            totals[event_type] = dict(partial)
+    return {
+        event_type: {
+            "count": total["count"],
+            "sum_duration": total["sum"],
+            "avg_duration": round(total["sum"] / total["count"], 2) if total["count"] else 0,
+            "min_duration": total["min"] or 0,
+            "max_duration": total["max"] or 0
+        }
+        for event_type, total in totals.items()
+    }
+
+
+class RollupRefresher:
+    """Recalcul des rollups en tâche de fond ; les demandes pendant un recalcul sont regroupées"""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = False
+        self._status = {}
+
+    def schedule(self):
+        with self._lock:
+            self._pending = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rollup-refresher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._pending = False
+            for name, backend in self.backends.items():
+                self.rebuild(name, backend)
+
+    def rebuild(self, name, backend):
+        start = time.perf_counter()
+        try:
+            backend.rebuild_rollups()
+            status = {"status": "ok"}
+        except Exception as e:
+            status = {"status": "error", "error": str(e)}
+        status["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        status["finished_at"] = datetime.now().isoformat()
+        with self._lock:
+            self._status[name] = status
+
+    def status(self):
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            return {"running": running, "backends": dict(self._status)}
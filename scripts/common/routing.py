@@ -0,0 +1,299 @@
+"""
+Routage adaptatif des requêtes (POST /api/query)
+
+Les tâches interrogent toutes les bases pour les comparer. /api/query répond
+une seule fois, depuis la base la plus rapide pour la forme de requête
+(fulltext, timeline, aggregate...), d'après les latences observées :
+- par (forme, base) : moyenne mobile exponentielle (EWMA) et percentiles
+  p50 / p95 / p99 sur une fenêtre glissante des dernières requêtes
+- classement par ROUTER_SCORE (ewma par défaut) ; les bases pas encore
+  mesurées (moins de ROUTER_MIN_SAMPLES requêtes) gardent l'ordre par défaut
+  de la tâche (Elasticsearch pour le full-text, Cassandra pour les timelines...)
+- exploration : une fraction ROUTER_EXPLORE_RATE des requêtes part vers une
+  autre base, pour que ses statistiques restent à jour
+- bascule : erreur ou dépassement de ROUTER_TIMEOUT_S -> base suivante du
+  classement ; la base fautive est écartée pendant ROUTER_COOLDOWN_S (doublé
+  à chaque échec consécutif, jusqu'à 8x), sauf s'il ne reste qu'elle
+- isolement : au plus ROUTER_MAX_IN_FLIGHT branches en cours par base (branches
+  abandonnées après un dépassement comprises) ; au-delà, la base est sautée
+  tout de suite ("saturated") au lieu de faire attendre la requête derrière
+  elles. Le délai et la latence sont mesurés à partir du démarrage de la branche
+
+Les statistiques sont propres à chaque processus (un routeur par worker gunicorn).
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+
+# Bases candidates (le moteur colonnaire en mémoire reste un outil de benchmark)
+ROUTER_BACKENDS = tuple(os.getenv('ROUTER_BACKENDS', 'elasticsearch,mongodb,cassandra').split(','))
+ROUTER_TIMEOUT_S = float(os.getenv('ROUTER_TIMEOUT_S', 10))
+ROUTER_EWMA_ALPHA = float(os.getenv('ROUTER_EWMA_ALPHA', 0.2))
+ROUTER_WINDOW = int(os.getenv('ROUTER_WINDOW', 200))
+ROUTER_MIN_SAMPLES = int(os.getenv('ROUTER_MIN_SAMPLES', 5))
+ROUTER_EXPLORE_RATE = float(os.getenv('ROUTER_EXPLORE_RATE', 0.05))
+ROUTER_COOLDOWN_S = float(os.getenv('ROUTER_COOLDOWN_S', 30))
+ROUTER_SCORE = os.getenv('ROUTER_SCORE', 'ewma')
+ROUTER_MAX_IN_FLIGHT = int(os.getenv('ROUTER_MAX_IN_FLIGHT', 8))
+
+ROUTER_SCORES = ("ewma", "p50", "p95", "p99")
+# Décisions récentes conservées pour /api/query/metrics
+HISTORY_SIZE = 50
+
+
+def percentile(ordered, q):
+    return ordered[int(q * (len(ordered) - 1))] if ordered else None
+
+
+class LatencyStats:
+    """Latences et échecs d'une base pour une forme de requête"""
+
+    def __init__(self, window=ROUTER_WINDOW, alpha=ROUTER_EWMA_ALPHA):
+        self.samples = deque(maxlen=window)
+        self.alpha = alpha
+        self.ewma = None
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.saturated = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_error = None
+
+    def record_success(self, latency_ms):
+        self.requests += 1
+        self._observe(latency_ms)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record_failure(self, error, cooldown_s, latency_ms=None):
+        """Erreur, ou dépassement du délai si latency_ms est donné (compté dans la moyenne)"""
+        self.requests += 1
+        if latency_ms is None:
+            self.errors += 1
+        else:
+            self.timeouts += 1
+            self._observe(latency_ms)
+        self.last_error = error
+        self.consecutive_failures += 1
+        self.cooldown_until = time.monotonic() + cooldown_s * 2 ** min(self.consecutive_failures - 1, 3)
+
+    def _observe(self, latency_ms):
+        self.samples.append(latency_ms)
+        self.ewma = latency_ms if self.ewma is None else self.alpha * latency_ms + (1 - self.alpha) * self.ewma
+
+    def available(self, now):
+        return self.cooldown_until <= now
+
+    def score(self, metric):
+        if metric == "ewma":
+            return self.ewma
+        return percentile(sorted(self.samples), int(metric[1:]) / 100)
+
+    def stats(self):
+        ordered = sorted(self.samples)
+        cooldown = self.cooldown_until - time.monotonic()
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "saturated": self.saturated,
+            "ewma_ms": round(self.ewma, 2) if self.ewma is not None else None,
+            "p50_ms": percentile(ordered, 0.50),
+            "p95_ms": percentile(ordered, 0.95),
+            "p99_ms": percentile(ordered, 0.99),
+            "samples": len(ordered),
+            "cooldown_s": round(cooldown, 1) if cooldown > 0 else 0,
+            "last_error": self.last_error
+        }
+
+
+class Router:
+    """Choisit la base qui répond à une requête et bascule sur la suivante en cas d'échec"""
+
+    def __init__(self, backends=ROUTER_BACKENDS, timeout_s=ROUTER_TIMEOUT_S, score=ROUTER_SCORE,
+                 min_samples=ROUTER_MIN_SAMPLES, explore_rate=ROUTER_EXPLORE_RATE,
+                 cooldown_s=ROUTER_COOLDOWN_S, max_in_flight=ROUTER_MAX_IN_FLIGHT):
+        if score not in ROUTER_SCORES:
+            raise ValueError(f"ROUTER_SCORE inconnu : {score} (attendu : {', '.join(ROUTER_SCORES)})")
+        self.backends = tuple(backends)
+        self.timeout_s = timeout_s
+        self.score = score
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self.cooldown_s = cooldown_s
+        self.max_in_flight = max_in_flight
+        self.latencies = {}  # (forme, base) -> LatencyStats
+        self.decisions = {}  # forme -> compteurs des décisions
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self._lock = threading.Lock()
+        # Un pool par base : une branche trop lente est abandonnée, pas interrompue, et n'occupe
+        # que des places de sa propre base
+        self._pools = {}  # base -> (pool, places libres)
+
+    def _stats(self, shape, name):
+        key = (shape, name)
+        if key not in self.latencies:
+            self.latencies[key] = LatencyStats()
+        return self.latencies[key]
+
+    # ============ CLASSEMENT ============
+
+    def rank(self, shape, names):
+        """(bases dans l'ordre d'essai, raison du premier choix) ; `names` : ordre par défaut"""
+        now = time.monotonic()
+        with self._lock:
+            stats = {name: self._stats(shape, name) for name in names}
+
+            def key(item):
+                position, name = item
+                measured = len(stats[name].samples) >= self.min_samples
+                # Disponibles d'abord, puis mesurées par score, puis les autres dans l'ordre par défaut
+                return (not stats[name].available(now), not measured,
+                        stats[name].score(self.score) if measured else position, position)
+
+            order = [name for _, name in sorted(enumerate(names), key=key)]
+            first = stats[order[0]]
+            if not first.available(now):
+                reason = "last_resort"
+            elif len(first.samples) >= self.min_samples:
+                reason = "fastest"
+            else:
+                reason = "default"
+
+            others = [name for name in order[1:] if stats[name].available(now)]
+            if others and random.random() < self.explore_rate:
+                # La base la moins mesurée passe devant, le meilleur choix reste la bascule suivante
+                explored = min(others, key=lambda name: len(stats[name].samples))
+                order.remove(explored)
+                order.insert(0, explored)
+                reason = "explore"
+        return order, reason
+
+    # ============ EXÉCUTION ============
+
+    def _pool(self, name):
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = (
+                    ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix=f"router-{name}"),
+                    threading.BoundedSemaphore(self.max_in_flight)
+                )
+            return self._pools[name]
+
+    def _run(self, name, leg, timeout_s):
+        """(réponse de la branche, latence en ms ou None si la base est saturée)"""
+        pool, slots = self._pool(name)
+        if not slots.acquire(blocking=False):
+            return {"status": "saturated",
+                    "error": f"{self.max_in_flight} requêtes déjà en cours sur {name}"}, None
+        started = threading.Event()
+        clock = {}
+
+        def run():
+            clock["start"] = time.perf_counter()
+            started.set()
+            try:
+                return leg()
+            finally:
+                slots.release()
+
+        future = pool.submit(run)
+        # Une place réservée garantit un thread libre : le délai part du démarrage, pas de la mise en file
+        started.wait()
+        try:
+            leg = future.result(timeout=max(0.0, clock["start"] + timeout_s - time.perf_counter()))
+        except FutureTimeout:
+            leg = {"status": "timeout", "error": f"pas de réponse après {timeout_s:g} s"}
+        except Exception as e:
+            leg = {"status": "error", "error": str(e)}
+        return leg, round((time.perf_counter() - clock["start"]) * 1000, 2)
+
+    def execute(self, shape, legs, timeout_s=None):
+        """
+        legs : [(base, branche)] dans l'ordre par défaut, une branche étant un appel sans argument
+        Renvoie (résultat de la branche qui a répondu ou None, décision de routage)
+        """
+        timeout_s = timeout_s or self.timeout_s
+        legs = dict((name, leg) for name, leg in legs if name in self.backends)
+        if not legs:
+            raise ValueError(f"Aucune base routable pour {shape} (ROUTER_BACKENDS : {', '.join(self.backends)})")
+        order, reason = self.rank(shape, list(legs))
+        attempts, result = [], None
+        for name in order:
+            leg, latency_ms = self._run(name, legs[name], timeout_s)
+            with self._lock:
+                stats = self._stats(shape, name)
+                if leg["status"] == "saturated":
+                    # Pas de mesure ni d'écartement : la base sera réessayée dès qu'une place se libère
+                    stats.saturated += 1
+                elif leg["status"] == "success":
+                    stats.record_success(latency_ms)
+                else:
+                    stats.record_failure(leg["error"], self.cooldown_s,
+                                         latency_ms if leg["status"] == "timeout" else None)
+            attempts.append({"backend": name, "status": leg["status"], "latency_ms": latency_ms,
+                             "error": leg.get("error")})
+            if leg["status"] == "success":
+                result = leg
+                break
+
+        decision = {
+            "shape": shape,
+            "backend": attempts[-1]["backend"] if result else None,
+            "reason": reason,
+            "ranking": order,
+            "failovers": len(attempts) - 1 if result else len(attempts),
+            "attempts": attempts
+        }
+        self._count(decision)
+        return result, decision
+
+    def _count(self, decision):
+        with self._lock:
+            counters = self.decisions.setdefault(decision["shape"], {
+                "requests": 0, "failed": 0, "failovers": 0, "reasons": {}, "served_by": {}
+            })
+            counters["requests"] += 1
+            counters["failovers"] += decision["failovers"]
+            counters["reasons"][decision["reason"]] = counters["reasons"].get(decision["reason"], 0) + 1
+            if decision["backend"]:
+                counters["served_by"][decision["backend"]] = counters["served_by"].get(decision["backend"], 0) + 1
+            else:
+                counters["failed"] += 1
+            self.history.appendleft({
+                "at": datetime.now().isoformat(timespec="seconds"),
+                "shape": decision["shape"],
+                "backend": decision["backend"],
+                "reason": decision["reason"],
+                "attempts": [(attempt["backend"], attempt["status"]) for attempt in decision["attempts"]]
+            })
+
+    # ============ MÉTRIQUES ============
+
+    def snapshot(self):
+        with self._lock:
+            shapes = {}
+            for (shape, name), stats in self.latencies.items():
+                shapes.setdefault(shape, {})[name] = stats.stats()
+            return {
+                "config": {
+                    "backends": list(self.backends),
+                    "score": self.score,
+                    "timeout_s": self.timeout_s,
+                    "min_samples": self.min_samples,
+                    "explore_rate": self.explore_rate,
+                    "cooldown_s": self.cooldown_s,
+                    "max_in_flight": self.max_in_flight
+                },
+                "latencies": shapes,
+                "decisions": {shape: dict(counters, reasons=dict(counters["reasons"]),
+                                          served_by=dict(counters["served_by"]))
+                              for shape, counters in self.decisions.items()},
+                "recent": list(self.history)
+            }
@@ -0,0 +1,236 @@
+"""
+Sketches fusionnables pour l'agrégation approchée (Tâche 3, source=approx)
+
+- TDigest      : percentiles de session_duration_ms (fonction d'échelle k1)
+- HyperLogLog  : nombre de user_id distincts
+
+Chaque sketch est construit sur une partie des données (plage de tokens
+Cassandra, page de résultats...) puis fusionné avec `merge` : le résultat ne
+dépend pas de l'ordre ni du découpage. Les estimations sont accompagnées de
+leurs bornes d'erreur.
+"""
+
+import math
+
+import numpy as np
+
+from scripts.common.columns import column_length, numeric
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# δ du t-digest : environ δ/2 centroïdes, erreur de rang π·√(q(1-q)) / δ
+COMPRESSION = 200
+
+
+# ============================================================================
+# T-DIGEST
+# ============================================================================
+
+class TDigest:
+    """Centroïdes (moyenne, poids) dont la taille est bornée par la fonction d'échelle k1"""
+
+    def __init__(self, compression=COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self):
+        return int(self.weights.sum())
+
+    def _scale(self, q):
+        # k1(q) = δ / 2π · asin(2q - 1)
+        return self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))
+
+    def _compress(self, means, weights):
+        if not len(means):
+            return
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Les points dont le rang de début tombe dans le même intervalle unitaire de k forment un centroïde
+        left = (np.cumsum(weights) - weights) / total
+        clusters = np.floor(self._scale(left)).astype(np.int64)
+        _, starts = np.unique(clusters, return_index=True)
+        cluster_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / cluster_weights
+        self.weights = cluster_weights
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return self
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        if other.count:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]),
+                           np.concatenate([self.weights, other.weights]))
+        return self
+
+    def quantile(self, q):
+        if not len(self.means):
+            return None
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0], centers, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * total, positions, values))
+
+    def rank_error(self, q):
+        """Demi-largeur (en rang) d'un centroïde autour de q : π·√(q(1-q)) / δ"""
+        return math.pi * math.sqrt(q * (1 - q)) / self.compression
+
+    def estimate(self, q):
+        error = self.rank_error(q)
+        value = self.quantile(q)
+        return {
+            "value": round(value, 2) if value is not None else None,
+            "rank_error": round(error, 5),
+            "bounds": [round(self.quantile(max(0.0, q - error)), 2), round(self.quantile(min(1.0, q + error)), 2)]
+            if value is not None else None
+        }
+
+
+# ============================================================================
+# HYPERLOGLOG
+# ============================================================================
+
+def _hash64(values):
+    """Hachage splitmix64 vectorisé d'entiers"""
+    x = np.asarray(values).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class HyperLogLog:
+    """2^p registres ; erreur relative standard 1.04 / √(2^p)"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_many(self, values):
+        if not len(values):
+            return self
+        hashes = _hash64(values)
+        suffix_bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        remainder = (hashes & np.uint64((1 << suffix_bits) - 1)).astype(np.float64)
+        # rang = position du premier bit à 1 dans les bits restants (frexp : x = m·2^e, m ∈ [0.5, 1))
+        _, exponents = np.frexp(remainder)
+        ranks = np.where(remainder > 0, suffix_bits - exponents + 1, suffix_bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, indexes, ranks)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def cardinality(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Petites cardinalités : comptage linéaire
+            return m * math.log(m / zeros)
+        return raw
+
+    def estimate(self):
+        value = self.cardinality()
+        # ±2 erreurs standard (≈ 95 %)
+        margin = 2 * self.relative_error
+        return {
+            "value": round(value),
+            "relative_error": round(self.relative_error, 5),
+            "bounds": [round(value * (1 - margin)), round(value * (1 + margin))]
+        }
+
+
+# ============================================================================
+# SKETCHES PAR TYPE D'ÉVÉNEMENT
+# ============================================================================
+
+class EventSketch:
+    """Percentiles des durées + utilisateurs distincts d'un type d'événement"""
+
+    def __init__(self, compression=COMPRESSION, precision=12):
+        self.digest = TDigest(compression)
+        self.users = HyperLogLog(precision)
+        self.count = 0
+
+    def add_many(self, durations, user_ids):
+        self.count += len(durations)
+        self.digest.add_many(durations)
+        self.users.add_many(user_ids)
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.digest.merge(other.digest)
+        self.users.merge(other.users)
+        return self
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "percentiles": {percentile_key(q): self.digest.estimate(q) for q in PERCENTILES},
+            "distinct_users": self.users.estimate()
+        }
+
+
+def percentile_key(q):
+    return f"p{round(q * 100)}"
+
+
+def exact_summary(durations, user_ids):
+    """Valeurs exactes au même format (erreur nulle), pour comparaison"""
+    durations = np.asarray(durations, dtype=float)
+    distinct = int(len(np.unique(user_ids)))
+    percentiles = {}
+    for q in PERCENTILES:
+        value = round(float(np.quantile(durations, q)), 2)
+        percentiles[percentile_key(q)] = {"value": value, "rank_error": 0.0, "bounds": [value, value]}
+    return {
+        "count": int(len(durations)),
+        "percentiles": percentiles,
+        "distinct_users": {"value": distinct, "relative_error": 0.0, "bounds": [distinct, distinct]}
+    }
+
+
+def event_sketches(columns, wanted):
+    """{event_type: EventSketch} d'un lot de colonnes (event_type, user_id, session_duration_ms)"""
+    sketches = {}
+    if not column_length(columns):
+        return sketches
+    event_types = columns["event_type"]
+    for event_type in wanted.intersection(np.unique(event_types).tolist()):
+        mask = event_types == event_type
+        durations = numeric(columns["session_duration_ms"][mask])
+        sketches[event_type] = EventSketch().add_many(durations, columns["user_id"][mask])
+    return sketches
+
+
+def merge_sketches(target, sketches):
+    """Fusionne {event_type: EventSketch} dans `target` (modifié sur place)"""
+    for event_type, sketch in sketches.items():
+        if event_type in target:
+            target[event_type].merge(sketch)
+        else:
+            target[event_type] = sketch
+    return target
@@ -0,0 +1,158 @@
+"""
+Journal échantillonné des requêtes lentes
+
+Toute requête dont la durée dépasse SLOW_QUERY_MS est enregistrée avec la forme
+normalisée de la requête, ses paramètres, le nombre de lignes et les timings par phase :
+- dans un fichier local avec rotation (JSON lines), un par processus : la
+  rotation n'a qu'un écrivain même avec plusieurs workers gunicorn
+- dans un buffer circulaire en mémoire (exposé par l'API, propre au worker)
+
+L'échantillonnage (SLOW_QUERY_SAMPLE_RATE) et le plafond par seconde
+(SLOW_QUERY_MAX_PER_SEC) gardent un coût prévisible sous charge.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', 1.0))
+SLOW_QUERY_MAX_PER_SEC = int(os.getenv('SLOW_QUERY_MAX_PER_SEC', 20))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv('SLOW_QUERY_BUFFER_SIZE', 200))
+SLOW_QUERY_LOG_DIR = os.getenv('SLOW_QUERY_LOG_DIR', '/tmp/nosql_tp')
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """
+    Forme normalisée d'une requête : les littéraux sont remplacés par '?'
+    - CQL (str) : chaînes et nombres
+    - MongoDB / Elasticsearch (dict, list) : valeurs feuilles, les clés sont conservées
+    """
+    if isinstance(query, str):
+        shape = _STRING_LITERAL_RE.sub("?", query)
+        shape = _NUMBER_RE.sub("?", shape)
+        return _SPACES_RE.sub(" ", shape).strip()
+    return _normalize_document(query)
+
+
+def _normalize_document(node):
+    if isinstance(node, dict):
+        return {key: _normalize_document(value) for key, value in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [_normalize_document(value) for value in node]
+    return "?"
+
+
+class SlowQueryLog:
+    """Enregistreur de requêtes lentes (seuil + échantillonnage + plafond par seconde)"""
+
+    def __init__(self, name, threshold_ms=SLOW_QUERY_MS, sample_rate=SLOW_QUERY_SAMPLE_RATE,
+                 max_per_second=SLOW_QUERY_MAX_PER_SEC, buffer_size=SLOW_QUERY_BUFFER_SIZE,
+                 log_dir=SLOW_QUERY_LOG_DIR):
+        self.name = name
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._window = 0
+        self._window_count = 0
+        self.recorded = 0
+        self.dropped = 0
+        self.log_dir = log_dir
+        self._logger = None
+        self._pid = None
+
+    def _worker_logger(self):
+        # Créé dans le processus qui écrit (après le fork des workers, GUNICORN_PRELOAD=1 compris)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._logger = self._build_logger(self.log_dir)
+        return self._logger
+
+    def _build_logger(self, log_dir):
+        logger = logging.getLogger(f"slow_queries.{self.name}.{self._pid}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if logger.handlers:
+            return logger
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(log_dir, f"slow_queries_{self.name}_{self._pid}.log"),
+                maxBytes=5 * 1024 * 1024,
+                backupCount=3
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        except OSError:
+            # Pas de fichier disponible : seul le buffer mémoire est alimenté
+            logger.addHandler(logging.NullHandler())
+        return logger
+
+    def _admit(self):
+        """Échantillonnage puis plafond d'enregistrements par seconde"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        now = int(time.monotonic())
+        with self._lock:
+            if now != self._window:
+                self._window = now
+                self._window_count = 0
+            if self._window_count >= self.max_per_second:
+                self.dropped += 1
+                return False
+            self._window_count += 1
+            return True
+
+    def record(self, backend, operation, query, params=None, rows=None, timings=None):
+        """Enregistre l'appel s'il dépasse le seuil ; renvoie True s'il a été journalisé"""
+        duration_ms = (timings or {}).get("total_ms", 0)
+        if duration_ms < self.threshold_ms or not self._admit():
+            return False
+
+        entry = {
+            "ts": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+            "source": self.name,
+            "backend": backend,
+            "operation": operation,
+            "query_shape": normalize_query(query),
+            "params": params,
+            "rows": rows,
+            "duration_ms": duration_ms,
+            "timings": timings
+        }
+        with self._lock:
+            self._buffer.append(entry)
+            self.recorded += 1
+        self._worker_logger().info(json.dumps(entry, default=str))
+        return True
+
+    def entries(self, limit=None):
+        with self._lock:
+            items = list(self._buffer)
+        items.reverse()
+        return items[:limit] if limit else items
+
+    def describe(self, limit=None):
+        return {
+            "scope": "worker",
+            "pid": os.getpid(),
+            "threshold_ms": self.threshold_ms,
+            "sample_rate": self.sample_rate,
+            "max_per_second": self.max_per_second,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "entries": self.entries(limit)
+        }
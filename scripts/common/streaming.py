@@ -0,0 +1,91 @@
+"""
+Diffusion des résultats des tâches au fil de l'eau (POST /api/stream/<tâche>)
+
+Les branches (une par base et par tâche) s'exécutent en parallèle ; chaque
+résultat est envoyé dès qu'il est prêt, puis un résumé clôt le flux. Le
+tableau de bord affiche ainsi la base la plus rapide sans attendre le scan
+Cassandra le plus lent.
+
+Formats :
+- sse    : text/event-stream (`event: leg` + `data: {...}`), commentaires `: keep-alive`
+- ndjson : application/x-ndjson, un objet JSON par ligne avec un champ "event",
+           lignes vides comme battements de cœur
+
+Événements : start (tâches, paramètres, bases attendues), leg (résultat d'une
+branche + elapsed_ms depuis le début du flux), summary (ordre d'arrivée par tâche).
+"""
+
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STREAM_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+# Battement de cœur pendant les branches longues (proxies qui coupent les connexions inactives)
+STREAM_HEARTBEAT_S = float(os.getenv('STREAM_HEARTBEAT_S', 15))
+
+
+def encode(fmt, event, payload, dumps=json.dumps):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {dumps(payload)}\n\n"
+    return dumps(dict(payload, event=event)) + "\n"
+
+
+def heartbeat(fmt):
+    return ": keep-alive\n\n" if fmt == "sse" else "\n"
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def summarize(arrivals, start):
+    """Ordre d'arrivée, première et dernière réponse de chaque tâche"""
+    tasks = {}
+    for task, legs in arrivals.items():
+        succeeded = [name for name, _, leg in legs if leg.get("status") == "success"]
+        tasks[task] = {
+            "order": [name for name, _, _ in legs],
+            "fastest": succeeded[0] if succeeded else None,
+            "first_ms": legs[0][1] if legs else None,
+            "last_ms": legs[-1][1] if legs else None,
+            "errors": [name for name, _, leg in legs if leg.get("status") != "success"]
+        }
+    return {"tasks": tasks, "total_ms": elapsed_ms(start)}
+
+
+def stream_legs(tasks, fmt="sse", dumps=json.dumps):
+    """
+    tasks : {tâche: (en-tête, [(base, branche)])}, une branche étant un appel sans argument
+    Génère les événements start, leg (dans l'ordre de fin des branches) et summary
+    """
+    start = time.perf_counter()
+    yield encode(fmt, "start", {"tasks": {
+        task: dict(header, backends=[name for name, _ in legs]) for task, (header, legs) in tasks.items()
+    }}, dumps)
+
+    jobs = [(task, name, leg) for task, (_, legs) in tasks.items() for name, leg in legs]
+    executor = ThreadPoolExecutor(max_workers=max(1, len(jobs)), thread_name_prefix="stream-leg")
+    futures = {executor.submit(leg): (task, name) for task, name, leg in jobs}
+    arrivals = {task: [] for task in tasks}
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=STREAM_HEARTBEAT_S, return_when=FIRST_COMPLETED)
+            if not done:
+                yield heartbeat(fmt)
+                continue
+            for future in done:
+                task, name = futures[future]
+                try:
+                    leg = future.result()
+                except Exception as e:
+                    leg = {"status": "error", "error": str(e)}
+                arrived = elapsed_ms(start)
+                arrivals[task].append((name, arrived, leg))
+                yield encode(fmt, "leg", {"task": task, "backend": name, "elapsed_ms": arrived, "result": leg},
+                             dumps)
+        yield encode(fmt, "summary", summarize(arrivals, start), dumps)
+    finally:
+        # Client déconnecté avant la fin : les branches pas encore lancées sont annulées
+        executor.shutdown(wait=False, cancel_futures=True)
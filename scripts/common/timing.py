@@ -0,0 +1,84 @@
+"""
+Mesure du temps par phase pour chaque branche (leg) d'une tâche
+
+Phases mesurées :
+- connect    : connexion / acquisition du client
+- query      : envoi de la requête
+- first_row  : latence jusqu'à la première ligne
+- fetch      : lecture du reste des résultats (pages, curseur)
+- client     : filtrage / agrégation côté Python
+- serialize  : conversion des résultats en JSON
+"""
+
+import time
+from contextlib import contextmanager
+
+PHASES = ("connect", "query", "first_row", "fetch", "client", "serialize")
+
+# Phases qui composent l'ancien `execution_time_ms` (hors connexion et sérialisation)
+EXECUTION_PHASES = ("query", "first_row", "fetch", "client")
+
+_EMPTY = object()
+
+
+class PhaseTimer:
+    """Chronomètre découpé en phases, avec des spans optionnels pour la trace"""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._durations = {phase: 0.0 for phase in PHASES}
+        self._spans = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._durations[name] = self._durations.get(name, 0.0) + (end - start) * 1000
+            self._spans.append({
+                "name": name,
+                "start_ms": round((start - self._origin) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3)
+            })
+
+    def elapsed(self, *phases):
+        """Somme des durées (ms) des phases demandées"""
+        return round(sum(self._durations.get(p, 0.0) for p in phases), 2)
+
+    def execution_time_ms(self):
+        return self.elapsed(*EXECUTION_PHASES)
+
+    def as_dict(self):
+        timings = {f"{name}_ms": round(value, 2) for name, value in self._durations.items()}
+        timings["total_ms"] = self.elapsed(*self._durations)
+        return timings
+
+    def spans(self):
+        return list(self._spans)
+
+
+def drain(iterable, timer):
+    """
+    Consomme un résultat (curseur Mongo, ResultSet Cassandra) en séparant
+    la latence de la première ligne du temps de lecture du reste
+    """
+    iterator = iter(iterable)
+    with timer.phase("first_row"):
+        first = next(iterator, _EMPTY)
+    with timer.phase("fetch"):
+        if first is _EMPTY:
+            return []
+        rows = [first]
+        rows.extend(iterator)
+    return rows
+
+
+def finalize_leg(leg, timer, trace=False):
+    """Ajoute execution_time_ms, timings et (optionnellement) la trace à un résultat"""
+    leg["execution_time_ms"] = timer.execution_time_ms()
+    leg["timings"] = timer.as_dict()
+    if trace:
+        leg["trace"] = timer.spans()
+    return leg
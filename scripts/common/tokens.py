@@ -0,0 +1,24 @@
+"""
+Tokenisation des descriptions (à l'ingestion et à la requête)
+
+Minuscules + suppression des accents ("Réussie" -> "reussie") puis découpage
+sur les caractères non alphanumériques. Le même découpage est appliqué aux
+documents et au texte recherché : une recherche par token devient une simple
+égalité servie par un index (multikey MongoDB, index de collection Cassandra).
+"""
+
+import re
+import unicodedata
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold(text):
+    """Minuscules sans accents"""
+    decomposed = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Ensemble trié des tokens normalisés d'un texte"""
+    return sorted(set(_TOKEN_RE.findall(fold(text))))
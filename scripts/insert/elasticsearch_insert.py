@@ -1,54 +1,23 @@
 # Fichier : elasticsearch_insert.py
 
-import json
 import os
-from elasticsearch import Elasticsearch, helpers
+import sys
+
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.backends import get_backend
+from scripts.common.loader import run_loader
 
-# Configuration pour Docker
-ES_HOST = os.getenv('ES_HOST', 'elasticsearch')
-ES_PORT = int(os.getenv('ES_PORT', 9200))
-INDEX_NAME = "ecommerce_logs"
 
 def insert_elasticsearch():
     print("Connexion à Elasticsearch...")
-    
-    es = Elasticsearch(
-        hosts=[{'host': ES_HOST, 'port': ES_PORT, 'scheme': 'http'}],
-    )
-    
-    # 1. Vérification de la connexion et suppression de l'index précédent
-    try:
-        if es.indices.exists(index=INDEX_NAME):
-            es.indices.delete(index=INDEX_NAME)
-        print(f"Index '{INDEX_NAME}' réinitialisé.")
-    except Exception as e:
-        print(f"Attention: {e}")
-
-    # 2. Chargement des données
-    with open("/app/scripts/data/ecommerce_logs.json", "r") as f:
-        data = json.load(f)
-        
-    print(f"Début de l'indexation de {len(data)} documents...")
-    
-    # 3. Préparation des actions pour l'insertion en masse (Bulk)
-    actions = []
-    for log in data:
-        action = {
-            "_index": INDEX_NAME,
-            "_id": log["log_id"], 
-            "_source": log
-        }
-        actions.append(action)
+    es = get_backend("elasticsearch")
 
-    # 4. Exécution de l'insertion en masse
+    # Indexation par lots (op_type create, _id = log_id) : un document déjà indexé est ignoré
     try:
-        success, errors = helpers.bulk(es, actions)
-        
-        if not errors:
-            print(f"✅ Indexation Elasticsearch terminée. {success} documents indexés.")
-        else:
-            print(f"❌ Erreur lors de l'indexation. Nombre d'erreurs: {len(errors)}")
-
+        run_loader(es, "Chargement incrémental des logs dans Elasticsearch")
+        print("✅ Indexation Elasticsearch terminée.")
     except Exception as e:
         print(f"❌ Erreur critique : {e}")
 
@@ -1,45 +1,24 @@
 # Fichier : mongo_insert.py
 
-import json
 import os
-from pymongo import MongoClient
+import sys
+
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.backends import get_backend
+from scripts.common.loader import run_loader
 
-# Configuration pour Docker
-MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
-MONGO_PORT = int(os.getenv('MONGO_PORT', 27017))
-MONGO_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
-DB_NAME = "nosql_tp"
-COLLECTION_NAME = "logs_ecommerce"
 
 def insert_mongo():
     print("Connexion à MongoDB...")
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    collection = db[COLLECTION_NAME]
-    
-    # Effacer l'ancienne collection pour un test propre
-    collection.drop()
-
-    print(f"Chargement de 'ecommerce_logs.json'...")
-    with open("/app/scripts/data/ecommerce_logs.json", "r") as f:
-        data = json.load(f)
-
-    print(f"Début de l'insertion de {len(data)} documents...")
-    
-    # Insertion en masse pour de meilleures performances
-    collection.insert_many(data)
-
-    print(f"✅ Insertion MongoDB terminée. {len(data)} documents insérés.")
-    
-    # Création d'index pour accélérer les requêtes
-    collection.create_index("user_id")
-    print("Index 'user_id' créé.")
-    
-    # Création d'un index texte pour la recherche full-text (Tâche 1)
-    collection.create_index([("description", "text")])
-    print("Index 'text' sur 'description' créé.")
-
-    client.close()
+    mongo = get_backend("mongodb")
+
+    # Index (user_id, log_id unique, texte, tokens) créés par setup avant le chargement :
+    # l'index unique sur log_id sert les upserts idempotents
+    run_loader(mongo, "Chargement incrémental des logs dans MongoDB")
+
+    print("✅ Insertion MongoDB terminée.")
 
 if __name__ == "__main__":
     insert_mongo()
@@ -0,0 +1,51 @@
+# Fichier : primary_insert.py
+
+import json
+import os
+import sys
+import time
+
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.backends import get_backend
+from scripts.common.changelog import REPLICATION_PRIMARY, Changelog, Propagator, write_primary
+from scripts.common.loader import forget_checkpoints
+
+DATA_FILE = "/app/scripts/data/ecommerce_logs.json"
+
+# Bases alimentées depuis le journal (le moteur colonnaire charge directement le fichier)
+SECONDARIES = ("cassandra", "mongodb", "elasticsearch")
+
+
+def insert_primary():
+    primary = get_backend(REPLICATION_PRIMARY)
+    secondaries = {name: get_backend(name) for name in SECONDARIES if name != REPLICATION_PRIMARY}
+    changelog = Changelog()
+
+    # Rechargement complet : bases et journal repartent de zéro
+    print(f"Réinitialisation de {REPLICATION_PRIMARY} (primaire) et de {', '.join(secondaries)}...")
+    primary.setup()
+    primary.reset()
+    for backend in secondaries.values():
+        backend.reset()
+    changelog.reset()
+    # Bases vidées : les chargements incrémentaux (make data-insert) repartent du début
+    forget_checkpoints([REPLICATION_PRIMARY, *secondaries])
+
+    with open(DATA_FILE, "r") as f:
+        data = json.load(f)
+
+    start = time.perf_counter()
+    inserted, offsets = write_primary(primary, changelog, data)
+    print(f"✅ {inserted} logs écrits dans {REPLICATION_PRIMARY} + journal "
+          f"(offsets {offsets['first']}-{offsets['end']}) en {time.perf_counter() - start:.1f}s")
+
+    propagator = Propagator(changelog, secondaries)
+    for name in secondaries:
+        start = time.perf_counter()
+        offset = propagator.drain(name)
+        print(f"✅ {name} à jour (checkpoint {offset}) en {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    insert_primary()
@@ -0,0 +1,150 @@
+"""
+Benchmark de la compression réseau : CPU contre volume transféré
+
+Pour chaque base et chaque réglage (CASSANDRA_COMPRESSION, MONGO_COMPRESSORS,
+ES_HTTP_COMPRESS), un sous-processus lance la même charge de lecture (Tâche 1
+avec un gros échantillon, Tâche 2) et mesure le temps, le CPU du client et les
+octets échangés sur le réseau (/proc/net/dev). Avec --http URL, les réponses
+de l'API sont aussi comparées en identity / gzip / brotli.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.common.report import selected
+
+REPEAT = int(os.getenv('COMPRESSION_BENCH_REPEAT', 5))
+
+# (base, libellé, variables d'environnement)
+SETTINGS = [
+    ("cassandra", "aucune", {"CASSANDRA_COMPRESSION": "none"}),
+    ("cassandra", "lz4", {"CASSANDRA_COMPRESSION": "lz4"}),
+    ("cassandra", "snappy", {"CASSANDRA_COMPRESSION": "snappy"}),
+    ("mongodb", "aucune", {"MONGO_COMPRESSORS": ""}),
+    ("mongodb", "zstd", {"MONGO_COMPRESSORS": "zstd"}),
+    ("mongodb", "snappy", {"MONGO_COMPRESSORS": "snappy"}),
+    ("mongodb", "zlib", {"MONGO_COMPRESSORS": "zlib"}),
+    ("elasticsearch", "aucune", {"ES_HTTP_COMPRESS": "0"}),
+    ("elasticsearch", "gzip", {"ES_HTTP_COMPRESS": "1"}),
+]
+
+WORKLOAD = [
+    ("fulltext", {"event_type": "ERROR_404", "search_text": "critique", "sample_size": 1000}),
+    ("latest_for_user", {"user_id": 10, "limit": 1000, "sample_size": 1000}),
+]
+
+
+def network_bytes():
+    """(reçus, envoyés) sur toutes les interfaces sauf lo"""
+    received = sent = 0
+    with open("/proc/net/dev") as f:
+        for line in f.readlines()[2:]:
+            interface, _, counters = line.partition(":")
+            if interface.strip() == "lo":
+                continue
+            values = counters.split()
+            received += int(values[0])
+            sent += int(values[8])
+    return received, sent
+
+
+def cpu_ms():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return (usage.ru_utime + usage.ru_stime) * 1000
+
+
+def run_worker(name):
+    """Sous-processus : la connexion est créée avec les variables d'environnement du réglage"""
+    from scripts.backends import get_backend, run_leg
+
+    backend = get_backend(name)
+    # Connexion et préparation hors mesure
+    for operation, params in WORKLOAD:
+        run_leg(backend, operation, params)
+
+    received, sent = network_bytes()
+    cpu, start = cpu_ms(), time.perf_counter()
+    errors = []
+    for _ in range(REPEAT):
+        for operation, params in WORKLOAD:
+            leg = run_leg(backend, operation, params)
+            if leg["status"] != "success":
+                errors.append(leg["error"])
+    wall = (time.perf_counter() - start) * 1000
+    cpu = cpu_ms() - cpu
+    after_received, after_sent = network_bytes()
+    print(json.dumps({
+        "wall_ms": round(wall / REPEAT, 2),
+        "cpu_ms": round(cpu / REPEAT, 2),
+        "received_kb": round((after_received - received) / REPEAT / 1024, 1),
+        "sent_kb": round((after_sent - sent) / REPEAT / 1024, 1),
+        "error": errors[0] if errors else None
+    }))
+
+
+def run_setting(name, env):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", name],
+        env=dict(os.environ, **env), capture_output=True, text=True
+    )
+    try:
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"error": (result.stderr.strip().splitlines() or ["échec du sous-processus"])[-1]}
+
+
+def bench_http(url):
+    """Taille et temps des réponses de l'API selon Accept-Encoding"""
+    print(f"\nAPI : {url}")
+    print(f"{'Encodage':<12} {'Taille':>12} {'Temps':>12}")
+    print("-" * 38)
+    for encoding in ("identity", "gzip", "br"):
+        request = urllib.request.Request(url, data=b"{}", method="POST",
+                                         headers={"Accept-Encoding": encoding, "Content-Type": "application/json"})
+        start = time.perf_counter()
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+            served = response.headers.get("Content-Encoding", "identity")
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{served:<12} {len(body) / 1024:>9.1f} Ko {elapsed:>9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la compression réseau")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--http", help="URL d'une route POST de l'API à comparer (ex. http://api:5050/api/task1)")
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args.worker)
+        return
+
+    print("=" * 78)
+    print(f"COMPRESSION RÉSEAU (moyenne sur {REPEAT} exécutions de la charge)")
+    print("=" * 78)
+    print(f"{'Base':<15} {'Réglage':<10} {'Temps':>11} {'CPU client':>12} {'Reçu':>12} {'Envoyé':>12}")
+    print("-" * 78)
+    for name, label, env in SETTINGS:
+        if not selected(name):
+            continue
+        result = run_setting(name, env)
+        if result.get("error"):
+            print(f"{name:<15} {label:<10} ERREUR ({result['error']})")
+            continue
+        print(f"{name:<15} {label:<10} {result['wall_ms']:>8.2f} ms {result['cpu_ms']:>9.2f} ms "
+              f"{result['received_kb']:>9.1f} Ko {result['sent_kb']:>9.1f} Ko")
+
+    if args.http:
+        bench_http(args.http)
+
+
+if __name__ == "__main__":
+    main()
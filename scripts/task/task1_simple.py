@@ -4,93 +4,56 @@ Trouver les événements ERROR_404 d'octobre 2025 avec "critique" dans la descri
 """
 
 import os
-import time
+import sys
 
-# Configuration
-CASSANDRA_HOST = os.getenv('CASSANDRA_HOST', 'cassandra')
-MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
-ES_HOST = os.getenv('ES_HOST', 'elasticsearch')
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.backends import get_backend, run_leg
+from scripts.common.report import print_leg, print_summary, selected
+
+PARAMS = {
+    "event_type": "ERROR_404",
+    "search_text": "critique",
+    "date_start": "2025-10-01",
+    "date_end": "2025-10-31"
+}
 
 print("="*60)
 print("TÂCHE 1 : Recherche Full-Text")
 print("="*60)
+print()
 
-# ============ ELASTICSEARCH ============
-from elasticsearch import Elasticsearch
-es = Elasticsearch(hosts=[{'host': ES_HOST, 'port': 9200, 'scheme': 'http'}])
-
-query = {
-    "query": {
-        "bool": {
-            "must": [
-                {"match": {"description": "critique failed"}},
-                {"range": {"timestamp": {"gte": "2025-10-01", "lte": "2025-10-31"}}}
-            ],
-            "filter": [{"term": {"event_type.keyword": "ERROR_404"}}]
-        }
-    }
-}
-
-start = time.time()
-result = es.search(index="ecommerce_logs", body=query, size=1000)
-es_time = (time.time() - start) * 1000
-es_count = result['hits']['total']['value']
+es_leg = mongo_leg = cass_leg = columnar_leg = None
 
-print(f"\nElasticsearch : {es_count} résultats en {es_time:.2f} ms")
+# ============ ELASTICSEARCH ============
+if selected("elasticsearch"):
+    es_leg = print_leg("Elasticsearch", run_leg(get_backend("elasticsearch"), "fulltext", PARAMS))
 
 # ============ MONGODB ============
-from pymongo import MongoClient
-client = MongoClient(f"mongodb://{MONGO_HOST}:27017/")
-collection = client["nosql_tp"]["logs_ecommerce"]
-
-# Avec $regex
-start = time.time()
-results = list(collection.find({
-    "event_type": "ERROR_404",
-    "timestamp": {"$gte": "2025-10-01", "$lte": "2025-10-31"},
-    "description": {"$regex": "critique|failed", "$options": "i"}
-}))
-mongo_time = (time.time() - start) * 1000
-mongo_count = len(results)
-
-print(f"MongoDB ($regex) : {mongo_count} résultats en {mongo_time:.2f} ms")
+if selected("mongodb"):
+    # Avec $regex
+    mongo_leg = print_leg("MongoDB ($regex)", run_leg(get_backend("mongodb"), "fulltext", PARAMS))
 
-# Avec index $text
-start = time.time()
-try:
-    results = list(collection.find({
-        "$text": {"$search": "critique failed"},
-        "event_type": "ERROR_404"
-    }))
-    mongo_text_time = (time.time() - start) * 1000
-    mongo_text_count = len(results)
-    print(f"MongoDB ($text)  : {mongo_text_count} résultats en {mongo_text_time:.2f} ms")
-except:
-    print("MongoDB ($text)  : Index non disponible")
-
-client.close()
+    # Avec index $text
+    mongo_text_leg = run_leg(get_backend("mongodb"), "fulltext", dict(PARAMS, mode="text"))
+    if mongo_text_leg["status"] == "success":
+        print_leg("MongoDB ($text)", mongo_text_leg)
+    else:
+        print(f"{'MongoDB ($text)':<20}: Index non disponible")
 
 # ============ CASSANDRA ============
-from cassandra.cluster import Cluster
-cluster = Cluster([CASSANDRA_HOST], port=9042)
-session = cluster.connect("nosql_tp")
-
-start = time.time()
-rows = list(session.execute("SELECT * FROM logs_by_user WHERE event_type = 'ERROR_404' ALLOW FILTERING"))
-filtered = [r for r in rows if 'critique' in r.description.lower()]
-cass_time = (time.time() - start) * 1000
-cass_count = len(filtered)
+if selected("cassandra"):
+    cass_leg = print_leg("Cassandra", run_leg(get_backend("cassandra"), "fulltext", PARAMS), " (scan complet!)")
 
-print(f"Cassandra        : {cass_count} résultats en {cass_time:.2f} ms (scan complet!)")
-
-cluster.shutdown()
+# ============ COLONNAIRE (EN MÉMOIRE) ============
+if selected("columnar"):
+    columnar_leg = print_leg("Colonnaire", run_leg(get_backend("columnar"), "fulltext", PARAMS), " (borne basse)")
 
 # ============ RÉSUMÉ ============
-print("\n" + "="*60)
-print("RÉSUMÉ TÂCHE 1")
-print("="*60)
-print(f"{'SGBD':<20} {'Temps':>10} {'Résultats':>10}")
-print("-"*40)
-print(f"{'Elasticsearch':<20} {es_time:>8.2f} ms {es_count:>10}")
-print(f"{'MongoDB':<20} {mongo_time:>8.2f} ms {mongo_count:>10}")
-print(f"{'Cassandra':<20} {cass_time:>8.2f} ms {cass_count:>10}")
+print_summary("RÉSUMÉ TÂCHE 1", [
+    ("Elasticsearch", es_leg),
+    ("MongoDB", mongo_leg),
+    ("Cassandra", cass_leg),
+    ("Colonnaire (mémoire)", columnar_leg)
+])
@@ -20,79 +20,62 @@ MONGODB :
 """
 
 import os
-import time
+import sys
 
-# Configuration
-CASSANDRA_HOST = os.getenv('CASSANDRA_HOST', 'cassandra')
-MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
-ES_HOST = os.getenv('ES_HOST', 'elasticsearch')
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.backends import get_backend, run_leg
+from scripts.common.report import print_leg, print_summary, selected
+
+PARAMS = {"user_id": 10, "limit": 100}
 
 print("="*60)
 print("TÂCHE 2 : Accès Ciblé (user_id=10, 100 derniers logs)")
 print("="*60)
+print()
 
-# ============ CASSANDRA ============
-from cassandra.cluster import Cluster
-cluster = Cluster([CASSANDRA_HOST], port=9042)
-session = cluster.connect("nosql_tp")
-
-start = time.time()
-rows = list(session.execute("SELECT * FROM logs_by_user WHERE user_id = 10 LIMIT 100"))
-cass_time = (time.time() - start) * 1000
-cass_count = len(rows)
+cass_leg = cass_bucket_leg = mongo_leg_no_idx = mongo_leg_idx = es_leg = columnar_leg = None
 
-print(f"\nCassandra        : {cass_count} résultats en {cass_time:.2f} ms")
-cluster.shutdown()
+# ============ CASSANDRA ============
+if selected("cassandra"):
+    cass_leg = print_leg("Cassandra", run_leg(get_backend("cassandra"), "latest_for_user", PARAMS))
+    # Partitions (user_id, mois) : taille de partition bornée
+    cass_bucket_leg = print_leg("Cassandra (mois)",
+                                run_leg(get_backend("cassandra"), "latest_for_user", dict(PARAMS, mode="buckets")))
 
 # ============ MONGODB ============
-from pymongo import MongoClient, DESCENDING
-client = MongoClient(f"mongodb://{MONGO_HOST}:27017/")
-collection = client["nosql_tp"]["logs_ecommerce"]
-
-# Test SANS index composé (supprimer s'il existe)
-collection.drop_index("user_id_1_timestamp_-1") if "user_id_1_timestamp_-1" in [idx['name'] for idx in collection.list_indexes()] else None
-
-start = time.time()
-results = list(collection.find({"user_id": 10}).sort("timestamp", -1).limit(100))
-mongo_time_no_idx = (time.time() - start) * 1000
-mongo_count = len(results)
-
-print(f"MongoDB (sans index): {mongo_count} résultats en {mongo_time_no_idx:.2f} ms")
-
-# Test AVEC index composé
-collection.create_index([("user_id", 1), ("timestamp", DESCENDING)], name="idx_user_timestamp")
-
-start = time.time()
-results = list(collection.find({"user_id": 10}).sort("timestamp", -1).limit(100))
-mongo_time_idx = (time.time() - start) * 1000
-
-print(f"MongoDB (avec index): {mongo_count} résultats en {mongo_time_idx:.2f} ms")
-client.close()
+if selected("mongodb"):
+    mongo = get_backend("mongodb")
+
+    # Test SANS index composé (supprimer s'il existe)
+    try:
+        mongo.drop_timeline_index()
+    except Exception as e:
+        print(f"Attention: {e}")
+    mongo_leg_no_idx = print_leg("MongoDB (sans index)", run_leg(mongo, "latest_for_user", PARAMS))
+
+    # Test AVEC index composé
+    try:
+        mongo.create_timeline_index()
+    except Exception as e:
+        print(f"Attention: {e}")
+    mongo_leg_idx = print_leg("MongoDB (avec index)", run_leg(mongo, "latest_for_user", PARAMS))
 
 # ============ ELASTICSEARCH ============
-from elasticsearch import Elasticsearch
-es = Elasticsearch(hosts=[{'host': ES_HOST, 'port': 9200, 'scheme': 'http'}])
+if selected("elasticsearch"):
+    es_leg = print_leg("Elasticsearch", run_leg(get_backend("elasticsearch"), "latest_for_user", PARAMS))
 
-query = {
-    "query": {"term": {"user_id": 10}},
-    "sort": [{"timestamp": {"order": "desc"}}],
-    "size": 100
-}
-
-start = time.time()
-result = es.search(index="ecommerce_logs", body=query)
-es_time = (time.time() - start) * 1000
-es_count = len(result['hits']['hits'])
-
-print(f"Elasticsearch    : {es_count} résultats en {es_time:.2f} ms")
+# ============ COLONNAIRE (EN MÉMOIRE) ============
+if selected("columnar"):
+    columnar_leg = print_leg("Colonnaire", run_leg(get_backend("columnar"), "latest_for_user", PARAMS), " (borne basse)")
 
 # ============ RÉSUMÉ ============
-print("\n" + "="*60)
-print("RÉSUMÉ TÂCHE 2")
-print("="*60)
-print(f"{'SGBD':<25} {'Temps':>10} {'Résultats':>10}")
-print("-"*50)
-print(f"{'Cassandra':<25} {cass_time:>8.2f} ms {cass_count:>10}")
-print(f"{'MongoDB (sans index)':<25} {mongo_time_no_idx:>8.2f} ms {mongo_count:>10}")
-print(f"{'MongoDB (avec index)':<25} {mongo_time_idx:>8.2f} ms {mongo_count:>10}")
-print(f"{'Elasticsearch':<25} {es_time:>8.2f} ms {es_count:>10}")
+print_summary("RÉSUMÉ TÂCHE 2", [
+    ("Cassandra", cass_leg),
+    ("Cassandra (mois)", cass_bucket_leg),
+    ("MongoDB (sans index)", mongo_leg_no_idx),
+    ("MongoDB (avec index)", mongo_leg_idx),
+    ("Elasticsearch", es_leg),
+    ("Colonnaire (mémoire)", columnar_leg)
+])
@@ -4,93 +4,47 @@ Calculer le temps de session moyen pour PURCHASE et ADD_TO_CART
 """
 
 import os
-import time
+import sys
 
-# Configuration
-CASSANDRA_HOST = os.getenv('CASSANDRA_HOST', 'cassandra')
-MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
-ES_HOST = os.getenv('ES_HOST', 'elasticsearch')
+# Rendre le package `scripts` importable quand le fichier est lancé directement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from scripts.backends import get_backend, run_leg
+from scripts.common.report import print_leg, print_aggregations, print_summary, selected
+
+PARAMS = {"event_types": ["PURCHASE", "ADD_TO_CART"]}
 
 print("="*60)
 print("TÂCHE 3 : Agrégation (session_duration_ms moyen)")
 print("="*60)
+print()
 
-# ============ MONGODB ============
-from pymongo import MongoClient
-client = MongoClient(f"mongodb://{MONGO_HOST}:27017/")
-collection = client["nosql_tp"]["logs_ecommerce"]
-
-pipeline = [
-    {"$match": {"event_type": {"$in": ["PURCHASE", "ADD_TO_CART"]}}},
-    {"$group": {
-        "_id": "$event_type",
-        "avg_duration": {"$avg": "$session_duration_ms"},
-        "count": {"$sum": 1}
-    }}
-]
-
-start = time.time()
-results = list(collection.aggregate(pipeline))
-mongo_time = (time.time() - start) * 1000
+mongo_leg = es_leg = cass_leg = columnar_leg = None
 
-print(f"\nMongoDB          : {mongo_time:.2f} ms")
-for r in results:
-    print(f"  - {r['_id']}: avg={r['avg_duration']:.2f} ms ({r['count']} events)")
-client.close()
+# ============ MONGODB ============
+if selected("mongodb"):
+    mongo_leg = print_leg("MongoDB", run_leg(get_backend("mongodb"), "aggregate", PARAMS))
+    print_aggregations(mongo_leg)
 
 # ============ ELASTICSEARCH ============
-from elasticsearch import Elasticsearch
-es = Elasticsearch(hosts=[{'host': ES_HOST, 'port': 9200, 'scheme': 'http'}])
-
-query = {
-    "size": 0,
-    "query": {"terms": {"event_type.keyword": ["PURCHASE", "ADD_TO_CART"]}},
-    "aggs": {
-        "by_event": {
-            "terms": {"field": "event_type.keyword"},
-            "aggs": {"avg_duration": {"avg": {"field": "session_duration_ms"}}}
-        }
-    }
-}
-
-start = time.time()
-try:
-    result = es.search(index="ecommerce_logs", body=query)
-    es_time = (time.time() - start) * 1000
-    print(f"Elasticsearch    : {es_time:.2f} ms")
-    for bucket in result['aggregations']['by_event']['buckets']:
-        print(f"  - {bucket['key']}: avg={bucket['avg_duration']['value']:.2f} ms ({bucket['doc_count']} events)")
-except Exception as e:
-    es_time = -1
-    print(f"Elasticsearch    : ERREUR (champ non indexé en keyword)")
+if selected("elasticsearch"):
+    es_leg = print_leg("Elasticsearch", run_leg(get_backend("elasticsearch"), "aggregate", PARAMS))
+    print_aggregations(es_leg)
 
 # ============ CASSANDRA ============
-from cassandra.cluster import Cluster
-cluster = Cluster([CASSANDRA_HOST], port=9042)
-session = cluster.connect("nosql_tp")
-
-start = time.time()
-rows_p = list(session.execute("SELECT session_duration_ms FROM logs_by_user WHERE event_type='PURCHASE' ALLOW FILTERING"))
-rows_c = list(session.execute("SELECT session_duration_ms FROM logs_by_user WHERE event_type='ADD_TO_CART' ALLOW FILTERING"))
-cass_time = (time.time() - start) * 1000
+if selected("cassandra"):
+    cass_leg = print_leg("Cassandra", run_leg(get_backend("cassandra"), "aggregate", PARAMS), " (scan complet!)")
+    print_aggregations(cass_leg)
 
-avg_p = sum(r.session_duration_ms for r in rows_p) / len(rows_p) if rows_p else 0
-avg_c = sum(r.session_duration_ms for r in rows_c) / len(rows_c) if rows_c else 0
-
-print(f"Cassandra        : {cass_time:.2f} ms (scan complet!)")
-print(f"  - PURCHASE: avg={avg_p:.2f} ms ({len(rows_p)} events)")
-print(f"  - ADD_TO_CART: avg={avg_c:.2f} ms ({len(rows_c)} events)")
-cluster.shutdown()
+# ============ COLONNAIRE (EN MÉMOIRE) ============
+if selected("columnar"):
+    columnar_leg = print_leg("Colonnaire", run_leg(get_backend("columnar"), "aggregate", PARAMS), " (borne basse)")
+    print_aggregations(columnar_leg)
 
 # ============ RÉSUMÉ ============
-print("\n" + "="*60)
-print("RÉSUMÉ TÂCHE 3")
-print("="*60)
-print(f"{'SGBD':<20} {'Temps':>10}")
-print("-"*30)
-print(f"{'MongoDB':<20} {mongo_time:>8.2f} ms")
-if es_time > 0:
-    print(f"{'Elasticsearch':<20} {es_time:>8.2f} ms")
-else:
-    print(f"{'Elasticsearch':<20} {'ERREUR':>10}")
-print(f"{'Cassandra':<20} {cass_time:>8.2f} ms")
+print_summary("RÉSUMÉ TÂCHE 3", [
+    ("MongoDB", mongo_leg),
+    ("Elasticsearch", es_leg),
+    ("Cassandra", cass_leg),
+    ("Colonnaire (mémoire)", columnar_leg)
+], with_count=False)
@@ -0,0 +1,58 @@
+"""
+Tests unitaires sans base de données : modules Python purs et moteur colonnaire
+
+    python -m pytest -q
+"""
+
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+# Rendre le package `scripts` importable quel que soit le répertoire de lancement
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.backends.columnar_backend import ColumnarBackend
+
+EVENTS = ["VIEW_PRODUCT", "ADD_TO_CART", "PURCHASE", "ERROR_404", "LOGOUT", "SEARCH"]
+
+
+def make_logs(count, seed=1, users=50):
+    """Logs e-commerce reproductibles (même distribution que scripts/data/generate_data.py)"""
+    rng = random.Random(seed)
+    start = datetime(2025, 10, 1)
+    logs = []
+    for _ in range(count):
+        event_type = rng.choice(EVENTS)
+        product_id = f"PROD_{rng.randint(1, 100):03d}" if "PRODUCT" in event_type or "CART" in event_type else None
+        log = {
+            "log_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "timestamp": (start + timedelta(seconds=rng.randint(1, 3600 * 24 * 30))).isoformat(),
+            "user_id": rng.randint(1, users),
+            "event_type": event_type,
+            "product_id": product_id,
+            "session_duration_ms": rng.randint(100, 60000),
+            "description": f"Event {event_type} processed.",
+        }
+        if event_type == "ERROR_404":
+            log["description"] = "Page introuvable. Erreur critique."
+        elif event_type == "PURCHASE":
+            log["description"] = f"Transaction finale réussie pour produit {product_id}."
+        logs.append(log)
+    return logs
+
+
+@pytest.fixture
+def logs():
+    return make_logs(2000)
+
+
+@pytest.fixture
+def columnar(logs):
+    """Moteur colonnaire propre au test (sans fichier de données ni journal partagé)"""
+    backend = ColumnarBackend(data_file=None, shared_dir="")
+    backend.bulk_write(logs)
+    return backend
@@ -0,0 +1,89 @@
+"""Prédicats poussés par CassandraBackend._group_scan (session simulée, sans cluster)"""
+
+import re
+from collections import Counter
+
+import numpy as np
+import pytest
+from cassandra import InvalidRequest
+
+from scripts.backends.base import run_leg
+from scripts.backends.cassandra_backend import CassandraBackend, token_ranges, SCAN_SPLITS
+from scripts.common.groupby import group_spec
+
+PREDICATE_RE = re.compile(r"(\w+) (=|>=|<=) \?")
+
+
+class FakeResultSet(list):
+    def __init__(self, page, column_names):
+        super().__init__([page] if page else [])
+        self.column_names = column_names
+
+
+class FakeFuture:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        if isinstance(self._result, Exception):
+            raise self._result
+        return self._result
+
+
+class FakeSession:
+    """Évalue les égalités poussées comme Cassandra ; toutes les lignes vivent dans la première plage"""
+
+    def __init__(self, logs):
+        self.logs = logs
+        self.statements = []
+
+    def execute_async(self, cql, params, trace=False, execution_profile=None):
+        self.statements.append(cql)
+        columns = cql[len("SELECT "):cql.index(" FROM")].split(", ")
+        # token(user_id) > ? AND token(user_id) <= ? : les deux premiers paramètres, puis les prédicats
+        predicates = PREDICATE_RE.findall(cql.split(" WHERE ", 1)[1])
+        if tuple(params[:2]) != token_ranges(SCAN_SPLITS)[0]:
+            return FakeFuture(FakeResultSet(None, columns))
+        rows = self.logs
+        for (name, operator), value in zip(predicates, params[2:]):
+            if operator == "=":
+                if value is None:
+                    return FakeFuture(InvalidRequest("Invalid null value for column " + name))
+                rows = [log for log in rows if log[name] == value]
+        page = {name: np.array([log[name] for log in rows], dtype=object if name == "product_id" else None)
+                for name in columns}
+        return FakeFuture(FakeResultSet(page if rows else None, columns))
+
+
+class FakeCassandra(CassandraBackend):
+    def __init__(self, logs):
+        super().__init__(keyspace="test")
+        self._session = FakeSession(logs)
+
+    @property
+    def session(self):
+        return self._session
+
+    def _prepare(self, cql):
+        return cql
+
+    def acquire(self):
+        pass
+
+
+def groups(leg):
+    assert leg["status"] == "success", leg.get("error")
+    return {group["key"]["event_type"]: group["count"] for group in leg["groups"]}
+
+
+@pytest.mark.parametrize("products", [[None], [None, "PROD_001"], ["PROD_001"]])
+def test_null_product_filter_matches_columnar(logs, columnar, products):
+    cassandra = FakeCassandra(logs)
+    spec = dict(group_spec(["event_type"], ["count"], {"product_id": products}), field="session_duration_ms")
+    expected = Counter(log["event_type"] for log in logs if log["product_id"] in products)
+
+    assert groups(run_leg(cassandra, "group_by", spec)) == dict(expected)
+    assert groups(run_leg(columnar, "group_by", spec)) == dict(expected)
+    if None in products:
+        # Un null n'est jamais lié dans une égalité CQL
+        assert all("product_id = ?" not in cql for cql in cassandra.session.statements)
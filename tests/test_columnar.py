@@ -0,0 +1,89 @@
+"""Moteur colonnaire : résultats comparés à un calcul Python direct, journal partagé entre workers"""
+
+from collections import Counter
+
+import pytest
+
+from conftest import make_logs
+from scripts.backends import columnar_backend
+from scripts.backends.base import LegContext
+from scripts.backends.columnar_backend import ColumnarBackend
+
+
+@pytest.mark.parametrize("search_text", ["critique", "critiq", "Erreur critique", "ssed.", "réussie pour"])
+def test_fulltext_matches_substrings(columnar, logs, search_text):
+    expected = [log for log in logs if search_text.lower() in log["description"].lower()]
+    leg = columnar.fulltext(LegContext(), search_text=search_text, sample_size=None)
+    assert leg["count"] == len(expected) > 0
+    assert {row["log_id"] for row in leg["sample_data"]} == {log["log_id"] for log in expected}
+
+
+def test_fulltext_with_event_type_and_where(columnar, logs):
+    where = {"session_duration_ms": {"gte": 30000}}
+    leg = columnar.fulltext(LegContext(), event_type="PURCHASE", search_text="produit", where=where, sample_size=3)
+    expected = [log for log in logs if log["event_type"] == "PURCHASE" and log["session_duration_ms"] >= 30000]
+    assert leg["count"] == len(expected) and len(leg["sample_data"]) == 3
+
+
+def test_latest_for_user(columnar, logs):
+    expected = sorted((log for log in logs if log["user_id"] == 7), key=lambda log: log["timestamp"], reverse=True)
+    leg = columnar.latest_for_user(LegContext(), 7, limit=10, sample_size=None)
+    assert [row["log_id"] for row in leg["sample_data"]] == [log["log_id"] for log in expected[:10]]
+
+
+def test_aggregate(columnar, logs):
+    leg = columnar.aggregate(LegContext(), ["PURCHASE", "UNKNOWN"])
+    durations = [log["session_duration_ms"] for log in logs if log["event_type"] == "PURCHASE"]
+    assert leg["aggregations"] == {"PURCHASE": {
+        "count": len(durations), "sum_duration": sum(durations),
+        "avg_duration": round(sum(durations) / len(durations), 2),
+        "min_duration": min(durations), "max_duration": max(durations)
+    }}
+
+
+def test_group_by_counts(columnar, logs):
+    leg = columnar.group_by(LegContext(), ["event_type", "product_id"], ["count"])
+    expected = Counter((log["event_type"], log["product_id"]) for log in logs)
+    assert {(row["key"]["event_type"], row["key"]["product_id"]): row["count"] for row in leg["groups"]} == expected
+
+
+def test_group_by_null_filter(columnar, logs):
+    leg = columnar.group_by(LegContext(), ["event_type"], ["count"], filters={"product_id": [None]})
+    expected = Counter(log["event_type"] for log in logs if log["product_id"] is None)
+    assert {row["key"]["event_type"]: row["count"] for row in leg["groups"]} == expected
+
+
+def test_upsert_skips_known_ids(columnar, logs):
+    assert columnar.upsert_logs(logs[:10] + make_logs(5, seed=2)) == 5
+    assert columnar.count() == len(logs) + 5
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    # Synchronisation immédiate : chaque lecture relit le journal partagé
+    monkeypatch.setattr(columnar_backend, "COLUMNAR_SYNC_TTL_S", 0)
+    directory = str(tmp_path / "journal")
+    return ColumnarBackend(data_file=None, shared_dir=directory), ColumnarBackend(data_file=None, shared_dir=directory)
+
+
+def test_workers_share_writes(shared):
+    a, b = shared
+    a.bulk_write(make_logs(100))
+    assert b.count() == 100
+    assert b.upsert_logs(make_logs(100) + make_logs(20, seed=3)) == 20
+    assert a.count() == 120
+    a.clear()
+    assert b.count() == 0
+
+
+def test_publish_and_rollback_follow_pointer(shared):
+    a, b = shared
+    a.bulk_write(make_logs(10))
+    staging = a.staging("v1")
+    staging.bulk_write(make_logs(30, seed=4))
+    a.prepare_publish(staging)
+    retired = a.publish(staging, "v1")
+    assert b.count() == 30 and b.live_version() == "v1"
+    a.rollback(staging, retired, None)
+    a.discard(staging)
+    assert a.count() == 10 and b.count() == 10 and b.live_version() is None
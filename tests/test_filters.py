@@ -0,0 +1,85 @@
+"""Arbre de filtre : construction, évaluation résiduelle sur colonnes, plan"""
+
+import numpy as np
+import pytest
+
+from scripts.common.filters import And, Eq, In, Or, Plan, Range, Text, conjuncts, parse, push_all, task1_filter
+
+
+def columns(logs, fields):
+    """Colonnes au format des pages reçues (objets pour les champs pouvant être nuls)"""
+    return {field: np.array([log[field] for log in logs],
+                            dtype=object if field in ("product_id", "description", "timestamp") else None)
+            for field in fields}
+
+
+def evaluate(node, logs):
+    mask = node.compile_columns()(columns(logs, node.fields()))
+    return [log for log, keep in zip(logs, mask) if keep]
+
+
+def test_parse_builds_tree():
+    node = parse({"event_type": "ERROR_404", "user_id": [1, 2],
+                  "timestamp": {"gte": "2025-10-01", "lte": "2025-10-31"},
+                  "description": {"contains": "critique"}})
+    terms = conjuncts(node)
+    assert [type(term) for term in terms] == [Eq, In, Range, Text]
+    assert terms[1].values == [1, 2]
+    # Une date seule en borne haute couvre toute la journée
+    assert terms[2].high.isoformat() == "2025-10-31T23:59:59"
+
+
+@pytest.mark.parametrize("expression", [
+    {"unknown": 1},
+    {"event_type": {"gte": "A"}},
+    {"user_id": {"like": 3}},
+    {"or": []},
+    {"user_id": "abc"},
+])
+def test_parse_rejects_invalid(expression):
+    with pytest.raises(ValueError):
+        parse(expression)
+
+
+def test_conjuncts_flatten_nested_and():
+    a, b, c = Eq("user_id", 1), Eq("user_id", 2), Eq("user_id", 3)
+    assert conjuncts(And(a, And(b, c))) == [a, b, c]
+    assert conjuncts(Or(a, b))[0].__class__ is Or
+    assert conjuncts(None) == []
+
+
+def test_residual_matches_python_reference(logs):
+    node = task1_filter("ERROR_404", "CRITIQUE", "2025-10-05", "2025-10-20",
+                        where={"or": [{"user_id": [1, 2, 3]}, {"session_duration_ms": {"gte": 30000}}]})
+    expected = [log for log in logs
+                if log["event_type"] == "ERROR_404" and "critique" in log["description"].lower()
+                and "2025-10-05" <= log["timestamp"] <= "2025-10-20T23:59:59"
+                and (log["user_id"] in (1, 2, 3) or log["session_duration_ms"] >= 30000)]
+    assert expected
+    assert evaluate(node, logs) == expected
+
+
+def test_text_is_a_substring_match(logs):
+    assert len(evaluate(Text("description", "critiq"), logs)) == len(evaluate(Text("description", "critique"), logs))
+
+
+def test_null_values(logs):
+    # Une valeur nulle ne correspond qu'à un In / Eq qui la demande, jamais à une plage
+    nulls = [log for log in logs if log["product_id"] is None]
+    assert evaluate(In("product_id", [None]), logs) == nulls
+    assert evaluate(Eq("product_id", "PROD_001"), logs) == [log for log in logs if log["product_id"] == "PROD_001"]
+    sparse = [dict(log, session_duration_ms=None) if index % 2 else log for index, log in enumerate(logs[:20])]
+    kept = Range("session_duration_ms", 0).compile_columns()(
+        {"session_duration_ms": np.array([log["session_duration_ms"] for log in sparse], dtype=object)})
+    assert kept.tolist() == [index % 2 == 0 for index in range(20)]
+
+
+def test_plan_residual():
+    node = task1_filter("PURCHASE", "produit", where={"or": [{"user_id": 1}, {"user_id": 2}]})
+    plan = Plan()
+    for term in conjuncts(node):
+        (plan.push(term, "query") if isinstance(term, Eq) else plan.keep(term))
+    assert plan.pushed_with("query") == conjuncts(node)[:1]
+    assert plan.residual_fields() == {"description", "user_id"}
+    assert plan.describe()["residual"] == [term.describe() for term in conjuncts(node)[1:]]
+    assert push_all(node).residual_filter() is None
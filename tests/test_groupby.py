@@ -0,0 +1,69 @@
+"""Agrégats partiels par groupe : calcul vectorisé, fusion, résultat final"""
+
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from scripts.common.groupby import finalize_groups, group_spec, merge_partials, partials_from_arrays
+
+
+def reference(logs, dimensions):
+    partials = defaultdict(lambda: {"count": 0, "sum": 0, "min": None, "max": None})
+    for log in logs:
+        partial = partials[tuple(log[name] for name in dimensions)]
+        value = log["session_duration_ms"]
+        partial["count"] += 1
+        if value is not None:
+            partial["sum"] += value
+            partial["min"] = value if partial["min"] is None else min(partial["min"], value)
+            partial["max"] = value if partial["max"] is None else max(partial["max"], value)
+    return dict(partials)
+
+
+def partials_of(logs, dimensions):
+    keys = [(np.array([log[name] for log in logs], dtype=object if name == "product_id" else None), None)
+            for name in dimensions]
+    values = np.array([log["session_duration_ms"] for log in logs],
+                      dtype=object if any(log["session_duration_ms"] is None for log in logs) else None)
+    return partials_from_arrays(keys, values)
+
+
+def test_partials_match_reference(logs):
+    dimensions = ["event_type", "product_id"]
+    assert partials_of(logs, dimensions) == reference(logs, dimensions)
+
+
+def test_null_values_are_counted_not_summed(logs):
+    logs = [dict(log, session_duration_ms=None) if log["user_id"] == 1 else log for log in logs]
+    assert partials_of(logs, ["user_id"]) == reference(logs, ["user_id"])
+    assert partials_of(logs, ["user_id"])[(1,)]["min"] is None
+
+
+def test_merge_of_batches_equals_whole(logs):
+    dimensions = ["event_type", "user_id"]
+    merged = {}
+    for offset in range(0, len(logs), 333):
+        merge_partials(merged, partials_of(logs[offset:offset + 333], dimensions))
+    assert merged == partials_of(logs, dimensions)
+
+
+def test_finalize_sorts_nulls_first_and_truncates():
+    partials = {("B",): {"count": 2, "sum": 10, "min": 4, "max": 6},
+                (None,): {"count": 1, "sum": 3, "min": 3, "max": 3},
+                ("A",): {"count": 0, "sum": 0, "min": None, "max": None}}
+    groups, truncated = finalize_groups(partials, ["product_id"], ["count", "avg"], 2)
+    assert [group["key"]["product_id"] for group in groups] == [None, "A"]
+    assert groups[1]["avg"] is None
+    assert truncated
+
+
+def test_group_spec_validation():
+    spec = group_spec("event_type", filters={"user_id": "3", "product_id": None})
+    assert spec["dimensions"] == ["event_type"] and spec["filters"] == {"user_id": [3], "product_id": [None]}
+    for invalid in ({"dimensions": []}, {"dimensions": ["event_type", "event_type"]},
+                    {"dimensions": ["event_type"], "metrics": ["median"]},
+                    {"dimensions": ["event_type"], "filters": {"description": "x"}},
+                    {"dimensions": ["event_type"], "limit": 0}):
+        with pytest.raises(ValueError):
+            group_spec(**invalid)
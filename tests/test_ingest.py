@@ -0,0 +1,62 @@
+"""Ingestion par micro-lots : validation, regroupement, accusés de réception, saturation"""
+
+import threading
+
+import pytest
+
+from scripts.common import ingest
+from scripts.common.ingest import IngestPipeline, MicroBatchWriter, QueueFull, normalize_event
+
+
+def test_normalize_event_fills_defaults():
+    event = normalize_event({"user_id": "7", "event_type": "SEARCH"})
+    assert event["user_id"] == 7 and event["session_duration_ms"] == 0 and event["description"] == ""
+    assert len(event["log_id"]) == 36 and event["timestamp"]
+
+
+@pytest.mark.parametrize("event", [
+    "not an object", {"event_type": "SEARCH"}, {"user_id": "x", "event_type": "SEARCH"},
+    {"user_id": 1, "event_type": "SEARCH", "timestamp": "yesterday"},
+    {"user_id": 1, "event_type": "SEARCH", "log_id": "not-a-uuid"},
+])
+def test_normalize_event_rejects_invalid(event):
+    with pytest.raises(ValueError):
+        normalize_event(event)
+
+
+def test_events_written_in_batches(logs):
+    batches = []
+    writer = MicroBatchWriter("test", batches.append, batch_size=100, max_delay_ms=20)
+    writer.start()
+    ticket = writer.enqueue(logs[:250])
+    assert writer.wait(ticket, timeout=5) == "written"
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert writer.stats()["written"] == 250 and writer.stats()["queue_depth"] == 0
+
+
+def test_failed_batch_is_reported(logs, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_RETRIES", 2)
+
+    def write(batch):
+        raise RuntimeError("base indisponible")
+
+    writer = MicroBatchWriter("test", write, batch_size=10, max_delay_ms=1)
+    writer.start()
+    assert writer.wait(writer.enqueue(logs[:10]), timeout=5) == "failed"
+    assert writer.stats()["failed"] == 10
+    assert writer.stats()["last_error"]["error"] == "base indisponible"
+
+
+def test_submit_is_all_or_nothing(logs):
+    blocked = threading.Event()
+    pipeline = IngestPipeline({"fast": lambda batch: None, "slow": lambda batch: blocked.wait(5)})
+    pipeline.writers["slow"].max_queue = 5
+    with pytest.raises(QueueFull):
+        pipeline.submit(logs[:10])
+    stats = pipeline.stats()
+    # Refusé pour toutes les bases : rien n'est mis en file pour la base qui avait de la place
+    assert stats["fast"]["enqueued"] == 0 and stats["slow"]["rejected"] == 10
+    blocked.set()
+    tickets = pipeline.submit(logs[:5])
+    assert pipeline.wait(tickets, timeout=5) == {"fast": "written", "slow": "written"}
+    assert pipeline.drain(timeout=5) == {"fast": True, "slow": True}
@@ -0,0 +1,82 @@
+"""Routeur adaptatif : classement, bascule, écartement, isolement par base"""
+
+import threading
+import time
+
+import pytest
+
+from scripts.common.routing import Router
+
+
+def success(delay=0.0):
+    def leg():
+        time.sleep(delay)
+        return {"status": "success"}
+    return leg
+
+
+def failure():
+    return {"status": "error", "error": "panne"}
+
+
+def router(**options):
+    options = dict({"backends": ("a", "b", "c"), "min_samples": 3, "explore_rate": 0.0, "timeout_s": 1.0}, **options)
+    return Router(**options)
+
+
+def test_default_order_until_measured():
+    r = router()
+    assert r.rank("shape", ["a", "b", "c"]) == (["a", "b", "c"], "default")
+
+
+def test_fastest_backend_wins_once_measured():
+    r = router()
+    for _ in range(3):
+        r.execute("shape", [("a", success(0.02)), ("b", success()), ("c", success(0.02))])
+        for name, leg in (("b", success()), ("c", success(0.02))):
+            r.execute("shape", [(name, leg)])
+    order, reason = r.rank("shape", ["a", "b", "c"])
+    assert order[0] == "b" and reason == "fastest"
+
+
+def test_failover_and_cooldown():
+    r = router(cooldown_s=60)
+    result, decision = r.execute("shape", [("a", failure), ("b", success())])
+    assert result["status"] == "success"
+    assert decision["backend"] == "b" and decision["failovers"] == 1
+    # a est écartée : b passe devant, a reste en dernier recours
+    assert r.rank("shape", ["a", "b"])[0] == ["b", "a"]
+    assert r.snapshot()["latencies"]["shape"]["a"]["errors"] == 1
+
+
+def test_timeout_fails_over():
+    r = router(timeout_s=0.05)
+    result, decision = r.execute("shape", [("a", success(0.5)), ("b", success())])
+    assert decision["attempts"][0]["status"] == "timeout"
+    assert result and decision["backend"] == "b"
+
+
+def test_slow_backend_does_not_starve_the_others():
+    r = router(timeout_s=0.1, max_in_flight=2)
+    decisions = []
+
+    def request():
+        decisions.append(r.execute("shape", [("a", success(1.0)), ("b", success())])[1])
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    statuses = [decision["attempts"][0]["status"] for decision in decisions]
+    # Deux branches abandonnées occupent les places de a : les suivantes sont refusées tout de suite
+    assert statuses.count("saturated") >= 2 and "timeout" in statuses
+    assert all(decision["backend"] == "b" for decision in decisions)
+    assert r.snapshot()["latencies"]["shape"]["b"]["errors"] == 0
+
+
+def test_unknown_backends_rejected():
+    with pytest.raises(ValueError):
+        router().execute("shape", [("z", success())])
+    with pytest.raises(ValueError):
+        Router(score="p42")
@@ -0,0 +1,77 @@
+"""Sketches mergeables : t-digest et HyperLogLog, seuls puis fusionnés par lots"""
+
+import numpy as np
+
+from conftest import make_logs
+from scripts.common.sketches import (
+    PERCENTILES, EventSketch, HyperLogLog, TDigest, event_sketches, exact_summary, merge_sketches, percentile_key
+)
+
+
+def within_bounds(estimate, exact):
+    low, high = estimate["bounds"]
+    return low <= exact <= high
+
+
+def test_tdigest_bounds_contain_exact_quantiles():
+    values = np.random.default_rng(1).lognormal(8, 1, 50000)
+    digest = TDigest().add_many(values)
+    assert digest.count == len(values)
+    for q in PERCENTILES:
+        assert within_bounds(digest.estimate(q), np.quantile(values, q))
+
+
+def test_tdigest_merge_matches_single_digest():
+    values = np.random.default_rng(2).integers(100, 60000, 40000)
+    merged = TDigest()
+    for part in np.array_split(values, 8):
+        merged.merge(TDigest().add_many(part))
+    assert merged.count == len(values)
+    assert (merged.min, merged.max) == (values.min(), values.max())
+    for q in PERCENTILES:
+        assert within_bounds(merged.estimate(q), np.quantile(values, q))
+
+
+def test_tdigest_empty():
+    assert TDigest().quantile(0.5) is None
+    assert TDigest().estimate(0.5)["bounds"] is None
+
+
+def test_hyperloglog_within_error():
+    for distinct in (50, 5000, 200000):
+        values = np.arange(distinct).repeat(3)
+        sketch = HyperLogLog().add_many(values)
+        assert within_bounds(sketch.estimate(), distinct)
+
+
+def test_hyperloglog_merge_is_union():
+    left, right = HyperLogLog().add_many(np.arange(0, 30000)), HyperLogLog().add_many(np.arange(20000, 50000))
+    assert within_bounds(left.merge(right).estimate(), 50000)
+
+
+def test_event_sketches_merged_by_batch():
+    # Assez de lignes par type pour que l'erreur de rang dépasse l'écart entre deux rangs voisins
+    logs = make_logs(60000)
+    wanted = {"PURCHASE", "ERROR_404"}
+    sketches = {}
+    for offset in range(0, len(logs), 5000):
+        batch = logs[offset:offset + 5000]
+        merge_sketches(sketches, event_sketches({
+            name: np.array([log[name] for log in batch]) for name in ("event_type", "user_id", "session_duration_ms")
+        }, wanted))
+    assert set(sketches) == wanted
+    for event_type, sketch in sketches.items():
+        rows = [log for log in logs if log["event_type"] == event_type]
+        exact = exact_summary([log["session_duration_ms"] for log in rows], [log["user_id"] for log in rows])
+        summary = sketch.summary()
+        assert summary["count"] == exact["count"]
+        assert within_bounds(summary["distinct_users"], exact["distinct_users"]["value"])
+        for q in PERCENTILES:
+            key = percentile_key(q)
+            assert within_bounds(summary["percentiles"][key], exact["percentiles"][key]["value"])
+
+
+def test_event_sketch_merge_counts():
+    left = EventSketch().add_many([1, 2, 3], [1, 1, 2])
+    right = EventSketch().add_many([4], [3])
+    assert left.merge(right).summary()["count"] == 4